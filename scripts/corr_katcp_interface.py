@@ -253,7 +253,7 @@ class DeviceExampleServer(katcp.DeviceServer):
         else:
             # issue correlator spead metadata
             try:
-                self.c.spead_issue_all()
+                self.c.spead_issue_all(full = True)
                 return ("ok",
                 "metadata sent to %s:%i"%(self.c.config['rx_meta_ip_str'],self.c.config['rx_udp_port'])
                 )
@@ -41,6 +41,67 @@ if __name__ == '__main__':
         help='Do not autoscale the data by dividing down by the number of accumulations.  Default: Scale back by n_accs.'
             ,
         )
+    p.add_option(
+        '-c',
+        '--compress',
+        dest='compression',
+        type='string',
+        default=None,
+        help='Losslessly compress the HDF5 datasets using this filter (gzip or lzf). Default: no compression.',
+        )
+    p.add_option(
+        '-b',
+        '--busy_poll',
+        dest='busy_poll_us',
+        type='int',
+        default=None,
+        help='Have the kernel busy-poll sockets for this many microseconds (system-wide, needs root). Default: leave as is.',
+        )
+    p.add_option(
+        '-C',
+        '--cpus',
+        dest='cpus',
+        type='string',
+        default=None,
+        help='Comma-separated list of CPUs to receive on. With --processes, each receiving process gets one in turn. Default: any.',
+        )
+    p.add_option(
+        '--sd_chan_avg',
+        dest='sd_chan_avg',
+        type='int',
+        default=1,
+        help='Average this many channels together for the signal display. Default: 1.',
+        )
+    p.add_option(
+        '--sd_baselines',
+        dest='sd_baselines',
+        type='string',
+        default=None,
+        help='Comma-separated list of baseline indices (into bls_ordering) to send to the signal display. Default: all.',
+        )
+    p.add_option(
+        '--sd_rate',
+        dest='sd_max_rate',
+        type='float',
+        default=None,
+        help='Maximum signal display frames per second. Default: one per dump.',
+        )
+    p.add_option(
+        '-s',
+        '--slots',
+        dest='ring_slots',
+        type='int',
+        default=8,
+        help='Number of dumps to buffer between reception and the disk writer. Default: 8.',
+        )
+    p.add_option(
+        '-p',
+        '--processes',
+        dest='processes',
+        action='store_true',
+        default=False,
+        help='For interleaved output, receive each X engine board on its own port (rx_udp_port + board number) in its own process. The correlator must be sending to per-board ports (Correlator.config_udp_output(per_board_ports=True)).',
+        )
     p.add_option(
         '-v',
         '--verbose',
@@ -57,6 +118,14 @@ if __name__ == '__main__':
         config_file = args[0]
     acc_scale = opts.acc_scale
     verbose = opts.verbose
+    compression = opts.compression
+    ring_slots = opts.ring_slots
+    processes = opts.processes
+    busy_poll_us = opts.busy_poll_us
+    sd_chan_avg = opts.sd_chan_avg
+    sd_baselines = [int(bl) for bl in opts.sd_baselines.split(',')] if opts.sd_baselines != None else None
+    sd_max_rate = opts.sd_max_rate
+    cpus = [int(cpu) for cpu in opts.cpus.split(',')] if opts.cpus != None else None
 
 print 'Parsing config file...',
 sys.stdout.flush()
@@ -70,13 +139,20 @@ data_port = config['rx_udp_port']
 sd_ip = config['sig_disp_ip_str']
 sd_port = config['sig_disp_port']
 mode = config['xeng_format']
+if processes and mode == 'inter':
+    mode = 'inter_mp'
 
 filename = str(time.time()) + '.corr.h5'
 
+# size the receive buffers for this correlator's dumps
+rx_pkt_count, rx_buffer_size = corr.rx.rx_buffer_sizing(config['n_chans'], config['n_bls'], config['int_time'], config['rx_pkt_payload_len'],
+                                                        n_ports=(config['n_xfpgas'] if mode == 'inter_mp' else 1))
+
 print 'Initalising SPEAD transports for %s data...' % mode
 print 'Data reception on port', data_port
 print 'Sending Signal Display data to %s:%i.' % (sd_ip, sd_port)
 print 'Storing to file %s' % filename
+print 'Buffering %i packets per port, with a %i byte socket receive buffer.' % (rx_pkt_count, rx_buffer_size)
 
 crx = corr.rx.CorrRx(
     mode=mode,
@@ -85,6 +161,19 @@ crx = corr.rx.CorrRx(
     sd_port=sd_port,
     acc_scale=acc_scale,
     filename=filename,
+    h5_compression=compression,
+    ring_slots=ring_slots,
+    rx_pkt_count=rx_pkt_count,
+    rx_buffer_size=rx_buffer_size,
+    cpu_affinity=cpus,
+    busy_poll_us=busy_poll_us,
+    sd_chan_avg=sd_chan_avg,
+    sd_baselines=sd_baselines,
+    sd_max_rate=sd_max_rate,
+    n_ports=config['n_xfpgas'],
+    n_chans=config['n_chans'],
+    n_bls=config['n_bls'],
+    n_xengs=config['n_xeng'],
     log_level=(logging.DEBUG if verbose else logging.INFO),
     )
 try:
@@ -92,7 +181,7 @@ try:
     crx.start()
     while crx.isAlive():
         time.sleep(0.1)
-    print 'RX process ended.'
+    print 'RX process ended.', crx.stats()
     crx.join()
 except KeyboardInterrupt:
     print 'Stopping...'
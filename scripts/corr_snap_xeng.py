@@ -66,6 +66,7 @@ try:
     n_ants = c.config['n_ants']
     xeng_acc_len = c.config['xeng_acc_len']
     n_bls = c.config['n_bls']
+    bl_order = c.get_bl_order()
 
     report = dict()
     ch_offset = opts.ch_offset
@@ -115,7 +116,7 @@ try:
                 freq = (index / n_bls) * x_per_fpga * len(c.xfpgas) + xeng
             else:
                 freq = (index / n_bls) + x_per_fpga * xeng * c.config['n_chans']/c.config['n_xeng']
-            i, j = c.get_bl_order()[bls_index]
+            i, j = bl_order[bls_index]
             real_val = bram_data[xeng][li * 2]
             imag_val = bram_data[xeng][li * 2 + 1]
             if (real_val != 0) or (imag_val != 0) or opts.verbose:
@@ -82,6 +82,7 @@ try:
     n_ants = c.config['n_ants']
     xeng_acc_len = c.config['xeng_acc_len']
     n_bls = c.config['n_bls']
+    bl_order = c.get_bl_order()
 
     report = dict()
 
@@ -143,7 +144,7 @@ try:
             else:
                 freq = (index / n_bls) + x_per_fpga * xeng * c.config['n_chans']/c.config['n_xeng']
             #print '(%i,%i,%i,%i)' % (li, index, bls_index, freq),
-            i, j = c.get_bl_order()[bls_index]
+            i, j = bl_order[bls_index]
             # data is a 128-bit number that was demuxed into 8 16.6 numbers
             real_val = bram_data[xeng][li * 2]
             imag_val = bram_data[xeng][li * 2 + 1]
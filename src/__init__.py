@@ -27,3 +27,4 @@ __version__ = "0.8.0"
 # import sim
 # import snap
 # import threaded
+# import delay_tracker
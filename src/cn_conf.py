@@ -5,6 +5,9 @@ Author: Jason Manley
 """
 """
 Revs:
+2026-10-18: Cache the runtime variables in VAR_RUN in memory. The files are only re-read
+                after write_var/write_var_list or when their mtime changes, and the mtime is
+                checked at most once every var_check_interval seconds.
 2017-12-13: Modified imports for PEP 8 compliance, and changed old-style classes
                 to new-style classes.
 2011-07-28: PVP Added mode support so we can load different params for wideband, narrowband,
@@ -28,6 +31,7 @@ import exceptions
 import socket
 import struct
 import os
+import time
 import logging
 
 import numpy
@@ -53,6 +57,8 @@ class CorrConf(object):
         self.logger.setLevel(log_level)
 
         self.config_file = config_file
+        self.var_check_interval = 1.0
+        self._var_cache = {}
         self.config_file_name = os.path.split(self.config_file)[1]
         self.logger.info('Trying to open log file %s.'%self.config_file)
         self.cp = iniparse.INIConfig(open(self.config_file, 'rb'))
@@ -76,18 +82,32 @@ class CorrConf(object):
 
     def __getitem__(self, item):
         if item == 'sync_time':
-            fp = open(VAR_RUN + '/' + item + '.' + self.config_file_name, 'r')
-            val = float(fp.readline())
-            fp.close()
-            return val
+            return self._read_var(item, lambda line: float(line))
         elif item == 'antenna_mapping':
-            fp = open(VAR_RUN + '/' + item + '.' + self.config_file_name, 'r')
-            val = (fp.readline()).split(LISTDELIMIT)
-            fp.close()
-            return val
+            return list(self._read_var(item, lambda line: line.split(LISTDELIMIT)))
         else:
             return self.config[item]
 
+    def _read_var(self, item, parse):
+        """Returns the parsed first line of a runtime variable file, from memory if the file has not changed since it was last read."""
+        now = time.time()
+        cached = self._var_cache.get(item, None)
+        if cached != None and (now - cached['checked']) < self.var_check_interval:
+            return cached['value']
+        filename = VAR_RUN + '/' + item + '.' + self.config_file_name
+        try:
+            mtime = os.path.getmtime(filename)
+        except OSError:
+            mtime = None
+        if cached != None and mtime != None and cached['mtime'] == mtime:
+            cached['checked'] = now
+            return cached['value']
+        fp = open(filename, 'r')
+        val = parse(fp.readline())
+        fp.close()
+        self._var_cache[item] = {'value': val, 'mtime': mtime, 'checked': now}
+        return val
+
     def __setitem__(self,item,value):
         self.config[item]=value
 
@@ -407,16 +427,28 @@ class CorrConf(object):
         fpw.close()
 
     def write_var(self, filename, value):
+        self._var_cache.pop(filename, None)
         fp=open(VAR_RUN + '/' + filename + '.' + self.config_file_name, 'w')
         fp.write(value)
         fp.close()
 
     def write_var_list(self, filename, list_to_store):
+        self._var_cache.pop(filename, None)
         fp=open(VAR_RUN + '/' + filename + '.' + self.config_file_name, 'w')
         for v in list_to_store:
             fp.write(v + LISTDELIMIT)
         fp.close()
 
+    def read_var_list(self, filename):
+        """Reads back a list stored with write_var_list. Returns an empty list if it has not been written yet."""
+        try:
+            fp=open(VAR_RUN + '/' + filename + '.' + self.config_file_name, 'r')
+        except IOError:
+            return []
+        val = [v for v in fp.readline().split(LISTDELIMIT) if v != '']
+        fp.close()
+        return val
+
     def get_line(self,section,variable):
         return self.cp[section][variable]
 
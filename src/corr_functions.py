@@ -67,6 +67,7 @@ __all__ = [
             "ip2str",
             "write_masked_register",
             "read_masked_register",
+            "decode_masked_register",
             "pulse_masked_register",
             "log_runtimeerror",
             "non_blocking_request",
@@ -151,14 +152,19 @@ def read_masked_register(device_list, bitstruct, names=None, return_dict=True):
         raise RuntimeError('Length of list of register names does not match length of list of devices given.')
     rv = []
     for d, device in enumerate(device_list):
-        vuint = device.read_uint(registerNames[d])
-        rtmp = bitstruct.parse(struct.pack('>I', vuint))
-        rtmp.raw = vuint
-        rtmp.register_name = registerNames[d]
-        if return_dict: rtmp = rtmp.__dict__
-        rv.append(rtmp)
+        rv.append(decode_masked_register(device.read_uint(registerNames[d]), bitstruct, registerNames[d], return_dict))
     return rv
 
+def decode_masked_register(vuint, bitstruct, name=None, return_dict=True):
+    """
+    Apply the given construct.BitStruct to a 32-bit value that has already been read, as read_masked_register does.
+    """
+    rtmp = bitstruct.parse(struct.pack('>I', vuint))
+    rtmp.raw = vuint
+    rtmp.register_name = name if name != None else bitstruct.name
+    if return_dict: rtmp = rtmp.__dict__
+    return rtmp
+
 def pulse_masked_register(device_list, bitstruct, fields):
     """
     Pulse a boolean var somewhere in a masked register.
@@ -11,7 +11,8 @@ import struct
 import construct
 from construct import BitStruct, Padding, Flag, Bitwise, BitsInteger
 
-# from . import snap, corr_functions
+from . import corr_functions
+# snap imports this module, so functions that need it import it when they run
 
 def bin2fp(bits, m = 8, e = 7):
     if m > 32:
@@ -22,6 +23,18 @@ def bin2fp(bits, m = 8, e = 7):
     e = e + shift
     return float(numpy.int32(bits)) / (2**e)
 
+def bin2fp_array(bits, m = 8, e = 7):
+    """As bin2fp, but for a whole numpy array (or list) of unsigned integers at once. Returns a numpy float array."""
+    if m > 32:
+        raise RuntimeError('Unsupported fixed format: %i.%i' % (m,e))
+    bits = numpy.asarray(bits).astype(numpy.int64) & ((1 << m) - 1)
+    bits = numpy.where(bits >= (1 << (m - 1)), bits - (1 << m), bits)
+    return bits / float(2**e)
+
+def bin2fp_complex_array(real_bits, imag_bits, m = 8, e = 7):
+    """Combines arrays of real and imaginary fixed-point values into a numpy complex array. See bin2fp_array."""
+    return bin2fp_array(real_bits, m, e) + (1j * bin2fp_array(imag_bits, m, e))
+
 if construct.version[1] <= 6:
 
     # f-engine adc control
@@ -314,7 +327,13 @@ def feng_status_get(c, ant_str):
     Reads and decodes the status register for a given antenna. Adds some other bits 'n pieces relating to Fengine status.
     """
     ffpga_n, xfpga_n, fxaui_n, xxaui_n, feng_input = c.get_ant_str_location(ant_str)
-    rv = corr_functions.read_masked_register([c.ffpgas[ffpga_n]], register_fengine_fstatus, names = ['fstatus%i' % feng_input])[0]
+    return feng_status_decode(c.ffpgas[ffpga_n].read_uint('fstatus%i' % feng_input), 'fstatus%i' % feng_input)
+
+def feng_status_decode(vuint, register_name):
+    """
+    Decodes an F engine status register value that has already been read, as feng_status_get does.
+    """
+    rv = corr_functions.decode_masked_register(vuint, register_fengine_fstatus, register_name)
     if rv['xaui_lnkdn'] or rv['xaui_over'] or rv['clk_err'] or rv['ct_error'] or rv['fine_fft_overrange'] or rv['coarse_fft_overrange']:
         rv['lru_state']='fail'
     elif rv['adc_overrange']:
@@ -513,18 +532,15 @@ def get_snap_adc(c, fpgas = [], wait_period = 3):
     Read raw samples from the ADC snap block.
     2 pols, each one 4 parallel samples f8.7. So 64-bits total.
     """
-    raw = snap.snapshots_get(fpgas = fpgas, dev_names = snap_adc, wait_period = wait_period)
-    repeater = construct.GreedyRange(snap_fengine_adc)
+    from . import snap
+    raw = snap.snapshots_get(fpgas = fpgas, dev_names = snap_adc, wait_period = wait_period, executor = c.executor)
     rv = []
     for index, d in enumerate(raw['data']):
-        upd = repeater.parse(d)
-        data = [[], []]
-        for ctr in range(0, len(upd)):
-            for pol in range(0,2):
-                for sample in range(0,4):
-                    uf = upd[ctr]['d%i_%i' % (pol,sample)]
-                    f87 = bin2fp(uf)
-                    data[pol].append(f87)
+        upd = snap.unpack_snapshot(d, snap_fengine_adc)
+        data = []
+        for pol in range(0,2):
+            samples = numpy.column_stack([upd['d%i_%i' % (pol,sample)] for sample in range(0,4)]).flatten()
+            data.append(bin2fp_array(samples, 8, 7).tolist())
         v = {'fpga_index': index, 'data': data}
         rv.append(v)
     return rv
@@ -534,7 +550,8 @@ def get_snap_adc_DUMB(c, fpgas = [], wait_period = 3):
     Read raw samples from the ADC snap block.
     2 pols, each one 4 parallel samples f8.7. So 64-bits total.
     """
-    raw = snap.snapshots_get(fpgas = fpgas, dev_names = snap_adc, wait_period = wait_period)
+    from . import snap
+    raw = snap.snapshots_get(fpgas = fpgas, dev_names = snap_adc, wait_period = wait_period, executor = c.executor)
     repeater = construct.GreedyRange(snap_fengine_adc)
     rv = []
     for index, d in enumerate(raw['data']):
@@ -594,23 +611,19 @@ def get_snap_coarse_fft(c, fpgas = [], pol = 0, setup_snap = True):
     Read and return data from the coarse FFT.
     Returns a list of the data from only that polarisation.
     """
+    from . import snap
     if len(fpgas) == 0:
         fpgas = c.ffpgas
     if setup_snap:
         corr_functions.write_masked_register(fpgas, register_fengine_control,           debug_snap_select = snap_fengine_debug_select['coarse_72'])
         corr_functions.write_masked_register(fpgas, register_fengine_coarse_control,    debug_pol_select = pol, debug_specify_chan = 0)
-    snap_data = snap.snapshots_get(fpgas = fpgas, dev_names = snap_debug, wait_period = 3)
+    snap_data = snap.snapshots_get(fpgas = fpgas, dev_names = snap_debug, wait_period = 3, executor = c.executor)
     rd = []
     for ctr in range(0, len(snap_data['data'])):
-        d = snap_data['data'][ctr]
-        repeater = construct.GreedyRange(snap_fengine_debug_coarse_fft)
-        up = repeater.parse(d)
-        coarsed = []
-        for a in up:
-            for b in range(0,2):
-                num = bin2fp(a['d%i_r'%b], 18, 17) + (1j * bin2fp(a['d%i_i'%b], 18, 17))
-                coarsed.append(num)
-        rd.append(coarsed)
+        up = snap.unpack_snapshot(snap_data['data'][ctr], snap_fengine_debug_coarse_fft)
+        d0 = bin2fp_complex_array(up['d0_r'], up['d0_i'], 18, 17)
+        d1 = bin2fp_complex_array(up['d1_r'], up['d1_i'], 18, 17)
+        rd.append(numpy.column_stack([d0, d1]).flatten().tolist())
     return rd
 
 def get_snap_coarse_channel(c, fpgas = [], pol = 0, channel = -1, setup_snap = True):
@@ -618,6 +631,7 @@ def get_snap_coarse_channel(c, fpgas = [], pol = 0, channel = -1, setup_snap = T
     Get data from a specific coarse channel - straight out of the FFT into the snap block, NOT via the buffer block.
     Returns a list of the data from only that polarisation.
     """
+    from . import snap
     if channel == -1:
         raise RuntimeError('Cannot get data from unspecified channel.')
     if len(fpgas) == 0:
@@ -625,25 +639,18 @@ def get_snap_coarse_channel(c, fpgas = [], pol = 0, channel = -1, setup_snap = T
     if setup_snap:
         corr_functions.write_masked_register(fpgas, register_fengine_control,           debug_snap_select = snap_fengine_debug_select['coarse_72'])
         corr_functions.write_masked_register(fpgas, register_fengine_coarse_control,    debug_pol_select = pol, debug_specify_chan = 1, debug_chan = channel >> 1)
-    snap_data = snap.snapshots_get(fpgas = fpgas, dev_names = snap_debug, wait_period = 3)
+    snap_data = snap.snapshots_get(fpgas = fpgas, dev_names = snap_debug, wait_period = 3, executor = c.executor)
     rd = []
     for ctr in range(0, len(snap_data['data'])):
-        d = snap_data['data'][ctr]
-        repeater = construct.GreedyRange(snap_fengine_debug_coarse_fft)
-        up = repeater.parse(d)
-        coarsed = []
-        for a in up:
-            if channel & 1:
-                num = bin2fp(a['d1_r'], 18, 17) + (1j * bin2fp(a['d1_i'], 18, 17))
-            else:
-                num = bin2fp(a['d0_r'], 18, 17) + (1j * bin2fp(a['d0_i'], 18, 17))
-            coarsed.append(num)
-        rd.append(coarsed)
+        up = snap.unpack_snapshot(snap_data['data'][ctr], snap_fengine_debug_coarse_fft)
+        b = channel & 1
+        rd.append(bin2fp_complex_array(up['d%i_r'%b], up['d%i_i'%b], 18, 17).tolist())
     return rd
 
 def get_snap_buffer_pfb(c, fpgas = [], pol = 0, setup_snap = True, pfb = False):
     '''This DOESN'T EXIST in regular F-engines. Only in specific debug versions.
     '''
+    from . import snap
     if len(fpgas) == 0:
         fpgas = c.ffpgas
     if setup_snap:
@@ -652,17 +659,11 @@ def get_snap_buffer_pfb(c, fpgas = [], pol = 0, setup_snap = True, pfb = False):
         else:
             corr_functions.write_masked_register(fpgas, register_fengine_control, debug_snap_select = snap_fengine_debug_select['buffer_72'])
         corr_functions.write_masked_register(fpgas, register_fengine_coarse_control, debug_pol_select = pol)
-    snap_data = snap.snapshots_get(fpgas = fpgas, dev_names = snap_debug, wait_period = 3)
+    snap_data = snap.snapshots_get(fpgas = fpgas, dev_names = snap_debug, wait_period = 3, executor = c.executor)
     rd = []
     for ctr in range(0, len(snap_data['data'])):
-        d = snap_data['data'][ctr]
-        repeater = construct.GreedyRange(snap_fengine_debug_coarse_fft)
-        up = repeater.parse(d)
-        coarsed = []
-        for a in up:
-            num = bin2fp(a['d%i_r'%pol], 18, 17) + (1j * bin2fp(a['d%i_i'%pol], 18, 17))
-            coarsed.append(num)
-        rd.append(coarsed)
+        up = snap.unpack_snapshot(snap_data['data'][ctr], snap_fengine_debug_coarse_fft)
+        rd.append(bin2fp_complex_array(up['d%i_r'%pol], up['d%i_i'%pol], 18, 17).tolist())
     return rd
 
 #snap_fengine_debug_fine_fft = construct.BitStruct(snap_debug,
@@ -697,24 +698,18 @@ def get_snap_buffer_pfb(c, fpgas = [], pol = 0, setup_snap = True, pfb = False):
 
 
 def get_snap_fine_fft(c, fpgas = [], offset = -1, setup_snap = True):
+    from . import snap
     if len(fpgas) == 0:
         fpgas = c.ffpgas
     if setup_snap:
         corr_functions.write_masked_register(fpgas, register_fengine_control, debug_snap_select = snap_fengine_debug_select['fine_128'])
-    snap_data = snap.snapshots_get(fpgas = fpgas, dev_names = snap_debug, wait_period = 3, offset = offset)
+    snap_data = snap.snapshots_get(fpgas = fpgas, dev_names = snap_debug, wait_period = 3, offset = offset, executor = c.executor)
     rd = []
     for ctr in range(0, len(snap_data['data'])):
-        d = snap_data['data'][ctr]
-        repeater = construct.GreedyRange(snap_fengine_debug_fine_fft)
-        up = repeater.parse(d)
-        fdata_p0 = []
-        fdata_p1 = []
-        for a in up:
-            p0c = bin2fp(a['p0_r'], fine_fft_bitwidth, 17) + (1j * bin2fp(a['p0_i'], fine_fft_bitwidth, 17))
-            p1c = bin2fp(a['p1_r'], fine_fft_bitwidth, 17) + (1j * bin2fp(a['p1_i'], fine_fft_bitwidth, 17))
-            fdata_p0.append(p0c)
-            fdata_p1.append(p1c)
-        rd.append([fdata_p0, fdata_p1])
+        up = snap.unpack_snapshot(snap_data['data'][ctr], snap_fengine_debug_fine_fft)
+        fdata_p0 = bin2fp_complex_array(up['p0_r'], up['p0_i'], fine_fft_bitwidth, 17)
+        fdata_p1 = bin2fp_complex_array(up['p1_r'], up['p1_i'], fine_fft_bitwidth, 17)
+        rd.append([fdata_p0.tolist(), fdata_p1.tolist()])
     return rd
 
 
@@ -745,6 +740,7 @@ def _fpga_snap_quant(fpga = None, offset = -1, wbc_compat = False, debug_data =
     Either way, it's data for both pols.
     debug_data is data from the snap.snapshots_get function
     '''
+    from . import snap
     def _log(msg):
         fpga._logger.debug('_fpga_snap_quant: %s' % msg)
     if fpga == None:
@@ -756,25 +752,11 @@ def _fpga_snap_quant(fpga = None, offset = -1, wbc_compat = False, debug_data =
         _log('using debug data, not fresh snap data.')
         snap_data = debug_data['data'][0]
     _log('unpacking data.')
-    data = [[], []]
-    if not wbc_compat:
-        repeater = construct.GreedyRange(snap_fengine_debug_quant)
-        unpacked = repeater.parse(snap_data)
-        for ctr in unpacked:
-            p0c = bin2fp(ctr['p0_r'], 4, 3) + (1j * bin2fp(ctr['p0_i'], 4, 3))
-            p1c = bin2fp(ctr['p1_r'], 4, 3) + (1j * bin2fp(ctr['p1_i'], 4, 3))
-            data[0].append(p0c)
-            data[1].append(p1c)
-    else:
-        # remember that the data is 16-bit padded up to 128-bit because of the one debug snap block, so only 2 of every 16 bytes are valid data
-        unpacked = numpy.fromstring(snap_data, dtype = numpy.uint8)
-        for ctr in range(14, len(unpacked), 16):
-            pol0_r_bits = (unpacked[ctr]   & ((2**8) - (2**4))) >> 4
-            pol0_i_bits = (unpacked[ctr]   & ((2**4) - (2**0)))
-            pol1_r_bits = (unpacked[ctr+1] & ((2**8) - (2**4))) >> 4
-            pol1_i_bits = (unpacked[ctr+1] & ((2**4) - (2**0)))
-            data[0].append(float(((numpy.int8(pol0_r_bits << 4) >> 4))) + (1j * float(((numpy.int8(pol0_i_bits << 4) >> 4)))))
-            data[1].append(float(((numpy.int8(pol1_r_bits << 4) >> 4))) + (1j * float(((numpy.int8(pol1_i_bits << 4) >> 4)))))
+    # remember that the data is 16-bit padded up to 128-bit because of the one debug snap block, so only 2 of every 16 bytes are valid data.
+    # each of those bytes is a 4 bit real value followed by a 4 bit imaginary value, pol0 first.
+    # wbc_compat returns the raw integers as the wideband quantiser snapshot does, otherwise they're 4.3 fixed point.
+    unpacked = snap.unpack_fixed_complex(snap.snap_word_bytes(snap_data, 16, 14, 16).flatten(), n_bits = 4, bin_pt = (0 if wbc_compat else 3))
+    data = [unpacked[0::2].tolist(), unpacked[1::2].tolist()]
     _log('returning %i complex values for each pol.' % len(data[0]))
     return data
 
@@ -790,32 +772,17 @@ def get_snap_ct(c, fpgas = [], offset = -1, setup_snap = True):
     """
     Read and return data from the corner turner. Both pols are returned.
     """
+    from . import snap
     if len(fpgas) == 0:
         fpgas = c.ffpgas
     if setup_snap:
         corr_functions.write_masked_register(fpgas, register_fengine_control, debug_snap_select = snap_fengine_debug_select['ct_64'])
-    snap_data = snap.snapshots_get(fpgas = fpgas, dev_names = snap_debug, wait_period = 3, offset = offset)
+    snap_data = snap.snapshots_get(fpgas = fpgas, dev_names = snap_debug, wait_period = 3, offset = offset, executor = c.executor)
     rd = []
     for ctr in range(0, len(snap_data['data'])):
-        d = snap_data['data'][ctr]
-        repeater = construct.GreedyRange(snap_fengine_debug_ct)
-        up = repeater.parse(d)
-        fdata_p0 = []
-        fdata_p1 = []
-        for a in up:
-            p0 = []
-            p1 = []
-            p0.append(bin2fp(a['p00_r'], 4, 3) + (1j * bin2fp(a['p00_i'], 4, 3)))
-            p0.append(bin2fp(a['p01_r'], 4, 3) + (1j * bin2fp(a['p01_i'], 4, 3)))
-            p0.append(bin2fp(a['p02_r'], 4, 3) + (1j * bin2fp(a['p02_i'], 4, 3)))
-            p0.append(bin2fp(a['p03_r'], 4, 3) + (1j * bin2fp(a['p03_i'], 4, 3)))
-            p1.append(bin2fp(a['p10_r'], 4, 3) + (1j * bin2fp(a['p10_i'], 4, 3)))
-            p1.append(bin2fp(a['p11_r'], 4, 3) + (1j * bin2fp(a['p11_i'], 4, 3)))
-            p1.append(bin2fp(a['p12_r'], 4, 3) + (1j * bin2fp(a['p12_i'], 4, 3)))
-            p1.append(bin2fp(a['p13_r'], 4, 3) + (1j * bin2fp(a['p13_i'], 4, 3)))
-            fdata_p0.extend(p0)
-            fdata_p1.extend(p1)
-        rd.append([fdata_p0, fdata_p1])
+        # the low 64 bits of each word hold four 4.3 complex values per pol, interleaved p00, p10, p01, p11, ...
+        up = snap.unpack_fixed_complex(snap.snap_word_bytes(snap_data['data'][ctr], 16, 8, 16).flatten(), n_bits = 4, bin_pt = 3).reshape(-1, 8)
+        rd.append([up[:, 0::2].flatten().tolist(), up[:, 1::2].flatten().tolist()])
     return rd
 
 # the xaui snap block on the f-engine - this is just after packetisation
@@ -825,18 +792,20 @@ def get_snap_xaui(c, fpgas = [], offset = -1, man_trigger = False, man_valid = F
     """
     Read the XAUI data out of the general debug snap block.
     """
+    from . import snap
     if len(fpgas) == 0:
         fpgas = c.ffpgas
     corr_functions.write_masked_register(fpgas, register_fengine_control, debug_snap_select = snap_fengine_debug_select['xaui_128'])
-    snap_data = snap.snapshots_get(fpgas = fpgas, dev_names = snap_debug, wait_period = wait_period, offset = offset, man_trig = man_trigger, man_valid = man_valid, circular_capture = False)
+    snap_data = snap.snapshots_get(fpgas = fpgas, dev_names = snap_debug, wait_period = wait_period, offset = offset, man_trig = man_trigger, man_valid = man_valid, circular_capture = False, executor = c.executor)
     return snap_data
 
 
 def get_snap_feng_10gbe(c, fpgas = [], offset = -1,  man_trigger = False, man_valid = False):
+    from . import snap
     if len(fpgas) == 0:
         fpgas = c.ffpgas
     corr_functions.write_masked_register(fpgas, register_fengine_control, debug_snap_select = snap_fengine_debug_select['gbetx0_128'])
-    snap_data = snap.snapshots_get(fpgas = fpgas, dev_names = snap_debug, wait_period = 3, offset = offset, man_trig = man_trigger, man_valid = man_valid, circular_capture = False)
+    snap_data = snap.snapshots_get(fpgas = fpgas, dev_names = snap_debug, wait_period = 3, offset = offset, man_trig = man_trigger, man_valid = man_valid, circular_capture = False, executor = c.executor)
     rd = []
     for ctr in range(0, len(snap_data['data'])):
         d = snap_data['data'][ctr]
@@ -869,8 +838,9 @@ def DONE_get_fine_fft_snap(correlator):
     return d
 
 def DONE_get_ct_snap(correlator, offset = -1):
+    from . import snap
     corr_functions.write_masked_register(correlator.ffpgas, register_fengine_fine_control, quant_snap_select = 2)
-    raw = snap.snapshots_get(correlator.ffpgas, dev_names = fine_snap_name, man_trig = False, man_valid = False, wait_period = 3, offset = offset, circular_capture = False)
+    raw = snap.snapshots_get(correlator.ffpgas, dev_names = fine_snap_name, man_trig = False, man_valid = False, wait_period = 3, offset = offset, circular_capture = False, executor = correlator.executor)
     chan_values = []
     for index, d in enumerate(raw['data']):
         up = list(struct.unpack('>%iI' % (len(d) / 4), d))
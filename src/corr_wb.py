@@ -291,7 +291,11 @@ def feng_status_get(c, ant_str):
     """Reads and decodes the status register for a given antenna. Adds some other bits 'n pieces relating to Fengine status."""
     #'sync_val': 28:30, #This is the number of clocks of sync pulse offset for the demux-by-four ADC 1PPS.
     ffpga_n, xfpga_n, fxaui_n, xxaui_n, feng_input = c.get_ant_str_location(ant_str)
-    rv = corr_functions.read_masked_register([c.ffpgas[ffpga_n]], register_fengine_fstatus, names = ['fstatus%i' % feng_input])[0]
+    return feng_status_decode(c.ffpgas[ffpga_n].read_uint('fstatus%i' % feng_input), 'fstatus%i' % feng_input)
+
+def feng_status_decode(vuint, register_name):
+    """Decodes an F engine status register value that has already been read, as feng_status_get does."""
+    rv = corr_functions.decode_masked_register(vuint, register_fengine_fstatus, register_name)
     if rv['xaui_lnkdn'] or rv['xaui_over'] or rv['clk_err'] or rv['ct_error'] or rv['fft_overrange']:
         rv['lru_state']='fail'
     elif rv['adc_overrange'] or rv['adc_disabled']:
@@ -15,7 +15,7 @@ import os
 import construct
 import spead64_48 as spead
 
-from . import log_handlers, cn_conf, corr_nb, corr_wb, snap
+from . import log_handlers, cn_conf, corr_nb, corr_wb, snap, katcp_wrapper, katadc, threaded
 from .corr_functions import *
 
 katcp_prefix = '/'
@@ -50,21 +50,57 @@ class Correlator(object):
         self.syslogger.info('Configuration file %s parsed ok.' % config_file)
         self.spead_tx = spead.Transmitter(spead.TransportUDPtx(self.config['rx_meta_ip_str'], self.config['rx_udp_port']))
         self.spead_ig = spead.ItemGroup()
+        # if set, each X engine board sends its output to its own port (rx_udp_port + board number), and metadata goes to all of them. See config_udp_output.
+        self.rx_udp_port_per_board = False
+        self._spead_tx_boards = []
+        # SPEAD metadata items are only resent when they change, except on a full refresh, which spead_issue_all does every spead_full_refresh_period seconds (None to disable).
+        self._spead_sent = {}
+        self._spead_pending = {}
+        self._spead_full = False
+        self._spead_last_full = 0
+        self.spead_full_refresh_period = 60.0
+
+        # measured time to arm the delay loads on all the F engines, and the fixed margin on top of it. Together these set the fr_delay_set_all lead time.
+        self.fr_delay_arm_time = None
+        self.fr_delay_ld_margin = 0.02
+
+        # host-side copy of each EQ bram as last written, so that only changed coefficients are uploaded.
+        # keyed on (ffpga_n, register_name) rather than the input label, so that relabelling inputs leaves it valid.
+        # changed 32-bit words up to eq_merge_words apart are written as one block.
+        self._eq_shadow = {}
+        self.eq_merge_words = 16
 
         if connect == True:
             self.connect()
 
-    def connect(self):
-        self.xfpgas=[katcp_wrapper.FpgaClient(server,self.config['katcp_port'],
-                       timeout=10,logger=self.xloggers[s]) for s,server in enumerate(self.xsrvs)]
-        self.ffpgas=[katcp_wrapper.FpgaClient(server,self.config['katcp_port'],
-                       timeout=10,logger=self.floggers[s]) for s,server in enumerate(self.fsrvs)]
-        self.allfpgas = self.ffpgas + self.xfpgas
-        time.sleep(1)
+    def connect(self, connect_timeout = 10):
+        """Connect to all the F and X engine boards at once. Returns once every board has connected, or raises a RuntimeError if any has not after connect_timeout seconds."""
+        self.pool = threaded.FpgaPool(self.fsrvs + self.xsrvs, self.config['katcp_port'],
+                       timeout = 10, loggers = self.floggers + self.xloggers, connect_timeout = connect_timeout)
+        self.executor = threaded.FpgaExecutor(len(self.allfpgas))
+        if not self.pool.wait_connected(connect_timeout):
+            liveness = self.pool.liveness()
+            log_runtimeerror(self.syslogger, "KATCP connections to %s not established after %is." % (', '.join([host for host in self.pool.hosts if not liveness[host]['connected']]), connect_timeout))
         if not self.check_katcp_connections():
             raise RuntimeError("Connection to FPGA boards failed.")
         #self.get_rcs()
 
+    @property
+    def ffpgas(self):
+        return self.pool.fpgas[0:len(self.fsrvs)]
+
+    @property
+    def xfpgas(self):
+        return self.pool.fpgas[len(self.fsrvs):]
+
+    @property
+    def allfpgas(self):
+        return self.pool.fpgas[:]
+
+    def fpga_liveness(self):
+        """Returns a dictionary, keyed on hostname, of the KATCP connection state of each board."""
+        return self.pool.liveness()
+
     def __del__(self):
         self.disconnect_all()
 
@@ -72,7 +108,11 @@ class Correlator(object):
         """Stop all TCP KATCP links to all FPGAs defined in the config file."""
         #tested ok corr-0.5.0 2010-07-19
         try:
-            for fpga in (self.allfpgas): fpga.stop()
+            self.executor.stop()
+        except:
+            pass
+        try:
+            self.pool.stop()
         except:
             pass
 
@@ -141,8 +181,12 @@ class Correlator(object):
         self.floggers[ffpga_n].info('Relabelled my input %i (system-wide input %i) to %s.'%(feng_input,input_n,ant_str))
         self.spead_labelling_issue()
 
-    def get_bl_order(self):
-        """Return the order of baseline data output by a CASPER correlator X engine."""
+    def _bl_table(self):
+        """Returns the cached baseline order and its reverse lookup dictionary, rebuilding them if the antenna mapping has changed."""
+        mapping = self.config._get_ant_mapping_list()
+        key = (self.config['n_ants'], tuple(mapping))
+        if getattr(self, '_bl_cache_key', None) == key:
+            return self._bl_cache, self._bl_index
         n_ants=self.config['n_ants']
         order1, order2 = [], []
         for i in range(n_ants):
@@ -150,27 +194,36 @@ class Correlator(object):
                 k = (i-j) % n_ants
                 if i >= k: order1.append((k, i))
                 else: order2.append((i, k))
-        order2 = [o for o in order2 if o not in order1]
-        dp_bls = tuple([o for o in order1 + order2])
+        seen = set(order1)
+        order2 = [o for o in order2 if o not in seen]
         rv=[]
-        for bl in dp_bls:
-            rv.append(tuple((self.map_input_to_ant(bl[0]*2),self.map_input_to_ant(bl[1]*2))))
-            rv.append(tuple((self.map_input_to_ant(bl[0]*2+1),self.map_input_to_ant(bl[1]*2+1))))
-            rv.append(tuple((self.map_input_to_ant(bl[0]*2),self.map_input_to_ant(bl[1]*2+1))))
-            rv.append(tuple((self.map_input_to_ant(bl[0]*2+1),self.map_input_to_ant(bl[1]*2))))
-        return rv
+        for bl in order1 + order2:
+            rv.append((mapping[bl[0]*2],mapping[bl[1]*2]))
+            rv.append((mapping[bl[0]*2+1],mapping[bl[1]*2+1]))
+            rv.append((mapping[bl[0]*2],mapping[bl[1]*2+1]))
+            rv.append((mapping[bl[0]*2+1],mapping[bl[1]*2]))
+        index = {}
+        for n, bl in enumerate(rv):
+            index.setdefault(bl, n)
+        self._bl_cache, self._bl_index, self._bl_cache_key = rv, index, key
+        return rv, index
+
+    def get_bl_order(self):
+        """Return the order of baseline data output by a CASPER correlator X engine.
+        The list is cached until the antenna mapping changes, so don't modify it."""
+        return self._bl_table()[0]
 
     def ant_str_to_baseline(self, ant_tuple):
         '''e.g. ('3x', '6y') will return either the baseline (as generated by get_bl_order) or -1, if that pairing doesn't exist.
         '''
         try:
-            return self.get_bl_order().index(ant_tuple)
+            return self._bl_table()[1].get(tuple(ant_tuple), -1)
         except:
             return -1
 
     def baseline_to_ant_str(self, baseline):
         try:
-            return self.get_bl_order()[baseline]
+            return self._bl_table()[0][baseline]
         except:
             return ('n/a', 'n/a')
 
@@ -180,28 +233,118 @@ class Correlator(object):
         pol2=self.config['rev_pol_map'][1]
         return (pol1+pol1, pol2+pol2, pol1+pol2, pol2+pol1)
 
-    def prog_all(self, timeout=10):
-        """Progam all the FPGAs asynchronously."""
+    def bitstream_cache_get(self):
+        """Returns the record of which bitstream each board was last programmed with, as a dictionary keyed on hostname of (bitstream, design fingerprint) tuples."""
+        rv = {}
+        for entry in self.config.read_var_list('bitstream_cache'):
+            try:
+                host, bitstream, fingerprint = entry.rsplit(cn_conf.PORTDELIMIT, 2)
+            except ValueError:
+                continue
+            rv[host] = (bitstream, fingerprint)
+        return rv
+
+    def bitstream_cache_update(self, fpgas, bitstreams):
+        """Records the bitstreams now running on the given boards, along with the fingerprint of the running design."""
+        cache = self.bitstream_cache_get()
+        fingerprints = self.executor.map(fpgas, katcp_wrapper.FpgaClient.design_fingerprint)
+        for fn, fpga in enumerate(fpgas):
+            if fingerprints[fn] == None:
+                cache.pop(fpga.host, None)
+            else:
+                cache[fpga.host] = (bitstreams[fn], fingerprints[fn])
+        self.config.write_var_list('bitstream_cache', [cn_conf.PORTDELIMIT.join([host, v[0], v[1]]) for host, v in cache.iteritems()])
+
+    def bitstream_loaded(self, bitstreams):
+        """Checks whether each board is already running the requested bitstream, by comparing the fingerprint of its running design with the one recorded when it was last programmed.
+        bitstreams is a list with one entry per board in allfpgas. Returns a list of booleans in the same order."""
+        cache = self.bitstream_cache_get()
+        fingerprints = self.executor.map(self.allfpgas, katcp_wrapper.FpgaClient.design_fingerprint)
+        rv = []
+        for fn, fpga in enumerate(self.allfpgas):
+            cached = cache.get(fpga.host, None)
+            rv.append((fingerprints[fn] != None) and (cached == (bitstreams[fn], fingerprints[fn])))
+        return rv
+
+    def _prog_select(self, bitstreams, force):
+        """Returns the list of board numbers that need programming with bitstreams, logging the decision for each board."""
+        if force:
+            loaded = [False] * len(self.allfpgas)
+        else:
+            loaded = self.bitstream_loaded(bitstreams)
+        to_program = []
+        for fn, fpga in enumerate(self.allfpgas):
+            if loaded[fn]:
+                self.loggers[fn].info("Already running %s, skipping programming." % bitstreams[fn])
+            else:
+                self.loggers[fn].info("Programming with %s." % bitstreams[fn])
+                to_program.append(fn)
+        self.syslogger.info("Programming %i FPGAs, %i already running the requested bitstream." % (len(to_program), len(self.allfpgas) - len(to_program)))
+        return to_program
+
+    def prog_all(self, timeout = 10, force = True):
+        """Progam all the FPGAs concurrently. F and X engines are programmed at the same time.
+        Each board has timeout seconds to reply to its progdev request.
+        If force is False, boards already running the configured bitstream are not reprogrammed.
+        Returns a dictionary, keyed on hostname, saying whether each board was 'programmed' or 'skipped'."""
         self.syslogger.info("Programming all FPGAs.")
-        f_nottimedout, frv = non_blocking_request(fpgas = self.ffpgas, timeout = timeout, request = 'progdev', request_args = [self.config['bitstream_f']])
-        f_okay = True
-        for k, v in frv.items():
-            if v['reply'] != 'ok': f_okay = False
-        x_nottimedout, xrv = non_blocking_request(fpgas = self.xfpgas, timeout = timeout, request = 'progdev', request_args = [self.config['bitstream_x']])
-        x_okay = True
-        for k, v in xrv.items():
-            if v['reply'] != 'ok': x_okay = False
-        if not(f_nottimedout and x_nottimedout):
-            raise RuntimeError('Programming the FPGAs timed out: F(%i) X(%i)' % (not f_nottimedout, not x_nottimedout))
-        elif not(x_okay and f_okay):
-            errstr = 'One or more FPGAs didn\'t reply \'ok\' to progdev request:\n', str(frv), '\n', str(xrv)
-            raise RuntimeError(errstr)
-        elif not self.check_fpga_comms():
+        bitstreams = [self.config['bitstream_f']] * len(self.ffpgas) + [self.config['bitstream_x']] * len(self.xfpgas)
+        to_program = self._prog_select(bitstreams, force)
+        fpgas = [self.allfpgas[fn] for fn in to_program]
+        try:
+            self.executor.starmap(fpgas, katcp_wrapper.FpgaClient.progdev, [(bitstreams[fn], timeout) for fn in to_program])
+        except RuntimeError as exc:
+            raise RuntimeError('One or more FPGAs didn\'t reply \'ok\' to progdev request: %s' % exc)
+        if not self.check_fpga_comms():
             raise RuntimeError("FPGAs were programmed but we don\'t have comms?")
         else:
             self.syslogger.info("All FPGAs programmed ok.")
-            time.sleep(1)
+            self.bitstream_cache_update(fpgas, [bitstreams[fn] for fn in to_program])
+            if len(to_program) > 0:
+                self.eq_cache_clear()
             self.get_rcs()
+        return dict([(fpga.host, 'programmed' if fn in to_program else 'skipped') for fn, fpga in enumerate(self.allfpgas)])
+
+    def upload_prog_all(self, f_bof_file, x_bof_file, port=3333, timeout=30, chunk_size=65536, force=True):
+        """Streams local .bof files to all the FPGAs at once and runs them, F engines getting f_bof_file and X engines x_bof_file.
+        If force is False, boards already running a bof file with the same md5 digest are skipped.
+        Progress is logged every 10% per board. Returns a dictionary, keyed on hostname, of the bytes sent, time taken and throughput for each board uploaded to."""
+        import hashlib
+        self.syslogger.info("Uploading %s to F engines and %s to X engines." % (f_bof_file, x_bof_file))
+        digests = {}
+        for bof_file in [f_bof_file, x_bof_file]:
+            md5 = hashlib.md5()
+            fp = open(bof_file, 'rb')
+            chunk = fp.read(chunk_size)
+            while chunk:
+                md5.update(chunk)
+                chunk = fp.read(chunk_size)
+            fp.close()
+            digests[bof_file] = 'md5-' + md5.hexdigest()
+        bof_files = [f_bof_file] * len(self.ffpgas) + [x_bof_file] * len(self.xfpgas)
+        bitstreams = [digests[bof_file] for bof_file in bof_files]
+        to_program = self._prog_select(bitstreams, force)
+        fpgas = [self.allfpgas[fn] for fn in to_program]
+        logged = {}
+        def progress(host, sent, total):
+            decile = (10 * sent) / max(total, 1)
+            if decile > logged.get(host, 0):
+                logged[host] = decile
+                self.syslogger.debug("Upload to %s: %i of %i bytes." % (host, sent, total))
+        def upload(fpga, bof_file):
+            return fpga.upload_program_bof(bof_file, port, timeout = timeout, chunk_size = chunk_size, progress_cb = progress)
+        stats = self.executor.starmap(fpgas, upload, [(bof_files[fn],) for fn in to_program])
+        if len(to_program) > 0:
+            self.eq_cache_clear()
+        self.bitstream_cache_update(fpgas, [bitstreams[fn] for fn in to_program])
+        rv = {}
+        for n, fn in enumerate(to_program):
+            rv[self.allfpgas[fn].host] = stats[n]
+            self.loggers[fn].info("Uploaded %i bytes in %.2fs (%.1f kB/s)." % (stats[n]['bytes'], stats[n]['seconds'], stats[n]['rate'] / 1024.))
+        total_bytes = sum([v['bytes'] for v in stats])
+        total_time = max([v['seconds'] for v in stats] + [0])
+        self.syslogger.info("Uploaded %i bytes to %i FPGAs in %.2fs (%.1f kB/s aggregate)." % (total_bytes, len(stats), total_time, (total_bytes / total_time / 1024.) if total_time > 0 else 0))
+        return rv
 
     def prog_all_old(self):
         """Programs all the FPGAs."""
@@ -211,6 +354,7 @@ class Correlator(object):
             fpga.progdev(self.config['bitstream_f'])
         for fpga in self.xfpgas:
             fpga.progdev(self.config['bitstream_x'])
+        self.eq_cache_clear()
         if not self.check_fpga_comms():
             raise RuntimeError("Failed to successfully program FPGAs.")
         else:
@@ -241,33 +385,32 @@ class Correlator(object):
             fpga.progdev('')
         for fpga in self.xfpgas:
             fpga.progdev('')
+        self.eq_cache_clear()
         self.syslogger.info("All FPGAs deprogrammed.")
 
     def xread_all(self,register,bram_size,offset=0):
         """Reads a register of specified size from all X-engines. Returns a list."""
-        rv = [fpga.read(register,bram_size,offset) for fpga in self.xfpgas]
-        return rv
+        return self.executor.map(self.xfpgas, katcp_wrapper.FpgaClient.read, register, bram_size, offset)
 
     def fread_all(self,register,bram_size,offset=0):
         """Reads a register of specified size from all F-engines. Returns a list."""
-        rv = [fpga.read(register,bram_size,offset) for fpga in self.ffpgas]
-        return rv
+        return self.executor.map(self.ffpgas, katcp_wrapper.FpgaClient.read, register, bram_size, offset)
 
     def xread_uint_all(self, register):
         """Reads a value from register 'register' for all X-engine FPGAs."""
-        return [fpga.read_uint(register) for fpga in self.xfpgas]
+        return self.executor.map(self.xfpgas, katcp_wrapper.FpgaClient.read_uint, register)
 
     def fread_uint_all(self, register):
         """Reads a value from register 'register' for all F-engine FPGAs."""
-        return [fpga.read_uint(register) for fpga in self.ffpgas]
+        return self.executor.map(self.ffpgas, katcp_wrapper.FpgaClient.read_uint, register)
 
     def xwrite_int_all(self,register,value):
         """Writes to a 32-bit software register on all X-engines."""
-        [fpga.write_int(register,value) for fpga in self.xfpgas]
+        self.executor.map(self.xfpgas, katcp_wrapper.FpgaClient.write_int, register, value)
 
     def fwrite_int_all(self,register,value):
         """Writes to a 32-bit software register on all F-engines."""
-        [fpga.write_int(register,value) for fpga in self.ffpgas]
+        self.executor.map(self.ffpgas, katcp_wrapper.FpgaClient.write_int, register, value)
 
     def feng_ctrl_set_all(self, **kwargs):
         """Valid keyword args include:
@@ -385,12 +528,23 @@ class Correlator(object):
             raise RuntimeError('Cannot get FFT shift for unknown mode.')
         return rv
 
-    def feng_status_get_all(self):
-        """Reads and decodes the status register from all the Fengines. Also does basic clock check."""
+    def feng_status_get_all(self, snapshot = None):
+        """Reads and decodes the status register from all the Fengines, or takes it from a health_snapshot. Also does basic clock check."""
         rv={}
         self.check_feng_clks(quick_test=True,per_board=True)
+        if snapshot == None:
+            for ant_str in self.config._get_ant_mapping_list():
+                rv[ant_str] = self.feng_status_get(ant_str)
+            return rv
+        if self.is_wideband():
+            decode = corr_wb.feng_status_decode
+        elif self.is_narrowband():
+            decode = corr_nb.feng_status_decode
+        else:
+            raise RuntimeError('Unknown mode. Cannot decode F-engine status.')
         for ant_str in self.config._get_ant_mapping_list():
-            rv[ant_str] = self.feng_status_get(ant_str)
+            ffpga_n, xfpga_n, fxaui_n, xxaui_n, feng_input = self.get_ant_str_location(ant_str)
+            rv[ant_str] = decode(snapshot['f'][ffpga_n]['fstatus%i' % feng_input], 'fstatus%i' % feng_input)
         return rv
 
     def feng_status_get(self,ant_str):
@@ -401,13 +555,16 @@ class Correlator(object):
         else:
             raise RuntimeError('Unknown mode. Cannot read F-engine status.')
 
-    def xeng_status_get_all(self):
-        """Reads and decodes the status registers for all xengines."""
+    def xeng_status_get_all(self, snapshot = None):
+        """Reads and decodes the status registers for all xengines, or takes them from a health_snapshot."""
         rv = {}
         for loc_xeng_n in range(self.config['x_per_fpga']):
             for xfpga_num, srv in enumerate(self.xsrvs):
                 xeng_id = 'xeng%i' % (loc_xeng_n + self.config['x_per_fpga'] * xfpga_num)
-                rv[xeng_id] = read_masked_register([self.xfpgas[xfpga_num]], corr_wb.register_xengine_status, names = ['xstatus%i' % loc_xeng_n])[0]
+                if snapshot == None:
+                    rv[xeng_id] = read_masked_register([self.xfpgas[xfpga_num]], corr_wb.register_xengine_status, names = ['xstatus%i' % loc_xeng_n])[0]
+                else:
+                    rv[xeng_id] = decode_masked_register(snapshot['x'][xfpga_num]['xstatus%i' % loc_xeng_n], corr_wb.register_xengine_status, 'xstatus%i' % loc_xeng_n)
                 if (rv[xeng_id]['gbe_lnkdn'] or rv[xeng_id]['xeng_err'] or
                     rv[xeng_id]['vacc_err'] or rv[xeng_id]['rx_bad_pkt'] or
                     rv[xeng_id]['rx_bad_frame'] or rv[xeng_id]['tx_over'] or
@@ -417,112 +574,227 @@ class Correlator(object):
                     rv[xeng_id]['lru_state'] = 'ok'
         return rv
 
-    def initialise(self, n_retries = 40, reprogram = True, clock_check = True, set_eq = True, config_10gbe = True, config_output = True, send_spead = True, prog_timeout_s = 5):
-        """Initialises the system and checks for errors."""
+    def initialise(self, n_retries = 40, reprogram = True, clock_check = True, set_eq = True, config_10gbe = True, config_output = True, send_spead = True, prog_timeout_s = 5, force_reprogram = False):
+        """Initialises the system and checks for errors. When reprogramming, boards already running the configured bitstream are left alone unless force_reprogram is set.
+        Bring-up is a graph of stages (see threaded.run_stage_graph). Stages that don't depend on each other run at the same time, and each stage works on all boards at once.
+        Stages that write the shared F and X engine control registers (read-modify-write, see corr_functions.write_masked_register) are chained in the original order,
+        so only stages touching disjoint registers overlap.
+        Returns a dictionary of the time each stage took in seconds, which is also kept as self.init_timings."""
         self.syslogger.info("Reinitialising correlator.")
-        if reprogram:
-            self.deprog_all()
-            time.sleep(prog_timeout_s)
-            self.prog_all()
-
-        if self.tx_status_get(): self.tx_stop()
-
-        if self.config['feng_out_type'] == '10gbe':
-            self.gbe_reset_hold_f()
-        self.gbe_reset_hold_x()
-
-        if not self.arm(): self.syslogger.error("Failed to successfully arm and trigger system.")
-        if clock_check == True:
-            if not self.check_feng_clks():
-                raise RuntimeError("System clocks are bad. Please fix and try again.")
-
-        #Only need to set brd id on xeng if there's no incomming 10gbe, else get from base ip addr
-        if self.config['feng_out_type'] == '10gbe':
-            self.xeng_brd_id_set()
-        self.feng_brd_id_set()
 
-        if self.config['adc_type'] == 'katadc':
-            self.rf_gain_set_all()
-
-        self.fft_shift_set_all()
-
-        if set_eq: self.eq_set_all()
-        else: self.syslogger.info('Skipped EQ config.')
+        def program():
+            if not reprogram:
+                return
+            if force_reprogram:
+                self.deprog_all()
+                time.sleep(prog_timeout_s)
+            self.prog_all(force = force_reprogram)
+
+        def tx_stop():
+            if self.tx_status_get(): self.tx_stop()
+
+        def gbe_hold():
+            if self.config['feng_out_type'] == '10gbe':
+                self.gbe_reset_hold_f()
+            self.gbe_reset_hold_x()
+
+        def arm():
+            if not self.arm(): self.syslogger.error("Failed to successfully arm and trigger system.")
+
+        def check_clocks():
+            if clock_check == True:
+                if not self.check_feng_clks():
+                    raise RuntimeError("System clocks are bad. Please fix and try again.")
+
+        def brd_id():
+            #Only need to set brd id on xeng if there's no incomming 10gbe, else get from base ip addr
+            if self.config['feng_out_type'] == '10gbe':
+                self.xeng_brd_id_set()
+            self.feng_brd_id_set()
+
+        def rf_gain():
+            if self.config['adc_type'] == 'katadc':
+                self.rf_gain_set_all()
+
+        def eq():
+            if set_eq: self.eq_set_all()
+            else: self.syslogger.info('Skipped EQ config.')
+
+        def gbe_config():
+            if config_10gbe:
+                self.config_roach_10gbe_ports()
+                # this used to be a fixed wait, which is now the limit on how long we'll wait for the ARP tables to fill
+                arp_timeout=((self.config['10gbe_ip']&255) + self.config['n_xeng']*self.config['n_xaui_ports_per_xfpga'])*0.1
+                self.gbe_arp_wait(timeout = arp_timeout)
+
+        def gbe_release():
+            if self.config['feng_out_type'] == '10gbe':
+                self.gbe_reset_release_f()
+            self.gbe_reset_release_x()
+            self.gbe_rx_wait(timeout = max(len(self.xfpgas), 2))
+            self.rst_status_and_count()
+            # give the status registers a second to collect errors before they're checked
+            time.sleep(1)
 
-        if config_10gbe:
-            self.config_roach_10gbe_ports()
-            sleep_time=((self.config['10gbe_ip']&255) + self.config['n_xeng']*self.config['n_xaui_ports_per_xfpga'])*0.1
-            self.syslogger.info("Waiting %i seconds for ARP to complete."%sleep_time)
-            time.sleep(sleep_time)
+        def check_fengs():
+            stat=self.check_all(details=True)
+            for in_n,ant_str in enumerate(self.config._get_ant_mapping_list()):
+                ffpga_n,xfpga_n,fxaui_n,xxaui_n,feng_input = self.get_ant_str_location(ant_str)
+                if (stat[ant_str]['adc_disabled']==True) or (stat[ant_str]['adc_overrange']==True):
+                    self.floggers[ffpga_n].warn("%s input levels are too high!"%ant_str)
+                if self.is_narrowband():
+                    if stat[ant_str]['coarse_fft_overrange']==True:
+                        self.floggers[ffpga_n].error("%s coarse FFT is overranging. Spectrum output is garbage."%ant_str)
+                    if stat[ant_str]['fine_fft_overrange']==True:
+                        self.floggers[ffpga_n].error("%s fine FFT is overranging. Spectrum output is garbage."%ant_str)
+                else:
+                    if stat[ant_str]['fft_overrange']==True:
+                        self.floggers[ffpga_n].error("%s FFT is overranging. Spectrum output is garbage."%ant_str)
+
+                # This is not quite right... Both ROACH's QDRs are used in a single corner-turn for both inputs. HARDCODED to check two QDRs per board!
+                if stat[ant_str]['ct_error']==True:
+                    self.floggers[ffpga_n].error("Corner-Turn for input %s is in error."%ant_str)
+                    for qdr_n in range(2):
+                        loop_retry_cnt=0
+                        while (self.ffpgas[ffpga_n].qdr_status(qdr_n)['calfail']==True) and (loop_retry_cnt< n_retries):
+                            time.sleep(0.2)
+                            loop_retry_cnt+=1
+                            self.floggers[ffpga_n].error("SRAM calibration on input %s failed. Forcing software reset/recalibration... retry %i"%(ant_str,loop_retry_cnt))
+                            self.ffpgas[ffpga_n].qdr_rst(qdr_n)
+                        if self.ffpgas[ffpga_n].qdr_status(qdr_n)['calfail']==True:
+                            self.floggers[ffpga_n].error("Could not calibrate Fengine QDR%i on input %s after %i retries. Giving up."%(qdr_n,ant_str,n_retries))
+                            raise RuntimeError("Could not calibrate Fengine QDR%i on input %s after %i retries. Giving up."%(qdr_n,ant_str,n_retries))
+
+        def check_links():
+            snapshot=self.health_snapshot()
+            if self.config['feng_out_type'] == 'xaui':
+                if not self.check_xaui_error(snapshot): raise RuntimeError("XAUI checks failed.")
+                if not self.check_xaui_sync(snapshot): raise RuntimeError("Fengines appear to be out of sync.")
+            if not self.check_10gbe_tx(snapshot): raise RuntimeError("10GbE cores are not transmitting properly.")
+            if not self.check_10gbe_rx(snapshot): raise RuntimeError("10GbE cores are not receiving properly.")
+            if self.config['feng_out_type'] == 'xaui':
+                if not self.check_loopback_mcnt_wait(n_retries=n_retries,snapshot=snapshot): raise RuntimeError("Loopback muxes didn't sync.")
+            if not self.check_x_miss(snapshot): raise RuntimeError("X engines are missing data.")
+
+        def check_vaccs():
+            self.acc_time_set()   #self.rst_status_and_count() is done as part of this setup
+            self.syslogger.info("Waiting up to %i seconds for an integration to finish so we can test the VACCs."%(3*self.config['int_time']+1))
+            self.vacc_dump_wait(timeout = 3*self.config['int_time']+1)
+            if not self.check_vacc():
+                def qdr_recal(fpga, nx):
+                    for x in range(self.config['x_per_fpga']):
+                        loop_retry_cnt=0
+                        while (fpga.qdr_status(x)['calfail']==True) and (loop_retry_cnt< n_retries):
+                            time.sleep(0.2)
+                            loop_retry_cnt+=1
+                            self.xloggers[nx].error("QDR%i calibration failed on Xengine%i. Forcing software reset/recalibration... retry %i"%(x,nx,loop_retry_cnt))
+                            fpga.qdr_rst(x)
+                        if fpga.qdr_status(x)['calfail']==True:
+                            raise RuntimeError("Could not calibrate QDR%i on X engine %i. VACC is broken."%(x,nx))
+                self.executor.starmap(self.xfpgas, qdr_recal, [(nx,) for nx in range(len(self.xfpgas))])
+
+        def spead_issue():
+            if send_spead:
+                self.spead_issue_all()
+
+        def output():
+            if config_output:
+                self.config_udp_output()
+            self.kitt_enable()
+
+        stages = [
+            ('program',         [],                                                             program),
+            ('tx_stop',         ['program'],                                                    tx_stop),
+            ('gbe_hold',        ['tx_stop'],                                                    gbe_hold),
+            ('arm',             ['gbe_hold'],                                                   arm),
+            ('clock_check',     ['arm'],                                                        check_clocks),
+            ('brd_id',          ['arm'],                                                        brd_id),
+            ('rf_gain',         ['arm'],                                                        rf_gain),
+            ('fft_shift',       ['brd_id'],                                                     self.fft_shift_set_all),
+            ('eq',              ['brd_id'],                                                     eq),
+            ('gbe_config',      ['fft_shift', 'eq'],                                            gbe_config),
+            ('gbe_release',     ['gbe_config', 'rf_gain'],                                      gbe_release),
+            ('feng_check',      ['gbe_release', 'clock_check'],                                 check_fengs),
+            ('link_check',      ['feng_check'],                                                 check_links),
+            ('vacc_check',      ['link_check'],                                                 check_vaccs),
+            ('spead_issue',     ['vacc_check'],                                                 spead_issue),
+            ('output',          ['spead_issue'],                                                output)]
 
+        start_time = time.time()
+        self.init_timings = threaded.run_stage_graph(stages, logger = self.syslogger)
+        for name, deps, function in stages:
+            self.syslogger.info("Initialisation stage %s took %.2fs." % (name, self.init_timings[name]))
+        self.syslogger.info("Initialisation completed in %.2fs." % (time.time() - start_time))
+        return self.init_timings
+
+    def gbe_arp_wait(self, timeout = 30, poll_period = 0.5):
+        """Waits until the ARP tables of the X engines' 10GbE cores (and the F engines', if they send over 10GbE) hold the MAC address of every X engine 10GbE core.
+        Returns True if they had all filled within timeout seconds, otherwise logs the cores that are still missing entries and returns False."""
+        x_ips = []
+        for f in range(len(self.xfpgas)):
+            for x in range(self.config['n_xaui_ports_per_xfpga']):
+                x_ips.append(self.get_roach_gbe_conf(self.config['10gbe_ip'], f*self.config['n_xaui_ports_per_xfpga']+x, self.config['10gbe_port'])[1])
+        fpgas = []
+        cores = []
+        loggers = []
         if self.config['feng_out_type'] == '10gbe':
-            self.gbe_reset_release_f()
-        self.gbe_reset_release_x()
-
-        time.sleep(len(self.xfpgas)/2)
-        self.rst_status_and_count()
-        time.sleep(1)
-
-        stat=self.check_all(details=True)
-        for in_n,ant_str in enumerate(self.config._get_ant_mapping_list()):
-            ffpga_n,xfpga_n,fxaui_n,xxaui_n,feng_input = self.get_ant_str_location(ant_str)
-            if (stat[ant_str]['adc_disabled']==True) or (stat[ant_str]['adc_overrange']==True):
-                self.floggers[ffpga_n].warn("%s input levels are too high!"%ant_str)
-            if self.is_narrowband():
-                if stat[ant_str]['coarse_fft_overrange']==True:
-                    self.floggers[ffpga_n].error("%s coarse FFT is overranging. Spectrum output is garbage."%ant_str)
-                if stat[ant_str]['fine_fft_overrange']==True:
-                    self.floggers[ffpga_n].error("%s fine FFT is overranging. Spectrum output is garbage."%ant_str)
-            else:
-                if stat[ant_str]['fft_overrange']==True:
-                    self.floggers[ffpga_n].error("%s FFT is overranging. Spectrum output is garbage."%ant_str)
-
-            # This is not quite right... Both ROACH's QDRs are used in a single corner-turn for both inputs. HARDCODED to check two QDRs per board!
-            if stat[ant_str]['ct_error']==True:
-                self.floggers[ffpga_n].error("Corner-Turn for input %s is in error."%ant_str)
-                for qdr_n in range(2):
-                    loop_retry_cnt=0
-                    while (c.ffpgas[ffpga_n].qdr_status(qdr_n)['calfail']==True) and (loop_retry_cnt< n_retries):
-                        time.sleep(0.2)
-                        loop_retry_cnt+=1
-                        self.floggers[ffpga_n].error("SRAM calibration on input %s failed. Forcing software reset/recalibration... retry %i"%(ant_str,loop_retry_cnt))
-                        c.ffpgas[ffpga_n].qdr_rst(qdr_n)
-                    if c.ffpgas[ffpga_n].qdr_status(qdr_n)['calfail']==True:
-                        self.floggers[ffpga_n].error("Could not calibrate Fengine QDR%i on input %s after %i retries. Giving up."%(qdr_n,ant_str,n_retries))
-                        raise RuntimeError("Could not calibrate Fengine QDR%i on input %s after %i retries. Giving up."%(qdr_n,ant_str,n_retries))
-
-        if self.config['feng_out_type'] == 'xaui':
-            if not self.check_xaui_error(): raise RuntimeError("XAUI checks failed.")
-            if not self.check_xaui_sync(): raise RuntimeError("Fengines appear to be out of sync.")
-        if not self.check_10gbe_tx(): raise RuntimeError("10GbE cores are not transmitting properly.")
-        if not self.check_10gbe_rx(): raise RuntimeError("10GbE cores are not receiving properly.")
-        if self.config['feng_out_type'] == 'xaui':
-            if not self.check_loopback_mcnt_wait(n_retries=n_retries): raise RuntimeError("Loopback muxes didn't sync.")
-        if not self.check_x_miss(): raise RuntimeError("X engines are missing data.")
-        self.acc_time_set()   #self.rst_status_and_count() is done as part of this setup
-        self.syslogger.info("Waiting %i seconds for an integration to finish so we can test the VACCs."%self.config['int_time'])
-        time.sleep(2*self.config['int_time']+0.1)
-        if not self.check_vacc():
-            for x in range(self.config['x_per_fpga']):
-                for nx,xsrv in enumerate(self.xsrvs):
-                    loop_retry_cnt=0
-                    while (self.xfpgas[nx].qdr_status(x)['calfail']==True) and (loop_retry_cnt< n_retries):
-                        time.sleep(0.2)
-                        loop_retry_cnt+=1
-                        self.xloggers[nx].error("QDR%i calibration failed on Xengine%i. Forcing software reset/recalibration... retry %i"%(x,nx,loop_retry_cnt))
-                        self.xfpgas[nx].qdr_rst(x)
-                    if self.xfpgas[nx].qdr_status(x)['calfail']==True:
-                        raise RuntimeError("Could not calibrate QDR%i on X engine %i. VACC is broken."%(x,nx))
-
-
-        if send_spead:
-            self.spead_issue_all()
-
-        if config_output:
-            self.config_udp_output()
-
-        self.kitt_enable()
-        self.syslogger.info("Initialisation completed.")
+            fpgas.extend(self.ffpgas)
+            cores.extend([['gbe%i'%fc for fc in range(self.config['n_xaui_ports_per_ffpga'])] for fpga in self.ffpgas])
+            loggers.extend(self.floggers)
+        fpgas.extend(self.xfpgas)
+        cores.extend([['gbe%i'%x for x in range(self.config['n_xaui_ports_per_xfpga'])] for fpga in self.xfpgas])
+        loggers.extend(self.xloggers)
+        def arp_missing(fpga, devs):
+            rv = {}
+            for dev in devs:
+                # the ARP table starts at 0x3000 in the core, one 64-bit entry per address in the subnet
+                arp = struct.unpack('>256Q', fpga.read(dev, 256*8, 0x3000))
+                my_ip = struct.unpack('>I', fpga.read(dev, 4, 0x10))[0]
+                rv[dev] = [ip for ip in x_ips if (ip != my_ip) and ((arp[ip & 255] & ((1<<48)-1)) in [0, (1<<48)-1])]
+            return rv
+        deadline = time.time() + timeout
+        while True:
+            missing = self.executor.starmap(fpgas, arp_missing, [(devs,) for devs in cores])
+            n_missing = sum([sum([len(ips) for ips in m.values()]) for m in missing])
+            if n_missing == 0:
+                self.syslogger.info("All 10GbE ARP tables are populated.")
+                return True
+            if time.time() > deadline:
+                for fn, m in enumerate(missing):
+                    for dev, ips in m.iteritems():
+                        if len(ips) > 0:
+                            loggers[fn].warn("%s ARP table is missing %s." % (dev, ', '.join([ip2str(ip) for ip in ips])))
+                self.syslogger.warn("10GbE ARP tables still missing %i entries after %.1fs." % (n_missing, timeout))
+                return False
+            time.sleep(poll_period)
+
+    def gbe_rx_wait(self, timeout = 10, poll_period = 0.2):
+        """Waits until every X engine 10GbE core has received some packets. Returns True if they all had within timeout seconds."""
+        ops = [('gbe_rx_cnt%i'%x, 0, None) for x in range(min(self.config['n_xaui_ports_per_xfpga'],self.config['x_per_fpga']))]
+        deadline = time.time() + timeout
+        while True:
+            cnts = self.executor.map(self.xfpgas, katcp_wrapper.FpgaClient.batch, ops)
+            if min([min(c) for c in cnts] + [1]) > 0:
+                self.syslogger.info("All X engine 10GbE cores are receiving data.")
+                return True
+            if time.time() > deadline:
+                self.syslogger.warn("Some X engine 10GbE cores have not received any data after %.1fs." % timeout)
+                return False
+            time.sleep(poll_period)
+
+    def vacc_dump_wait(self, timeout = 10, poll_period = 0.2):
+        """Waits until every X engine's vector accumulators have dumped at least once more. Returns True if they all had within timeout seconds."""
+        ops = [('vacc_cnt%i'%x, 0, None) for x in range(self.config['x_per_fpga'])]
+        before = self.executor.map(self.xfpgas, katcp_wrapper.FpgaClient.batch, ops)
+        deadline = time.time() + timeout
+        while True:
+            time.sleep(poll_period)
+            now = self.executor.map(self.xfpgas, katcp_wrapper.FpgaClient.batch, ops)
+            if False not in [(n != b) for nx in range(len(now)) for n, b in zip(now[nx], before[nx])]:
+                return True
+            if time.time() > deadline:
+                self.syslogger.warn("Some vector accumulators have not dumped after %.1fs." % timeout)
+                return False
 
     def gbe_reset_hold_x(self):
         """ Places the 10gbe core in reset. ALSO DISABLES ANY DATA OUTPUT TO THE CORE."""
@@ -563,8 +835,9 @@ class Correlator(object):
             self.xeng_ctrl_set_all(gbe_out_enable = False)
             self.syslogger.info("Correlator output paused.")
             if spead_stop:
-                tx_temp = spead.Transmitter(spead.TransportUDPtx(self.config['rx_meta_ip_str'], self.config['rx_udp_port']))
-                tx_temp.end()
+                for port in self.rx_udp_ports():
+                    tx_temp = spead.Transmitter(spead.TransportUDPtx(self.config['rx_meta_ip_str'], port))
+                    tx_temp.end()
                 self.syslogger.info("Sent SPEAD end-of-stream notification.")
             else:
                 self.syslogger.info("Did not send SPEAD end-of-stream notification.")
@@ -784,17 +1057,53 @@ class Correlator(object):
     def xeng_clks_get(self):
         """Returns the approximate clock rate of each X engine FPGA in MHz."""
         #tested ok corr-0.5.0 2010-07-19
-        return [fpga.est_brd_clk() for fpga in self.xfpgas]
+        return self.executor.map(self.xfpgas, katcp_wrapper.FpgaClient.est_brd_clk)
 
     def feng_clks_get(self):
         """Returns the approximate clock rate of each F engine FPGA in MHz."""
         #tested ok corr-0.5.0 2010-07-19
-        return [fpga.est_brd_clk() for fpga in self.ffpgas]
+        return self.executor.map(self.ffpgas, katcp_wrapper.FpgaClient.est_brd_clk)
+
+    def health_snapshot(self, gap = 0.01):
+        """Reads every register the health checks need from all boards in one concurrent, batched sweep, then re-reads the free-running counters after gap seconds in a second sweep.
+        The check_* methods and check_all take the result as their snapshot argument, so a full health check costs two parallel round-trips.
+        Returns a dictionary with keys 'f' and 'x', lists of {register_name: value} per F and X engine board for the first sweep, 'f_rate' and 'x_rate', the same for the second sweep, and 'time', when the first sweep was started."""
+        xaui = (self.config['feng_out_type'] == 'xaui')
+        n_rx = min(self.config['n_xaui_ports_per_xfpga'],self.config['x_per_fpga'])
+        f_regs = ['fstatus%i'%i for i in range(self.config['f_inputs_per_fpga'])]
+        f_rate_regs = []
+        if self.config['feng_out_type'] == '10gbe':
+            f_rate_regs += ['gbe_tx_cnt%i'%x for x in range(self.config['n_xaui_ports_per_ffpga'])]
+        x_regs = []
+        for x in range(self.config['x_per_fpga']):
+            x_regs += ['xstatus%i'%x, 'pkt_reord_err%i'%x, 'pkt_reord_cnt%i'%x, 'vacc_err_cnt%i'%x, 'vacc_cnt%i'%x]
+        x_rate_regs = ['gbe_rx_cnt%i'%x for x in range(n_rx)]
+        if xaui:
+            for x in range(self.config['n_xaui_ports_per_xfpga']):
+                x_regs += ['xaui_cnt%i'%x, 'xaui_err%i'%x, 'xaui_sync_mcnt%i'%x]
+            x_rate_regs += ['gbe_tx_cnt%i'%x for x in range(self.config['n_xaui_ports_per_xfpga'])]
+            x_rate_regs += ['loopback_mux%i_mcnt'%x for x in range(n_rx)]
+        fpgas = self.ffpgas + self.xfpgas
+        n_f = len(self.ffpgas)
+        def sweep(f_names, x_names):
+            names = [f_names]*n_f + [x_names]*len(self.xfpgas)
+            values = self.executor.starmap(fpgas, katcp_wrapper.FpgaClient.batch, [([(name, 0, None) for name in n],) for n in names])
+            rv = [dict(zip(names[b], values[b])) for b in range(len(fpgas))]
+            return rv[:n_f], rv[n_f:]
+        rv = {'time': time.time()}
+        rv['f'], rv['x'] = sweep(f_regs + f_rate_regs, x_regs + x_rate_regs)
+        time.sleep(gap)
+        rv['f_rate'], rv['x_rate'] = sweep(f_rate_regs, x_rate_regs)
+        return rv
 
     def check_katcp_connections(self):
         """Returns a boolean result of a KATCP ping to all all connected boards."""
         result = True
         for fn,fpga in enumerate(self.allfpgas):
+            if not fpga.is_connected():
+                self.loggers[fn].error('KATCP connection failure: not connected.')
+                result = False
+                continue
             try:
                 fpga.ping()
                 self.loggers[fn].info('KATCP connection ok.')
@@ -805,12 +1114,13 @@ class Correlator(object):
         else: self.syslogger.error('KATCP communication with one or more boards FAILED.')
         return result
 
-    def check_x_miss(self):
-        """Returns boolean pass/fail to indicate if any X engine has missed any data, or if the descrambler is stalled."""
+    def check_x_miss(self, snapshot = None):
+        """Returns boolean pass/fail to indicate if any X engine has missed any data, or if the descrambler is stalled. Registers are taken from snapshot (see health_snapshot) if given, else from a new one."""
+        if snapshot == None: snapshot = self.health_snapshot()
         rv = True
         for x in range(self.config['x_per_fpga']):
-            err_check = self.xread_uint_all('pkt_reord_err%i' % x)
-            cnt_check = self.xread_uint_all('pkt_reord_cnt%i' % x)
+            err_check = [regs['pkt_reord_err%i' % x] for regs in snapshot['x']]
+            cnt_check = [regs['pkt_reord_cnt%i' % x] for regs in snapshot['x']]
             for xbrd, xsrv in enumerate(self.xsrvs):
                 if (err_check[xbrd] != 0) or (cnt_check[xbrd] == 0) :
                     self.xloggers[xbrd].error("Data error on this xeng(%i,%i) - %s %s." % (x, xbrd, "(ERR == %8i, 0b%s != 0)" % (err_check[xbrd], numpy.binary_repr(err_check[xbrd],32)) if err_check[xbrd] != 0 else "", "(CNT==0)" if cnt_check[xbrd] == 0 else ""))
@@ -823,15 +1133,16 @@ class Correlator(object):
             self.syslogger.error("Some Xeng data missing.")
         return rv
 
-    def check_xaui_error(self):
+    def check_xaui_error(self, snapshot = None):
         """Returns a boolean indicating if any X engines have bad incomming XAUI links.
-        Checks that data is flowing and that no errors have occured. Returns True/False."""
+        Checks that data is flowing and that no errors have occured. Returns True/False. Registers are taken from snapshot (see health_snapshot) if given, else from a new one."""
         if self.config['feng_out_type'] != 'xaui':
             raise RuntimeError("According to your config file, you don't have any XAUI cables connected to your F engines!")
+        if snapshot == None: snapshot = self.health_snapshot()
         rv = True
         for x in range(self.config['n_xaui_ports_per_xfpga']):
-            cnt_check = self.xread_uint_all('xaui_cnt%i'%(x))
-            err_check = self.xread_uint_all('xaui_err%i'%x)
+            cnt_check = [regs['xaui_cnt%i'%x] for regs in snapshot['x']]
+            err_check = [regs['xaui_err%i'%x] for regs in snapshot['x']]
             for f in range(self.config['n_ants']/self.config['n_ants_per_xaui']/self.config['n_xaui_ports_per_xfpga']):
                 if (cnt_check[f] == 0):
                     rv=False
@@ -846,14 +1157,14 @@ class Correlator(object):
         else: self.syslogger.error("Some bad XAUI links here.")
         return rv
 
-    def check_10gbe_tx(self):
-        """Checks that the 10GbE cores are transmitting data. Outputs boolean good/bad."""
+    def check_10gbe_tx(self, snapshot = None):
+        """Checks that the 10GbE cores are transmitting data. Outputs boolean good/bad. Registers are taken from snapshot (see health_snapshot) if given, else from a new one."""
+        if snapshot == None: snapshot = self.health_snapshot()
         rv=True
         if self.config['feng_out_type'] == 'xaui':
             for x in range(self.config['n_xaui_ports_per_xfpga']):
-                firstpass_check = self.xread_uint_all('gbe_tx_cnt%i'%x)
-                time.sleep(0.01)
-                secondpass_check = self.xread_uint_all('gbe_tx_cnt%i'%x)
+                firstpass_check = [regs['gbe_tx_cnt%i'%x] for regs in snapshot['x']]
+                secondpass_check = [regs['gbe_tx_cnt%i'%x] for regs in snapshot['x_rate']]
 
                 for f in range(self.config['n_ants']/self.config['n_ants_per_xaui']/self.config['n_xaui_ports_per_xfpga']):
                     if (secondpass_check[f] == 0) or (secondpass_check[f] == firstpass_check[f]):
@@ -862,7 +1173,7 @@ class Correlator(object):
                     else:
                         self.xloggers[f].info('10GbE core %i is sending data.'%(x))
         elif self.config['feng_out_type'] == '10gbe':
-            stat=self.feng_status_get_all()
+            stat=self.feng_status_get_all(snapshot)
             for in_n,ant_str in enumerate(self.config._get_ant_mapping_list()):
                 ffpga_n,xfpga_n,fxaui_n,xxaui_n,feng_input = self.get_ant_str_location(ant_str)
                 if stat[(ant_str)]['xaui_lnkdn'] == True:
@@ -872,9 +1183,8 @@ class Correlator(object):
                     self.floggers[ffpga_n].error('10GbE core %i for antenna %s is overflowing.'%(fxaui_n,ant_str))
                     rv = False
             for x in range(self.config['n_xaui_ports_per_ffpga']):
-                firstpass_check = self.fread_uint_all('gbe_tx_cnt%i'%x)
-                time.sleep(0.01)
-                secondpass_check = self.fread_uint_all('gbe_tx_cnt%i'%x)
+                firstpass_check = [regs['gbe_tx_cnt%i'%x] for regs in snapshot['f']]
+                secondpass_check = [regs['gbe_tx_cnt%i'%x] for regs in snapshot['f_rate']]
                 for f in range(self.config['n_ffpgas']):
                     if (secondpass_check[f] == 0) or (secondpass_check[f] == firstpass_check[f]):
                         self.floggers[f].error('10GbE core %i is not sending any data.'%(x))
@@ -888,13 +1198,13 @@ class Correlator(object):
         else: self.syslogger.error("Some 10GbE cores aren't sending data.")
         return rv
 
-    def check_10gbe_rx(self):
-        """Checks that all the 10GbE cores are receiving packets."""
+    def check_10gbe_rx(self, snapshot = None):
+        """Checks that all the 10GbE cores are receiving packets. Registers are taken from snapshot (see health_snapshot) if given, else from a new one."""
+        if snapshot == None: snapshot = self.health_snapshot()
         rv=True
         for x in range(min(self.config['n_xaui_ports_per_xfpga'],self.config['x_per_fpga'])):
-            firstpass_check = self.xread_uint_all('gbe_rx_cnt%i'%x)
-            time.sleep(0.01)
-            secondpass_check = self.xread_uint_all('gbe_rx_cnt%i'%x)
+            firstpass_check = [regs['gbe_rx_cnt%i'%x] for regs in snapshot['x']]
+            secondpass_check = [regs['gbe_rx_cnt%i'%x] for regs in snapshot['x_rate']]
             for s,xsrv in enumerate(self.xsrvs):
                 if (secondpass_check[s] == 0):
                     rv=False
@@ -927,34 +1237,48 @@ class Correlator(object):
         header['x_eng'] = header['freq_chan'] / (self.config['n_chans'] / self.config['n_xeng'])
         return header
 
-    def check_loopback_mcnt_wait(self,n_retries=40):
-        """Waits up to n_retries for loopback muxes to sync before returning false if it is still failing."""
+    def loopback_mcnt_snapshot(self, gap = 0.01):
+        """Reads just the loopback mux mcnt registers from all X engine boards, twice, gap seconds apart, in the form health_snapshot returns them.
+        Cheaper than a full health_snapshot when only check_loopback_mcnt is needed."""
+        names = ['loopback_mux%i_mcnt'%x for x in range(min(self.config['n_xaui_ports_per_xfpga'],self.config['x_per_fpga']))]
+        def sweep():
+            values = self.executor.map(self.xfpgas, katcp_wrapper.FpgaClient.batch, [(name, 0, None) for name in names])
+            return [dict(zip(names, v)) for v in values]
+        rv = {'time': time.time()}
+        rv['x'] = sweep()
+        time.sleep(gap)
+        rv['x_rate'] = sweep()
+        return rv
+
+    def check_loopback_mcnt_wait(self,n_retries=40,snapshot=None):
+        """Waits up to n_retries for loopback muxes to sync before returning false if it is still failing. The first check uses snapshot (see health_snapshot) if given.
+        Retries only re-read the loopback registers (see loopback_mcnt_snapshot)."""
         sys.stdout.flush()
-        loopback_ok=self.check_loopback_mcnt()
+        loopback_ok=self.check_loopback_mcnt(snapshot)
         loop_retry_cnt=0
         while (not loopback_ok) and (loop_retry_cnt< n_retries):
             time.sleep(1)
             loop_retry_cnt+=1
             self.syslogger.info("waiting for loopback lock... %i tries so far."%loop_retry_cnt)
             sys.stdout.flush()
-            loopback_ok=self.check_loopback_mcnt()
-        if self.check_loopback_mcnt():
+            loopback_ok=self.check_loopback_mcnt(self.loopback_mcnt_snapshot())
+        if loopback_ok:
             self.syslogger.info("loopback lock achieved after %i tries."%loop_retry_cnt)
             return True
         else:
             self.syslogger.error("Failed to achieve loopback lock after %i tries."%n_retries)
             return False
 
-    def check_loopback_mcnt(self):
-        """Checks to see if the mux_pkts block has become stuck waiting for a crazy mcnt Returns boolean true/false."""
+    def check_loopback_mcnt(self, snapshot = None):
+        """Checks to see if the mux_pkts block has become stuck waiting for a crazy mcnt Returns boolean true/false. Registers are taken from snapshot (see health_snapshot) if given, else from a new one."""
+        if snapshot == None: snapshot = self.health_snapshot()
         rv=True
         for x in range(min(self.config['n_xaui_ports_per_xfpga'],self.config['x_per_fpga'])):
-            firstpass_check = self.xread_all('loopback_mux%i_mcnt'%x,4)
-            time.sleep(0.01)
-            secondpass_check = self.xread_all('loopback_mux%i_mcnt'%x,4)
+            firstpass_check = [regs['loopback_mux%i_mcnt'%x] for regs in snapshot['x']]
+            secondpass_check = [regs['loopback_mux%i_mcnt'%x] for regs in snapshot['x_rate']]
             for f in range(self.config['n_ants']/self.config['n_ants_per_xaui']/self.config['n_xaui_ports_per_xfpga']):
-                firstloopmcnt,firstgbemcnt=struct.unpack('>HH',firstpass_check[f])
-                secondloopmcnt,secondgbemcnt=struct.unpack('>HH',secondpass_check[f])
+                firstloopmcnt,firstgbemcnt=(firstpass_check[f] >> 16),(firstpass_check[f] & 0xffff)
+                secondloopmcnt,secondgbemcnt=(secondpass_check[f] >> 16),(secondpass_check[f] & 0xffff)
 
                 if (secondgbemcnt == firstgbemcnt):
                     self.xloggers[f].error('10GbE input on GbE port %i is stalled.' %(x))
@@ -971,12 +1295,13 @@ class Correlator(object):
         else: self.syslogger.error("Some loopback muxes aren't locked.")
         return rv
 
-    def check_vacc(self):
-        """Returns boolean pass/fail to indicate if any X engine has vector accumulator errors."""
+    def check_vacc(self, snapshot = None):
+        """Returns boolean pass/fail to indicate if any X engine has vector accumulator errors. Registers are taken from snapshot (see health_snapshot) if given, else from a new one."""
+        if snapshot == None: snapshot = self.health_snapshot()
         rv = True
         for x in range(self.config['x_per_fpga']):
-            err_check = self.xread_uint_all('vacc_err_cnt%i'%(x))
-            cnt_check = self.xread_uint_all('vacc_cnt%i'%(x))
+            err_check = [regs['vacc_err_cnt%i'%x] for regs in snapshot['x']]
+            cnt_check = [regs['vacc_cnt%i'%x] for regs in snapshot['x']]
             for nx,xsrv in enumerate(self.xsrvs):
                 if (err_check[nx] !=0):
                     self.xloggers[nx].error("Vector accumulator errors on my X engine %i."%(x))
@@ -990,11 +1315,13 @@ class Correlator(object):
         else: self.syslogger.error("Some vector accumulator problems detected.")
         return rv
 
-    def check_all(self,clock_check=False,basic_check=True,details=False):
-        """Checks system health. 'basic_check' disables the checks of x engine counters to ensure that data is actually flowing. If 'details' is true, return a dictionary of results for each engine in the system. If details is false, returns boolean true if the system is operating nominally or boolean false if something's wrong."""
+    def check_all(self,clock_check=False,basic_check=True,details=False,n_retries=40):
+        """Checks system health. 'basic_check' disables the checks of x engine counters to ensure that data is actually flowing. If 'details' is true, return a dictionary of results for each engine in the system. If details is false, returns boolean true if the system is operating nominally or boolean false if something's wrong.
+        All the checks are evaluated from a single health_snapshot. 'n_retries' limits how many further snapshots are taken waiting for the loopback muxes to sync."""
+        snapshot=self.health_snapshot()
         rv={'sys':{'lru_state':'ok'}}
-        rv.update(self.feng_status_get_all())
-        rv.update(self.xeng_status_get_all())
+        rv.update(self.feng_status_get_all(snapshot))
+        rv.update(self.xeng_status_get_all(snapshot))
 
         for b,s in rv.iteritems():
             if s['lru_state']=='fail': rv['sys']['lru_state']='warn'
@@ -1004,13 +1331,13 @@ class Correlator(object):
 
         if not basic_check:
             if self.config['feng_out_type'] == 'xaui':
-                if not self.check_xaui_error(): rv['sys']['lru_state']='fail'
-                if not self.check_xaui_sync(): rv['sys']['lru_state']='fail'
-            if not self.check_10gbe_tx(): rv['sys']['lru_state']='fail'
-            if not self.check_10gbe_rx(): rv['sys']['lru_state']='fail'
+                if not self.check_xaui_error(snapshot): rv['sys']['lru_state']='fail'
+                if not self.check_xaui_sync(snapshot): rv['sys']['lru_state']='fail'
+            if not self.check_10gbe_tx(snapshot): rv['sys']['lru_state']='fail'
+            if not self.check_10gbe_rx(snapshot): rv['sys']['lru_state']='fail'
             if self.config['feng_out_type'] == 'xaui':
-                if not self.check_loopback_mcnt_wait(n_retries=n_retries): rv['sys']['lru_state']='fail'
-            if not self.check_x_miss(): rv['sys']['lru_state']='fail'
+                if not self.check_loopback_mcnt_wait(n_retries=n_retries,snapshot=snapshot): rv['sys']['lru_state']='fail'
+            if not self.check_x_miss(snapshot): rv['sys']['lru_state']='fail'
         if details:
             return rv
         else:
@@ -1240,7 +1567,24 @@ class Correlator(object):
         Notes: \n
         DOES NOT ACCOUNT FOR WRAPPING MCNT.\n
         IS A ONCE-OFF UPDATE (no babysitting by software)\n"""
+        assert(len(coeffs)==self.config['n_inputs'])
+        load=self.fr_delay_upload_all(coeffs,ld_time)
+        self.fr_delay_check_all(load)
+        return load['act']
+        #return {
+        #    'act_delay': act_delay,
+        #    'act_fringe_offset': act_fringe_offset,
+        #    'act_fringe_rate': act_fringe_rate,
+        #    'act_delay_rate': act_delay_rate}
+
+    def fr_delay_upload_all(self,coeffs={},ld_time=-1):
+        """Uploads delay and fringe rotation coefficients for some or all inputs and arms them to load at ld_time, without waiting for the load.
+        Takes the same coeffs dictionary as fr_delay_set_all, but need not contain every input. Load time, in unix seconds, is optional; if not specified, load ASAP.\n
+        Raises a RuntimeError if the load time is too close to be met.\n
+        Returns a dictionary describing the pending load, to be handed to fr_delay_check_all. Its 'act' entry holds the actual values set for each input and 'ld_time' the load time in unix seconds."""
         #TODO: Test this function!
+        if len(coeffs) == 0:
+            raise RuntimeError("fr_delay_upload_all - No delay or fringe coefficients given. Nothing to load.")
 
         fine_delay_bits=16
         coarse_delay_bits=16
@@ -1250,29 +1594,18 @@ class Correlator(object):
 
         bitshift_schedule=23
 
-        min_ld_time = 0.05*self.config['n_inputs'] #assume we're able to set and check all the registers in 100ms
+        # the lead time is sized from the measured time to arm the loads on all the F engines rather than from the number of inputs
+        fr_delay_ld_factor = 2.0    # safety factor on the measured arm time
 
-        assert(len(coeffs)==self.config['n_inputs'])
         locs=[]
-        arm_cnt_before=[]
-        ld_cnt_before=[]
+        ant_strs=[]
         rv={}
-
-        #get the current system mcnt:
-        mcnt=self.mcnt_current_get(self.map_input_to_ant(0))
-        #figure out the load time
-        if ld_time < 0:
-            #figure out the load-time mcnt:
-            ld_mcnt=int(mcnt + self.config['mcnt_scale_factor']*(min_ld_time))
-        else:
-            if (ld_time < (time.time() + min_ld_time)):
-                log_runtimeerror(self.syslogger, "fr_delay_set_all - Cannot load at a time in the past.")
-            ld_mcnt=self.mcnt_from_time(ld_time)
-        if (ld_mcnt < (mcnt + self.config['mcnt_scale_factor']*min_ld_time)):
-            raise RuntimeError("fr_delay_set_all - This works out to a loadtime in the past!")
+        board_coeffs={}     # ffpga_n -> list of register writes
+        board_status={}     # ffpga_n -> list of (input index, feng_input) whose delay_tr_status to check
 
         for ant_str,ant_coeffs in coeffs.iteritems():
             locs.append(self.get_ant_str_location(ant_str))
+            ant_strs.append(ant_str)
             ffpga_n,xfpga_n,fxaui_n,xxaui_n,feng_input = locs[-1]
 
             delay=ant_coeffs['delay']
@@ -1294,11 +1627,6 @@ class Correlator(object):
             #figure out the fringe rate. Input is in cycles per second (Hz). 1) divide by brd clock rate to get cycles per clock. 2) multiply by 2**20
             fr_rate = int(float(fringe_rate) / self.config['feng_clk'] * (2**(bitshift_schedule + fringe_rate_bits-1)))
 
-
-            cnts=self.ffpgas[ffpga_n].read_uint('delay_tr_status%i'%feng_input)
-            arm_cnt_before.append(cnts>>16)
-            ld_cnt_before.append(cnts&0xffff)
-
             act_delay=(coarse_delay + float(fine_delay_i)/2**fine_delay_bits)/self.config['adc_clk']
             act_fringe_offset = float(fr_offset)/(2**fringe_offset_bits)*360
             act_fringe_rate = float(fr_rate)/(2**(fringe_rate_bits+bitshift_schedule-1))*self.config['feng_clk']
@@ -1336,55 +1664,126 @@ class Correlator(object):
             self.floggers[ffpga_n].debug('fr_delay_set_all - Fringe rate actually set to %e Hz.'%act_fringe_rate)
 
             #setup the delays:
-            self.ffpgas[ffpga_n].write_int('coarse_delay%i'%feng_input,coarse_delay)
-            self.floggers[ffpga_n].debug("fr_delay_set_all - Set a coarse delay of %i clocks."%coarse_delay)
             #fine delay (LSbs) is fraction of a cycle * 2^15 (16 bits allocated, signed integer).
             #increment fine_delay by MSbs much every FPGA clock cycle shifted 2**20???
-            self.ffpgas[ffpga_n].write('a1_fd%i'%feng_input,struct.pack('>hh',fine_delay_rate,fine_delay_i))
-            self.floggers[ffpga_n].debug("fr_delay_set_all - Wrote %4x to fine_delay and %4x to fine_delay_rate register a1_fd%i."%(fine_delay_i,fine_delay_rate,feng_input))
-
-            #print 'Coarse delay: %i, fine delay: %2.3f (%i), delay_rate: %2.2f (%i).'%(coarse_delay,fine_delay,fine_delay_i,delay_rate,fine_delay_rate)
-
             #setup the fringe rotation
             #LSbs is offset as a fraction of a cycle in fix_16_15 (1 = pi radians ; -1 = -1radians).
             #MSbs is fringe rate as fractional increment to fr_offset per FPGA clock cycle as fix_16.15. FPGA divides this rate by 2**20 internally.
-            self.ffpgas[ffpga_n].write('a0_fd%i'%feng_input,struct.pack('>hh',fr_rate,fr_offset))
-            self.floggers[ffpga_n].debug("fr_delay_set_all - Wrote %4x to fringe_offset and %4x to fringe_rate register a0_fd%i."%(fr_offset,fr_rate,feng_input))
-            #print 'Phase offset: %2.3f (%i), phase rate: %2.3f (%i).'%(fringe_phase,fr_offset,fringe_rate,fr_rate)
+            board_coeffs.setdefault(ffpga_n, []).extend([
+                ('coarse_delay%i'%feng_input, coarse_delay & 0xffffffff),
+                ('a1_fd%i'%feng_input, struct.unpack('>I', struct.pack('>hh',fine_delay_rate,fine_delay_i))[0]),
+                ('a0_fd%i'%feng_input, struct.unpack('>I', struct.pack('>hh',fr_rate,fr_offset))[0])])
+            board_status.setdefault(ffpga_n, []).append((len(locs) - 1, feng_input))
+            self.floggers[ffpga_n].debug("fr_delay_set_all - Input %i: coarse delay of %i clocks, wrote %4x to fine_delay and %4x to fine_delay_rate, %4x to fringe_offset and %4x to fringe_rate." % (feng_input, coarse_delay, fine_delay_i, fine_delay_rate, fr_offset, fr_rate))
+
+        boards = sorted(board_coeffs.keys())
+        fpgas = [self.ffpgas[ffpga_n] for ffpga_n in boards]
+
+        # upload the coefficients to all the boards at once, pipelined on each board, and read them back along with the arm and load counts.
+        # they only take effect once the load is armed below.
+        upload_ops = []
+        for ffpga_n in boards:
+            ops = [(reg, 0, val) for reg, val in board_coeffs[ffpga_n]]
+            ops.extend([(reg, 0, None) for reg, val in board_coeffs[ffpga_n]])
+            ops.extend([('delay_tr_status%i'%feng_input, 0, None) for input_n, feng_input in board_status[ffpga_n]])
+            upload_ops.append((ops,))
+        start_time = time.time()
+        upload_rv = self.executor.starmap(fpgas, katcp_wrapper.FpgaClient.batch, upload_ops)
+        upload_time = time.time() - start_time
+        arm_cnt_before = [None] * len(locs)
+        ld_cnt_before = [None] * len(locs)
+        for fn, ffpga_n in enumerate(boards):
+            n_coeffs = len(board_coeffs[ffpga_n])
+            readback = upload_rv[fn][n_coeffs:2*n_coeffs]
+            for (reg, val), rb in zip(board_coeffs[ffpga_n], readback):
+                if rb != val:
+                    log_runtimeerror(self.floggers[ffpga_n], 'fr_delay_set_all - Verification of write to %s on %s failed: wrote %08x, read back %08x.' % (reg, self.fsrvs[ffpga_n], val, rb))
+            for (input_n, feng_input), cnts in zip(board_status[ffpga_n], upload_rv[fn][2*n_coeffs:]):
+                arm_cnt_before[input_n] = cnts>>16
+                ld_cnt_before[input_n] = cnts&0xffff
+        self.syslogger.debug('fr_delay_set_all - Uploaded coefficients for %i inputs on %i boards in %.1fms.' % (len(locs), len(boards), upload_time*1000))
+
+        # arming is three writes per board. until we've timed it, the coefficient upload (a bigger batch) is a safe upper bound.
+        arm_time_est = self.fr_delay_arm_time if self.fr_delay_arm_time != None else upload_time
+        min_ld_time = fr_delay_ld_factor * arm_time_est + self.fr_delay_ld_margin
 
-            #set the load time:
-            self.ffpgas[ffpga_n].write_int('ld_time_lsw%i'%feng_input,(ld_mcnt&0xffffffff))
-            self.ffpgas[ffpga_n].write_int('ld_time_msw%i'%feng_input,(ld_mcnt>>32)|(1<<31))
-            self.ffpgas[ffpga_n].write_int('ld_time_msw%i'%feng_input,(ld_mcnt>>32)&0x7fffffff)
+        #get the current system mcnt:
+        mcnt=self.mcnt_current_get(ant_strs[0])
+        mcnt_read_time=time.time()
+        #figure out the load time
+        if ld_time < 0:
+            #figure out the load-time mcnt:
+            ld_mcnt=int(mcnt + self.config['mcnt_scale_factor']*(min_ld_time))
+        else:
+            if (ld_time < (time.time() + min_ld_time)):
+                log_runtimeerror(self.syslogger, "fr_delay_set_all - Cannot load at a time in the past.")
+            ld_mcnt=self.mcnt_from_time(ld_time)
+        if (ld_mcnt < (mcnt + self.config['mcnt_scale_factor']*min_ld_time)):
+            raise RuntimeError("fr_delay_set_all - This works out to a loadtime in the past!")
+
+        #set the load time on every input. MSb (load-it! bit) is edge triggered.
+        arm_ops = []
+        for ffpga_n in boards:
+            ops = []
+            for input_n, feng_input in board_status[ffpga_n]:
+                ops.append(('ld_time_lsw%i'%feng_input, 0, ld_mcnt&0xffffffff))
+                ops.append(('ld_time_msw%i'%feng_input, 0, (ld_mcnt>>32)|(1<<31)))
+                ops.append(('ld_time_msw%i'%feng_input, 0, (ld_mcnt>>32)&0x7fffffff))
+            arm_ops.append((ops,))
+        start_time = time.time()
+        self.executor.starmap(fpgas, katcp_wrapper.FpgaClient.batch, arm_ops)
+        arm_time = time.time() - start_time
+        self.fr_delay_arm_time = arm_time if self.fr_delay_arm_time == None else max(arm_time, 0.5 * (self.fr_delay_arm_time + arm_time))
+        self.syslogger.debug('fr_delay_set_all - Armed %i inputs in %.1fms with a lead time of %.1fms.' % (len(locs), arm_time*1000, min_ld_time*1000))
+
+        return {
+            'act': rv,
+            'ld_time': self.time_from_mcnt(ld_mcnt),
+            'ld_mcnt': ld_mcnt,
+            'mcnt': mcnt,
+            'mcnt_read_time': mcnt_read_time,
+            'ant_strs': ant_strs,
+            'boards': boards,
+            'board_status': board_status,
+            'arm_cnt_before': arm_cnt_before,
+            'ld_cnt_before': ld_cnt_before}
+
+    def fr_delay_check_all(self,load,wait=True):
+        """Checks that a load armed by fr_delay_upload_all happened, raising a RuntimeError if any input did not arm or load.
+        If wait is True, sleeps until the load time first."""
+        ld_mcnt=load['ld_mcnt']
+        ant_strs=load['ant_strs']
+        boards=load['boards']
+        board_status=load['board_status']
+        arm_cnt_before=load['arm_cnt_before']
+        ld_cnt_before=load['ld_cnt_before']
+        fpgas = [self.ffpgas[ffpga_n] for ffpga_n in boards]
 
         #check that they all loaded correctly:
         #wait 'till the time has elapsed
-        sleep_time=self.time_from_mcnt(ld_mcnt) - self.time_from_mcnt(mcnt)
+        sleep_time=self.time_from_mcnt(ld_mcnt) - self.time_from_mcnt(load['mcnt']) - (time.time() - load['mcnt_read_time'])
         #print 'waiting %2.3f seconds (now: %i, ldtime: %i)'%(sleep_time, self.time_from_mcnt(ld_mcnt),self.time_from_mcnt(mcnt))
-        time.sleep(sleep_time)
-
-        for input_n,(ffpga_n,xfpga_n,fxaui_n,xxaui_n,feng_input) in enumerate(locs):
-            cnts=self.ffpgas[ffpga_n].read_uint('delay_tr_status%i'%feng_input)
+        if wait and (sleep_time > 0):
+            time.sleep(sleep_time)
 
-            if (arm_cnt_before[input_n] == cnts>>16):
-                if (cnts>>16)==0:
-                    log_runtimeerror(self.floggers[ffpga_n], 'fr_delay_set_all - Ant %s (Feng %i on %s) appears to be held in master reset. Load failed.' % (self.map_input_to_ant(input_n),feng_input,self.fsrvs[ffpga_n]))
-                else:
-                    log_runtimeerror(self.floggers[ffpga_n], 'fr_delay_set_all - Ant %s (Feng %i on %s) did not arm. Load failed.'%(self.map_input_to_ant(input_n),feng_input,self.fsrvs[ffpga_n]))
-            if (ld_cnt_before[input_n] >= (cnts&0xffff)):
-                after_mcnt=self.mcnt_current_get(self.map_input_to_ant(input_n))
-                #print 'before: %i, target: %i, after: %i'%(mcnt,ld_mcnt,after_mcnt)
-                #print 'start: %10.3f, target: %10.3f, after: %10.3f'%(self.time_from_mcnt(mcnt),self.time_from_mcnt(ld_mcnt),self.time_from_mcnt(after_mcnt))
-                if after_mcnt > ld_mcnt:
-                    log_runtimeerror(self.floggers[ffpga_n], 'fr_delay_set_all - We missed loading the registers by about %4.1f ms.'%((after_mcnt-ld_mcnt)/self.config['mcnt_scale_factor']*1000))
-                else:
-                    log_runtimeerror(self.floggers[ffpga_n], 'fr_delay_set_all - Ant %s (Feng %i on %s) did not load correctly for an unknown reason.'%(ant_str,feng_input,self.fsrvs[ffpga_n]))
-        return rv
-        #return {
-        #    'act_delay': act_delay,
-        #    'act_fringe_offset': act_fringe_offset,
-        #    'act_fringe_rate': act_fringe_rate,
-        #    'act_delay_rate': act_delay_rate}
+        status_rv = self.executor.starmap(fpgas, katcp_wrapper.FpgaClient.batch,
+            [([('delay_tr_status%i'%feng_input, 0, None) for input_n, feng_input in board_status[ffpga_n]],) for ffpga_n in boards])
+        for fn, ffpga_n in enumerate(boards):
+            for (input_n, feng_input), cnts in zip(board_status[ffpga_n], status_rv[fn]):
+                if (arm_cnt_before[input_n] == cnts>>16):
+                    if (cnts>>16)==0:
+                        log_runtimeerror(self.floggers[ffpga_n], 'fr_delay_set_all - Ant %s (Feng %i on %s) appears to be held in master reset. Load failed.' % (ant_strs[input_n],feng_input,self.fsrvs[ffpga_n]))
+                    else:
+                        log_runtimeerror(self.floggers[ffpga_n], 'fr_delay_set_all - Ant %s (Feng %i on %s) did not arm. Load failed.'%(ant_strs[input_n],feng_input,self.fsrvs[ffpga_n]))
+                # the load counter is 16 bits, so compare modulo 2**16: an unchanged count means no load, even across a wrap
+                if (((cnts&0xffff) - ld_cnt_before[input_n]) & 0xffff) == 0:
+                    after_mcnt=self.mcnt_current_get(ant_strs[input_n])
+                    #print 'before: %i, target: %i, after: %i'%(mcnt,ld_mcnt,after_mcnt)
+                    #print 'start: %10.3f, target: %10.3f, after: %10.3f'%(self.time_from_mcnt(mcnt),self.time_from_mcnt(ld_mcnt),self.time_from_mcnt(after_mcnt))
+                    if after_mcnt > ld_mcnt:
+                        log_runtimeerror(self.floggers[ffpga_n], 'fr_delay_set_all - We missed loading the registers by about %4.1f ms.'%((after_mcnt-ld_mcnt)/self.config['mcnt_scale_factor']*1000))
+                    else:
+                        log_runtimeerror(self.floggers[ffpga_n], 'fr_delay_set_all - Ant %s (Feng %i on %s) did not load correctly for an unknown reason.'%(ant_strs[input_n],feng_input,self.fsrvs[ffpga_n]))
 
     def time_from_mcnt(self,mcnt):
         """Returns the unix time UTC equivalent to the input MCNT. Does NOT account for wrapping MCNT."""
@@ -1450,14 +1849,12 @@ class Correlator(object):
 
     def feng_brd_id_set(self):
         """Sets the F engine boards' antenna indices. (Numbers the board_id software register.)"""
-        for f,fpga in enumerate(self.ffpgas):
-            fpga.write_int('board_id', f)
+        self.executor.starmap(self.ffpgas, katcp_wrapper.FpgaClient.write_int, [('board_id', f) for f in range(len(self.ffpgas))])
         self.syslogger.info('F engine board IDs set ok.')
 
     def xeng_brd_id_set(self):
         """Sets the X engine boards' board_ids. This should not be necessary on newwer designs with XAUI links which extract this info from the 10GbE IP addresses."""
-        for f,fpga in enumerate(self.xfpgas):
-            fpga.write_int('board_id',f)
+        self.executor.starmap(self.xfpgas, katcp_wrapper.FpgaClient.write_int, [('board_id', f) for f in range(len(self.xfpgas))])
         self.syslogger.info('X engine board IDs set ok.')
 
 # This function is deprecated since ant_str introduced. use get_ant_str_location instead.
@@ -1509,22 +1906,19 @@ class Correlator(object):
 
     def config_roach_10gbe_ports(self):
         """Configures 10GbE ports on roach X (and F, if needed) engines for correlator data exchange using TGTAP."""
-        if self.config['feng_out_type'] == '10gbe':
-            self.fwrite_int_all('gbe_port', self.config['10gbe_port'])
-            for fn,fpga in enumerate(self.ffpgas):
-                for fc in range(self.config['n_xaui_ports_per_ffpga']):
-                    start_addr=self.config['10gbe_ip']-(self.config['n_xaui_ports_per_ffpga'] * self.config['n_feng'])
-                    start_port=self.config['10gbe_port']
-                    mac,ip,port=self.get_roach_gbe_conf(start_addr,(fn*self.config['n_xaui_ports_per_ffpga']+fc),start_port)
-                    fpga.tap_start('gbe%i'%fc,'gbe%i'%fc,mac,ip,port)
-                    # THIS LINE SHOULD NOT BE REQUIRED WITH DAVE'S UPCOMING 10GBE CORE MODS
-                    # Set the Xengines' starting IP address.
-                    fpga.write_int('gbe_ip%i'%fc, self.config['10gbe_ip'])
-                    self.floggers[fn].info("Configured gbe%i core's IP address to %s"%(fc,ip2str(ip)))
-        else:
-            self.xwrite_int_all('gbe_port', self.config['10gbe_port'])
+        # each board is configured in its own thread
+        def config_f(fpga, fn):
+            for fc in range(self.config['n_xaui_ports_per_ffpga']):
+                start_addr=self.config['10gbe_ip']-(self.config['n_xaui_ports_per_ffpga'] * self.config['n_feng'])
+                start_port=self.config['10gbe_port']
+                mac,ip,port=self.get_roach_gbe_conf(start_addr,(fn*self.config['n_xaui_ports_per_ffpga']+fc),start_port)
+                fpga.tap_start('gbe%i'%fc,'gbe%i'%fc,mac,ip,port)
+                # THIS LINE SHOULD NOT BE REQUIRED WITH DAVE'S UPCOMING 10GBE CORE MODS
+                # Set the Xengines' starting IP address.
+                fpga.write_int('gbe_ip%i'%fc, self.config['10gbe_ip'])
+                self.floggers[fn].info("Configured gbe%i core's IP address to %s"%(fc,ip2str(ip)))
 
-        for f,fpga in enumerate(self.xfpgas):
+        def config_x(fpga, f):
             for x in range(self.config['n_xaui_ports_per_xfpga']):
                 start_addr=self.config['10gbe_ip']
                 start_port=self.config['10gbe_port']
@@ -1535,6 +1929,20 @@ class Correlator(object):
                 # Assign an IP address to each XAUI port's associated 10GbE core.
                 if self.config['feng_out_type'] == 'xaui':
                     fpga.write_int('gbe_ip%i'%x, ip)
+
+        if self.config['feng_out_type'] == '10gbe':
+            self.fwrite_int_all('gbe_port', self.config['10gbe_port'])
+            fpgas = self.ffpgas + self.xfpgas
+            args = [(config_f, fn) for fn in range(len(self.ffpgas))] + [(config_x, f) for f in range(len(self.xfpgas))]
+        else:
+            self.xwrite_int_all('gbe_port', self.config['10gbe_port'])
+            fpgas = self.xfpgas
+            args = [(config_x, f) for f in range(len(self.xfpgas))]
+        # each board's register writes are read back together, in one pipelined pass, once it is configured
+        def config_board(fpga, config, n):
+            with fpga.write_verify('deferred'):
+                config(fpga, n)
+        self.executor.starmap(fpgas, config_board, args)
         self.syslogger.info('All 10GbE cores configured.')
 
 #    def config_roach_10gbe_ports_static(self):
@@ -1556,8 +1964,10 @@ class Correlator(object):
 #                # Assign an IP address to each XAUI port's associated 10GbE core.
 #                fpga.write_int('gbe_ip%i'%x, ip)
 
-    def config_udp_output(self, dest_ip_str=None, dest_port=None):
-        """Configures the destination IP and port for X engine output. dest_port and dest_ip are optional parameters to override the config file defaults. dest_ip is string in dotted-quad notation."""
+    def config_udp_output(self, dest_ip_str=None, dest_port=None, per_board_ports=None):
+        """Configures the destination IP and port for X engine output. dest_port and dest_ip are optional parameters to override the config file defaults. dest_ip is string in dotted-quad notation.
+        If per_board_ports is True, X engine board n sends to dest_port+n instead, so that a receiver can spread the boards over several processes (see rx.CorrRx's inter_mp mode). SPEAD metadata is then sent to every one of these ports.
+        per_board_ports defaults to the last setting, initially False."""
         if dest_ip_str==None:
             dest_ip_str=self.config['rx_udp_ip_str']
         else:
@@ -1571,12 +1981,18 @@ class Correlator(object):
         else:
             self.config['rx_udp_port']=dest_port
 
+        if per_board_ports != None:
+            self.rx_udp_port_per_board = per_board_ports
+
         self.xwrite_int_all('gbe_out_ip',struct.unpack('>L',socket.inet_aton(dest_ip_str))[0])
-        self.xwrite_int_all('gbe_out_port',dest_port)
-        self.syslogger.info("Correlator output configured to %s:%i." % (dest_ip_str, dest_port))
+        ports = self.rx_udp_ports()
+        self.executor.starmap(self.xfpgas, katcp_wrapper.FpgaClient.write_int, [('gbe_out_port', ports[f % len(ports)]) for f in range(len(self.xfpgas))])
+        self.syslogger.info("Correlator output configured to %s:%s." % (dest_ip_str, ','.join([str(port) for port in ports])))
 
-        # need a new spead transmitter if the port and ip have changed
+        # need a new spead transmitter if the port and ip have changed, and the new destination has seen none of our metadata
         self.spead_tx = spead.Transmitter(spead.TransportUDPtx(self.config['rx_meta_ip_str'], self.config['rx_udp_port']))
+        self._spead_tx_boards = [spead.Transmitter(spead.TransportUDPtx(self.config['rx_meta_ip_str'], port)) for port in ports[1:]]
+        self._spead_sent = {}
 
         #self.xwrite_int_all('gbe_out_pkt_len',self.config['rx_pkt_payload_len']) now a compile-time option
 
@@ -1587,6 +2003,12 @@ class Correlator(object):
         #        mac,ip,port=self.get_roach_gbe_conf(ip_offset,(f*self.config['n_xaui_ports_per_xfpga']+x),self.config['rx_udp_port'])
         #        fpga.tap_start('gbe_out%i'%x,mac,ip,port)
 
+    def rx_udp_ports(self):
+        """Returns the list of UDP ports the X engine output is sent to: just rx_udp_port, or one port per X engine board if rx_udp_port_per_board is set."""
+        if self.rx_udp_port_per_board:
+            return [self.config['rx_udp_port'] + f for f in range(len(self.xsrvs))]
+        return [self.config['rx_udp_port']]
+
     def enable_udp_output(self):
         """Just calls tx_start. Here for backwards compatibility."""
         self.tx_start()
@@ -1609,10 +2031,12 @@ class Correlator(object):
     def vacc_ld_status_get(self):
         "Grabs and decodes the VACC load status registers from all the correlator's X-engines."
         rv = {}
+        ops = [('vacc_ld_status%i' % xeng_location, 0, None) for xeng_location in range(self.config['x_per_fpga'])]
+        batch_data = self.executor.map(self.xfpgas, katcp_wrapper.FpgaClient.batch, ops)
         for xfpga_num, server in enumerate(self.xsrvs):
             rv[server] = {}
             for xeng_location in range(self.config['x_per_fpga']):
-                reg_data = self.xfpgas[xfpga_num].read_uint('vacc_ld_status%i' % xeng_location)
+                reg_data = batch_data[xfpga_num][xeng_location]
                 rv[server]['arm_cnt%i' % xeng_location] = reg_data >> 16
                 rv[server]['ld_cnt%i'  % xeng_location] = reg_data & 0xffff
         return rv
@@ -1771,14 +2195,16 @@ class Correlator(object):
         return {'freqs':freqs,'spectrum_dbm':spectrum,'adc_v':adc_v}
 
 
-    def check_xaui_sync(self):
+    def check_xaui_sync(self, snapshot = None):
         """Checks if all F engines are in sync by examining mcnts at sync of incomming XAUI streams. \n
         If this test passes, it does not gaurantee that the system is indeed sync'd,
          merely that the F engines were reset between the same 1PPS pulses.
         Returns boolean true/false if system is in sync.
+        Registers are taken from snapshot (see health_snapshot) if given, else from a new one.
         """
         if self.config['feng_out_type'] != 'xaui':
             raise RuntimeError("According to your config file, you don't have any XAUI cables connected to your F engines!")
+        if snapshot == None: snapshot = self.health_snapshot()
         max_mcnt_difference=4
         mcnts=dict()
         mcnts_list=[]
@@ -1791,7 +2217,7 @@ class Correlator(object):
             n_xaui=f*self.config['n_xaui_ports_per_xfpga']+x
             #print 'Checking antenna %i on fpga %i, xaui %i. Entry %i.'%(ant,f,x,n_xaui)
             mcnts[n_xaui]=dict()
-            mcnts[n_xaui]['mcnt'] =self.xfpgas[f].read_uint('xaui_sync_mcnt%i'%x)
+            mcnts[n_xaui]['mcnt'] =snapshot['x'][f]['xaui_sync_mcnt%i'%x]
             mcnts_list.append(mcnts[n_xaui]['mcnt'])
 
         mcnts['mode']=statsmode(mcnts_list)
@@ -1876,11 +2302,63 @@ class Correlator(object):
             self.ffpgas[ffpga_n].write_int('adc_ctrl%i'%feng_input,self.ffpgas[ffpga_n].read_uint('adc_ctrl%i'%feng_input)|0x80000000)
             self.floggers[ffpga_n].info("Enabled RF frontend.")
 
-    def eq_set_all(self, init_poly = [], init_coeffs = []):
-        """Initialise all connected Fengines' EQs to given polynomial. If no polynomial or coefficients are given, use defaults from config file."""
+    def eq_set_all(self, init_poly = [], init_coeffs = [], force = False):
+        """Initialise all connected Fengines' EQs to given polynomial. If no polynomial or coefficients are given, use defaults from config file.
+        Only coefficients that differ from those last written are uploaded, unless force is set. All the F engines are updated at once."""
+        board_eqs = {}
         for in_n, ant_str in enumerate(self.config._get_ant_mapping_list()):
-            self.eq_spectrum_set(ant_str = ant_str, init_coeffs = init_coeffs, init_poly = init_poly)
-        self.syslogger.info('Set all EQ gains on all Fengs.')
+            ffpga_n, register_name, coeff_str = self._eq_pack(ant_str, init_coeffs = init_coeffs, init_poly = init_poly)
+            board_eqs.setdefault(ffpga_n, []).append((ant_str, register_name, coeff_str))
+        n_bytes = self._eq_upload(board_eqs, force)
+        self.syslogger.info('Set all EQ gains on all Fengs (%i bytes written).' % n_bytes)
+
+    def eq_cache_clear(self, ant_str = None):
+        """Forgets the EQ last written to an input, or to all inputs if ant_str is None, so that the next set writes it in full.
+        The copies are kept per physical EQ bram, (ffpga_n, register_name), so relabelling inputs doesn't invalidate them."""
+        if ant_str == None:
+            self._eq_shadow = {}
+        else:
+            ffpga_n, register_name, n_bytes = self._eq_location(ant_str)
+            self._eq_shadow.pop((ffpga_n, register_name), None)
+
+    def _eq_diff_blocks(self, ffpga_n, register_name, coeff_str):
+        """Returns the (register, byte offset, data) blocks needed to change an F engine's EQ bram from what was last written to coeff_str."""
+        old = self._eq_shadow.get((ffpga_n, register_name), None)
+        if old == None or len(old) != len(coeff_str):
+            return [(register_name, 0, coeff_str)]
+        diff = numpy.fromstring(old, dtype = numpy.uint8) != numpy.fromstring(coeff_str, dtype = numpy.uint8)
+        words = numpy.unique(numpy.flatnonzero(diff) / 4)
+        if len(words) == 0:
+            return []
+        breaks = numpy.flatnonzero(numpy.diff(words) > self.eq_merge_words)
+        starts = numpy.concatenate([words[0:1], words[breaks + 1]])
+        ends = numpy.concatenate([words[breaks], words[-1:]]) + 1
+        return [(register_name, int(start) * 4, coeff_str[start * 4:end * 4]) for start, end in zip(starts, ends)]
+
+    def _eq_upload(self, board_eqs, force = False):
+        """Writes packed EQ coefficients to the F engines, every board at once, updating the EQ shadow.
+        board_eqs is a dictionary, keyed on F engine board number, of lists of (ant_str, register_name, coeff_str). Returns the number of bytes written."""
+        boards = sorted(board_eqs.keys())
+        blocks = []
+        for ffpga_n in boards:
+            board_blocks = []
+            for ant_str, register_name, coeff_str in board_eqs[ffpga_n]:
+                if force:
+                    self._eq_shadow.pop((ffpga_n, register_name), None)
+                board_blocks.extend(self._eq_diff_blocks(ffpga_n, register_name, coeff_str))
+            blocks.append((board_blocks,))
+        try:
+            self.executor.starmap([self.ffpgas[ffpga_n] for ffpga_n in boards], katcp_wrapper.FpgaClient.write_blocks, blocks)
+        except:
+            # we can't tell what made it into the brams, so write everything next time
+            for ffpga_n in boards:
+                for ant_str, register_name, coeff_str in board_eqs[ffpga_n]:
+                    self._eq_shadow.pop((ffpga_n, register_name), None)
+            raise
+        for ffpga_n in boards:
+            for ant_str, register_name, coeff_str in board_eqs[ffpga_n]:
+                self._eq_shadow[(ffpga_n, register_name)] = coeff_str
+        return sum([sum([len(data) for register_name, offset, data in board_blocks]) for (board_blocks,) in blocks])
 
     def eq_default_get(self,ant_str):
         "Fetches the default equalisation configuration from the config file and returns a list of the coefficients for a given input."
@@ -1910,20 +2388,62 @@ class Correlator(object):
     #        sys.stdout.flush()
     #    print ''
 
-    def eq_spectrum_get(self,ant_str):
-        """Retrieves the equaliser settings currently programmed in an F engine for the given antenna. Assumes equaliser of 16 bits. Returns an array of length n_chans."""
+    def eq_spectrum_get(self, ant_str, verify = False):
+        """Retrieves the equaliser settings currently programmed in an F engine for the given antenna. Assumes equaliser of 16 bits. Returns an array of length n_chans.
+        The settings are served from the copy kept when the EQ was last set. If there is no copy, or verify is True, the F engine's bram is read instead and the copy refreshed."""
+        ffpga_n, register_name, n_bytes = self._eq_location(ant_str)
+        bd = self._eq_shadow.get((ffpga_n, register_name), None)
+        if verify or (bd == None):
+            hw = self.ffpgas[ffpga_n].read(register_name, n_bytes)
+            if (bd != None) and (hw != bd):
+                self.floggers[ffpga_n].warn('EQ for input %s in %s does not match what was last written to it.' % (ant_str, register_name))
+            self._eq_shadow[(ffpga_n, register_name)] = hw
+            bd = hw
+        return self._eq_unpack(bd)
+
+    def eq_cache_verify(self):
+        """Reads back every input's EQ bram, all F engines at once, and refreshes the copies served by eq_spectrum_get.
+        Returns a list of the inputs whose EQ did not match the copy."""
+        board_eqs = {}
+        for ant_str in self.config._get_ant_mapping_list():
+            ffpga_n, register_name, n_bytes = self._eq_location(ant_str)
+            board_eqs.setdefault(ffpga_n, []).append((ant_str, register_name, n_bytes))
+        boards = sorted(board_eqs.keys())
+        def read_eqs(fpga, eqs):
+            return [fpga.read(register_name, n_bytes) for ant_str, register_name, n_bytes in eqs]
+        brams = self.executor.starmap([self.ffpgas[ffpga_n] for ffpga_n in boards], read_eqs, [(board_eqs[ffpga_n],) for ffpga_n in boards])
+        rv = []
+        for fn, ffpga_n in enumerate(boards):
+            for (ant_str, register_name, n_bytes), hw in zip(board_eqs[ffpga_n], brams[fn]):
+                bd = self._eq_shadow.get((ffpga_n, register_name), None)
+                if (bd != None) and (hw != bd):
+                    self.floggers[ffpga_n].warn('EQ for input %s in %s does not match what was last written to it.' % (ant_str, register_name))
+                    rv.append(ant_str)
+                self._eq_shadow[(ffpga_n, register_name)] = hw
+        return rv
+
+    def _eq_location(self, ant_str):
+        """Returns (ffpga_n, register_name, n_bytes) for an input's EQ bram."""
         ffpga_n,xfpga_n,fxaui_n,xxaui_n,feng_input = self.get_ant_str_location(ant_str)
-        register_name='eq%i'%(feng_input)
+        n_coeffs = self.config['n_chans']/self.config['eq_decimation']
+        if self.config['eq_type'] == 'scalar':
+            n_bytes = n_coeffs*2
+        elif self.config['eq_type'] == 'complex':
+            n_bytes = n_coeffs*4
+        else:
+            log_runtimeerror(self.syslogger, "Unable to interpret eq_type from config file. Expecting scalar or complex.")
+        return ffpga_n, 'eq%i'%(feng_input), n_bytes
+
+    def _eq_unpack(self, bd):
+        """Expands the contents of an EQ bram to one value per channel."""
         n_coeffs = self.config['n_chans']/self.config['eq_decimation']
 
         if self.config['eq_type'] == 'scalar':
-            bd=self.ffpgas[ffpga_n].read(register_name,n_coeffs*2)
             coeffs=numpy.array(struct.unpack('>%ih'%n_coeffs,bd))
             nacexp=(numpy.reshape(coeffs,(n_coeffs,1))*numpy.ones((1,self.config['eq_decimation']))).reshape(self.config['n_chans'])
             return nacexp
 
         elif self.config['eq_type'] == 'complex':
-            bd=self.ffpgas[ffpga_n].read(register_name,n_coeffs*4)
             coeffs=struct.unpack('>%ih'%(n_coeffs*2),bd)
             na=numpy.array(coeffs,dtype=numpy.float64)
             nac=na.view(dtype=numpy.complex128)
@@ -1933,14 +2453,19 @@ class Correlator(object):
         else:
             log_runtimeerror(self.syslogger, "Unable to interpret eq_type from config file. Expecting scalar or complex.")
 
-    def eq_spectrum_set(self, ant_str, init_coeffs = [], init_poly = []):
+    def eq_spectrum_set(self, ant_str, init_coeffs = [], init_poly = [], force = False):
         """
         Set a given antenna and polarisation equaliser to given co-efficients.
         Assumes equaliser of 16 bits.
-        init_coeffs is list of length (n_chans / decimation_factor)."""
+        init_coeffs is list of length (n_chans / decimation_factor).
+        Only coefficients that differ from those last written are uploaded, unless force is set."""
         # tested ok corr-0.5.0 2010-08-07
+        ffpga_n, register_name, coeff_str = self._eq_pack(ant_str, init_coeffs = init_coeffs, init_poly = init_poly)
+        self._eq_upload({ffpga_n: [(ant_str, register_name, coeff_str)]}, force)
+
+    def _eq_pack(self, ant_str, init_coeffs = [], init_poly = []):
+        """Works out and packs the EQ bram contents for an input, as for eq_spectrum_set. Returns (ffpga_n, register_name, coeff_str)."""
         ffpga_n, xfpga_n, fxaui_n, xxaui_n, feng_input = self.get_ant_str_location(ant_str)
-        fpga = self.ffpgas[ffpga_n]
         register_name = 'eq%i' % (feng_input)
         n_coeffs = self.config['n_chans'] / self.config['eq_decimation']
 
@@ -1979,8 +2504,7 @@ class Correlator(object):
         if self.is_narrowband():
             coeff_str = ''.join([coeff_str[len(coeff_str)/2:], coeff_str[0:len(coeff_str)/2]])
 
-        # finally write to the bram
-        fpga.write(register_name, coeff_str)
+        return ffpga_n, register_name, coeff_str
 
     def adc_lru_mapping_get(self):
         """Map all the antennas to lru and physical inputs"""
@@ -2017,12 +2541,12 @@ class Correlator(object):
 #            shape=[self.config['n_bls'],2],fmt=spead.mkfmt(('u',16)),
 #            init_val=[[bl[0],bl[1]] for bl in self.get_bl_order()])
 
-        self.spead_ig.add_item(name="bls_ordering",id=0x100C,
+        self._spead_add_item(name="bls_ordering",id=0x100C,
             description="The output ordering of the baselines from each X engine.",
             #shape=[self.config['n_bls']],fmt=spead.STR_FMT,
             init_val=numpy.array([bl for bl in self.get_bl_order()]))
 
-        self.spead_ig.add_item(name="input_labelling",id=0x100E,
+        self._spead_add_item(name="input_labelling",id=0x100E,
             description="The physical location of each antenna connection.",
             init_val=numpy.array([(ant_str,input_n,lru,feng_input) for (ant_str,input_n,lru,feng_input) in self.adc_lru_mapping_get()]))
 
@@ -2030,57 +2554,57 @@ class Correlator(object):
 #            description="The output ordering of the cross-pol terms. Packed as a pair of characters, pol1,pol2.",
 #            shape=[self.config['n_stokes'],self.config['n_pols']],fmt=spead.mkfmt(('c',8)),
 #            init_val=[[bl[0],bl[1]] for bl in self.get_crosspol_order()])
-        self.spead_tx.send_heap(self.spead_ig.get_heap())
+        self._spead_send()
         self.syslogger.info("Issued SPEAD metadata describing baseline labelling and input mapping to %s:%i."%(self.config['rx_meta_ip_str'],self.config['rx_udp_port']))
 
     def spead_narrowband_issue(self):
         if self.is_narrowband():
-            self.spead_ig.add_item(name="coarse_chans",id=0x1017,
+            self._spead_add_item(name="coarse_chans",id=0x1017,
                 description="The number of coarse channels in a narrowband design.",
                 shape=[],fmt=spead.mkfmt(('u',spead.ADDRSIZE)),
                 init_val=self.config['coarse_chans'])
-            self.spead_ig.add_item(name="current_coarse_chan",id=0x1018,
+            self._spead_add_item(name="current_coarse_chan",id=0x1018,
                 description="The currently chosen coarse channel in a narrowband design.",
                 shape=[],fmt=spead.mkfmt(('u',spead.ADDRSIZE)),
                 init_val=self.config['current_coarse_chan'])
-            self.spead_tx.send_heap(self.spead_ig.get_heap())
+            self._spead_send()
             self.syslogger.info("Issued narrowband-specific SPEAD metadata describing number of coarse channels (%i) and chosen coarse channel (%i)."%(self.config['coarse_chans'], self.config['current_coarse_chan']))
 
     def spead_static_meta_issue(self):
         """ Issues the SPEAD metadata packets containing the payload and options descriptors and unpack sequences."""
         #tested ok corr-0.5.0 2010-08-07
 
-        self.spead_ig.add_item(name="adc_clk",id=0x1007,
+        self._spead_add_item(name="adc_clk",id=0x1007,
             description="Clock rate of ADC (samples per second).",
             shape=[],fmt=spead.mkfmt(('u',64)),
             init_val=self.config['adc_clk'])
 
-        self.spead_ig.add_item(name="n_bls",id=0x1008,
+        self._spead_add_item(name="n_bls",id=0x1008,
             description="The total number of baselines in the data product.",
             shape=[],fmt=spead.mkfmt(('u',spead.ADDRSIZE)),
             init_val=self.config['n_bls'])
 
-        self.spead_ig.add_item(name="n_chans",id=0x1009,
+        self._spead_add_item(name="n_chans",id=0x1009,
             description="The total number of frequency channels present in any integration.",
             shape=[], fmt=spead.mkfmt(('u',spead.ADDRSIZE)),
             init_val=self.config['n_chans'])
 
-        self.spead_ig.add_item(name="n_ants",id=0x100A,
+        self._spead_add_item(name="n_ants",id=0x100A,
             description="The total number of dual-pol antennas in the system.",
             shape=[],fmt=spead.mkfmt(('u',spead.ADDRSIZE)),
             init_val=self.config['n_ants'])
 
-        self.spead_ig.add_item(name="n_xengs",id=0x100B,
+        self._spead_add_item(name="n_xengs",id=0x100B,
             description="The total number of X engines in the system.",
             shape=[],fmt=spead.mkfmt(('u',spead.ADDRSIZE)),
             init_val=self.config['n_xeng'])
 
-        self.spead_ig.add_item(name="center_freq",id=0x1011,
+        self._spead_add_item(name="center_freq",id=0x1011,
             description="The center frequency of the DBE in Hz, 64-bit IEEE floating-point number.",
             shape=[],fmt=spead.mkfmt(('f',64)),
             init_val=self.config['center_freq'])
 
-        self.spead_ig.add_item(name="bandwidth",id=0x1013,
+        self._spead_add_item(name="bandwidth",id=0x1013,
             description="The analogue bandwidth of the digitally processed signal in Hz.",
             shape=[],fmt=spead.mkfmt(('f',64)),
             init_val=self.config['bandwidth'])
@@ -2090,56 +2614,56 @@ class Correlator(object):
         # 1017,1018 is number of coarse channels and current_coarse channel, respectively, in narrowband mode - see spead_narrowband_issue
 
         if self.is_wideband():
-            self.spead_ig.add_item(name="fft_shift",id=0x101E,
+            self._spead_add_item(name="fft_shift",id=0x101E,
                 description="The FFT bitshift pattern. F-engine correlator internals.",
                 shape=[],fmt=spead.mkfmt(('u',spead.ADDRSIZE)),
                 init_val=self.config['fft_shift'])
         elif self.is_narrowband():
-            self.spead_ig.add_item(name="fft_shift_fine",id=0x101C,
+            self._spead_add_item(name="fft_shift_fine",id=0x101C,
                 description="The FFT bitshift pattern for the fine channelisation FFT. F-engine correlator internals.",
                 shape=[],fmt=spead.mkfmt(('u',spead.ADDRSIZE)),
                 init_val=self.config['fft_shift_fine'])
-            self.spead_ig.add_item(name="fft_shift_coarse",id=0x101D,
+            self._spead_add_item(name="fft_shift_coarse",id=0x101D,
                 description="The FFT bitshift pattern for the coarse channelisation FFT. F-engine correlator internals.",
                 shape=[],fmt=spead.mkfmt(('u',spead.ADDRSIZE)),
                 init_val=self.config['fft_shift_coarse'])
 
-        self.spead_ig.add_item(name="xeng_acc_len",id=0x101F,
+        self._spead_add_item(name="xeng_acc_len",id=0x101F,
             description="Number of spectra accumulated inside X engine. Determines minimum integration time and user-configurable integration time stepsize. X-engine correlator internals.",
             shape=[],fmt=spead.mkfmt(('u',spead.ADDRSIZE)),
             init_val=self.config['xeng_acc_len'])
 
-        self.spead_ig.add_item(name="requant_bits",id=0x1020,
+        self._spead_add_item(name="requant_bits",id=0x1020,
             description="Number of bits after requantisation in the F engines (post FFT and any phasing stages).",
             shape=[],fmt=spead.mkfmt(('u',spead.ADDRSIZE)),
             init_val=self.config['feng_bits'])
 
-        self.spead_ig.add_item(name="feng_pkt_len",id=0x1021,
+        self._spead_add_item(name="feng_pkt_len",id=0x1021,
             description="Payload size of 10GbE packet exchange between F and X engines in 64 bit words. Usually equal to the number of spectra accumulated inside X engine. F-engine correlator internals.",
             shape=[],fmt=spead.mkfmt(('u',spead.ADDRSIZE)),
             init_val=self.config['10gbe_pkt_len'])
 
-        self.spead_ig.add_item(name="rx_udp_port",id=0x1022,
+        self._spead_add_item(name="rx_udp_port",id=0x1022,
             description="Destination UDP port for X engine output.",
             shape=[],fmt=spead.mkfmt(('u',spead.ADDRSIZE)),
             init_val=self.config['rx_udp_port'])
 
-        self.spead_ig.add_item(name="feng_udp_port",id=0x1023,
+        self._spead_add_item(name="feng_udp_port",id=0x1023,
             description="Destination UDP port for F engine data exchange.",
             shape=[],fmt=spead.mkfmt(('u',spead.ADDRSIZE)),
             init_val=self.config['10gbe_port'])
 
-        self.spead_ig.add_item(name="rx_udp_ip_str",id=0x1024,
+        self._spead_add_item(name="rx_udp_ip_str",id=0x1024,
             description="Destination IP address for X engine output UDP packets.",
             shape=[-1],fmt=spead.STR_FMT,
             init_val=self.config['rx_udp_ip_str'])
 
-        self.spead_ig.add_item(name="feng_start_ip",id=0x1025,
+        self._spead_add_item(name="feng_start_ip",id=0x1025,
             description="F engine starting IP address.",
             shape=[],fmt=spead.mkfmt(('u',spead.ADDRSIZE)),
             init_val=self.config['10gbe_ip'])
 
-        self.spead_ig.add_item(name="xeng_rate",id=0x1026,
+        self._spead_add_item(name="xeng_rate",id=0x1026,
             description="Target clock rate of processing engines (xeng).",
             shape=[],fmt=spead.mkfmt(('u',spead.ADDRSIZE)),
             init_val=self.config['xeng_clk'])
@@ -2149,17 +2673,17 @@ class Correlator(object):
 #            shape=[],fmt=spead.mkfmt(('u',spead.ADDRSIZE)),
 #            init_val=self.config['n_stokes'])
 
-        self.spead_ig.add_item(name="x_per_fpga",id=0x1041,
+        self._spead_add_item(name="x_per_fpga",id=0x1041,
             description="Number of X engines per FPGA.",
             shape=[],fmt=spead.mkfmt(('u',spead.ADDRSIZE)),
             init_val=self.config['x_per_fpga'])
 
-        self.spead_ig.add_item(name="n_ants_per_xaui",id=0x1042,
+        self._spead_add_item(name="n_ants_per_xaui",id=0x1042,
             description="Number of antennas' data per XAUI link.",
             shape=[],fmt=spead.mkfmt(('u',spead.ADDRSIZE)),
             init_val=self.config['n_ants_per_xaui'])
 
-        self.spead_ig.add_item(name="ddc_mix_freq",id=0x1043,
+        self._spead_add_item(name="ddc_mix_freq",id=0x1043,
             description="Digital downconverter mixing freqency as a fraction of the ADC sampling frequency. eg: 0.25. Set to zero if no DDC is present.",
             shape=[],fmt=spead.mkfmt(('f',64)),
             init_val=self.config['ddc_mix_freq'])
@@ -2175,63 +2699,66 @@ class Correlator(object):
 #            shape=[],fmt=spead.mkfmt(('u',spead.ADDRSIZE)),
 #            init_val=self.config['ddc_decimation'])
 
-        self.spead_ig.add_item(name="adc_bits",id=0x1045,
+        self._spead_add_item(name="adc_bits",id=0x1045,
             description="ADC quantisation (bits).",
             shape=[],fmt=spead.mkfmt(('u',spead.ADDRSIZE)),
             init_val=self.config['adc_bits'])
 
-        self.spead_ig.add_item(name="xeng_out_bits_per_sample",id=0x1048,
+        self._spead_add_item(name="xeng_out_bits_per_sample",id=0x1048,
             description="The number of bits per value of the xeng accumulator output. Note this is for a single value, not the combined complex size.",
             shape=[],fmt=spead.mkfmt(('u',spead.ADDRSIZE)),
             init_val=self.config['xeng_sample_bits'])
 
-        self.spead_tx.send_heap(self.spead_ig.get_heap())
+        self._spead_send()
         self.syslogger.info("Issued misc SPEAD metadata to %s:%i."%(self.config['rx_meta_ip_str'],self.config['rx_udp_port']))
 
     def spead_time_meta_issue(self):
         """Issues a SPEAD packet to notify the receiver that we've resync'd the system, acc len has changed etc."""
 
-        self.spead_ig.add_item(name="n_accs",id=0x1015,
+        self._spead_add_item(name="n_accs",id=0x1015,
             description="The number of spectra that are accumulated per integration.",
             shape=[],fmt=spead.mkfmt(('u',spead.ADDRSIZE)),
             init_val=self.acc_n_get())
 
-        self.spead_ig.add_item(name="int_time",id=0x1016,
+        self._spead_add_item(name="int_time",id=0x1016,
             description="Approximate (it's a float!) integration time per accumulation in seconds.",
             shape=[],fmt=spead.mkfmt(('f',64)),
             init_val=self.acc_time_get())
 
-        self.spead_ig.add_item(name='sync_time',id=0x1027,
+        self._spead_add_item(name='sync_time',id=0x1027,
             description="Time at which the system was last synchronised (armed and triggered by a 1PPS) in seconds since the Unix Epoch.",
             shape=[],fmt=spead.mkfmt(('u',spead.ADDRSIZE)),
             init_val=self.config['sync_time'])
 
-        self.spead_ig.add_item(name="scale_factor_timestamp",id=0x1046,
+        self._spead_add_item(name="scale_factor_timestamp",id=0x1046,
             description="Timestamp scaling factor. Divide the SPEAD data packet timestamp by this number to get back to seconds since last sync.",
             shape=[],fmt=spead.mkfmt(('f',64)),
             init_val=self.config['spead_timestamp_scale_factor'])
 
-        self.spead_tx.send_heap(self.spead_ig.get_heap())
+        self._spead_send()
         self.syslogger.info("Issued SPEAD timing metadata to %s:%i."%(self.config['rx_meta_ip_str'],self.config['rx_udp_port']))
 
-    def spead_eq_meta_issue(self):
-        """Issues a SPEAD heap for the RF gain and EQ settings."""
+    def spead_eq_meta_issue(self, verify = False):
+        """Issues a SPEAD heap for the RF gain and EQ settings.
+        The EQ settings come from the copies kept when they were set. If verify is True, they are first read back from the F engines."""
+        if verify:
+            self.eq_cache_verify()
         if self.config['adc_type'] == 'katadc':
             for input_n,ant_str in enumerate(self.config._get_ant_mapping_list()):
-                self.spead_ig.add_item(name="rf_gain_%i"%(input_n),id=0x1200+input_n,
+                self._spead_add_item(name="rf_gain_%i"%(input_n),id=0x1200+input_n,
                     description="The analogue RF gain applied at the ADC for input %i (ant %s) in dB."%(input_n,ant_str),
                     shape=[],fmt=spead.mkfmt(('f',64)),
                     init_val=self.config['rf_gain_%i'%(input_n)])
 
         if self.config['eq_type']=='scalar':
             for in_n,ant_str in enumerate(self.config._get_ant_mapping_list()):
-                self.spead_ig.add_item(name="eq_coef_%s"%(ant_str),id=0x1400+in_n,
+                self._spead_add_item(name="eq_coef_%s"%(ant_str),id=0x1400+in_n,
                     description="The unitless per-channel digital amplitude scaling factors implemented prior to requantisation, post-FFT, for input %s."%(ant_str),
                     init_val=self.eq_spectrum_get(ant_str))
 
         elif self.config['eq_type']=='complex':
             for in_n,ant_str in enumerate(self.config._get_ant_mapping_list()):
-                self.spead_ig.add_item(name="eq_coef_%s"%(ant_str),id=0x1400+in_n,
+                self._spead_add_item(name="eq_coef_%s"%(ant_str),id=0x1400+in_n,
                     description="The unitless per-channel digital scaling factors implemented prior to requantisation, post-FFT, for input %s. Complex number real,imag 32 bit integers."%(ant_str),
                     shape=[self.config['n_chans'],2],fmt=spead.mkfmt(('u',32)),
                     init_val=[[numpy.real(coeff),numpy.imag(coeff)] for coeff in self.eq_spectrum_get(ant_str)])
@@ -2239,7 +2766,7 @@ class Correlator(object):
         else:
             raise RuntimeError("I don't know how to deal with your EQ type.")
 
-        self.spead_tx.send_heap(self.spead_ig.get_heap())
+        self._spead_send()
         self.syslogger.info("Issued SPEAD EQ metadata to %s:%i."%(self.config['rx_meta_ip_str'],self.config['rx_udp_port']))
 
     def spead_data_descriptor_issue(self):
@@ -2250,37 +2777,73 @@ class Correlator(object):
             raise RuntimeError("Invalid bitwidth of X engine output. You specified %i, but I'm hardcoded for 32."%self.config['xeng_sample_bits'])
 
         if self.config['xeng_format'] == 'cont':
-            self.spead_ig.add_item(name=('timestamp'), id=0x1600,
+            self._spead_add_item(name=('timestamp'), id=0x1600,
                 description='Timestamp of start of this integration. uint counting multiples of ADC samples since last sync (sync_time, id=0x1027). Divide this number by timestamp_scale (id=0x1046) to get back to seconds since last sync when this integration was actually started. Note that the receiver will need to figure out the centre timestamp of the accumulation (eg, by adding half of int_time, id 0x1016).',
                 shape=[], fmt=spead.mkfmt(('u',spead.ADDRSIZE)),
                 init_val=0)
 
-            self.spead_ig.add_item(name=("xeng_raw"),id=0x1800,
+            self._spead_add_item(name=("xeng_raw"),id=0x1800,
                 description="Raw data for %i xengines in the system. This item represents a full spectrum (all frequency channels) assembled from lowest frequency to highest frequency. Each frequency channel contains the data for all baselines (n_bls given by SPEAD ID 0x100B). Each value is a complex number -- two (real and imaginary) unsigned integers."%(self.config['n_xeng']),
             ndarray=(numpy.dtype(numpy.int32),(self.config['n_chans'],self.config['n_bls'],2)))
 
         elif self.config['xeng_format'] =='inter':
             for x in range(self.config['n_xeng']):
 
-                self.spead_ig.add_item(name=('timestamp%i'%x), id=0x1600+x,
+                self._spead_add_item(name=('timestamp%i'%x), id=0x1600+x,
                     description='Timestamp of start of this integration. uint counting multiples of ADC samples since last sync (sync_time, id=0x1027). Divide this number by timestamp_scale (id=0x1046) to get back to seconds since last sync when this integration was actually started. Note that the receiver will need to figure out the centre timestamp of the accumulation (eg, by adding half of int_time, id 0x1016).',
                     shape=[], fmt=spead.mkfmt(('u',spead.ADDRSIZE)),init_val=0)
 
-                self.spead_ig.add_item(name=("xeng_raw%i"%x),id=(0x1800+x),
+                self._spead_add_item(name=("xeng_raw%i"%x),id=(0x1800+x),
                     description="Raw data for xengine %i out of %i. Frequency channels are split amongst xengines. Frequencies are distributed to xengines in a round-robin fashion, starting with engine 0. Data from all X engines must thus be combed or interleaved together to get continuous frequencies. Each xengine calculates all baselines (n_bls given by SPEAD ID 0x100B) for a given frequency channel. For a given baseline, -SPEAD ID 0x1040- stokes parameters are calculated (nominally 4 since xengines are natively dual-polarisation; software remapping is required for single-baseline designs). Each stokes parameter consists of a complex number (two real and imaginary unsigned integers)."%(x,self.config['n_xeng']),
                     ndarray=(numpy.dtype(numpy.int32),(self.config['n_chans']/self.config['n_xeng'],self.config['n_bls'],2)))
 
-        self.spead_tx.send_heap(self.spead_ig.get_heap())
+        self._spead_send()
         self.syslogger.info("Issued SPEAD data descriptor to %s:%i."%(self.config['rx_meta_ip_str'],self.config['rx_udp_port']))
 
-    def spead_issue_all(self):
-        """Issues all SPEAD metadata."""
-        self.spead_data_descriptor_issue()
-        self.spead_static_meta_issue()
-        self.spead_time_meta_issue()
-        self.spead_eq_meta_issue()
-        self.spead_labelling_issue()
-        self.spead_narrowband_issue()
+    def spead_issue_all(self, full = None):
+        """Issues all SPEAD metadata. Only items that have changed since they were last sent are transmitted, unless this is a full refresh, for the benefit of receivers that joined late.
+        A full refresh is done if full is True, or if full is None and it's more than spead_full_refresh_period seconds since the last one."""
+        if full == None:
+            full = (self.spead_full_refresh_period != None) and ((time.time() - self._spead_last_full) >= self.spead_full_refresh_period)
+        self._spead_full = full
+        try:
+            self.spead_data_descriptor_issue()
+            self.spead_static_meta_issue()
+            self.spead_time_meta_issue()
+            self.spead_eq_meta_issue()
+            self.spead_labelling_issue()
+            self.spead_narrowband_issue()
+        finally:
+            self._spead_full = False
+        if full:
+            self._spead_last_full = time.time()
+
+    def _spead_add_item(self, name, **kwargs):
+        """Adds an item to the metadata ItemGroup, as spead.ItemGroup.add_item, unless it is unchanged since it was last sent and this isn't a full refresh.
+        Returns True if the item was added."""
+        key = (kwargs.get('id'), repr(kwargs.get('fmt')), repr(kwargs.get('shape')), repr(kwargs.get('ndarray')), self._spead_value_key(kwargs.get('init_val')))
+        if (not self._spead_full) and (self._spead_sent.get(name, None) == key):
+            return False
+        self.spead_ig.add_item(name = name, **kwargs)
+        self._spead_pending[name] = key
+        return True
+
+    def _spead_value_key(self, value):
+        """Returns something comparable that changes when a SPEAD item's value does."""
+        if isinstance(value, numpy.ndarray) and value.dtype != object:
+            return (value.dtype.str, value.shape, value.tostring())
+        return repr(value)
+
+    def _spead_send(self):
+        """Sends a metadata heap of the items added since the last one, if there are any. Returns the number of items sent."""
+        n_items = len(self._spead_pending)
+        if n_items > 0:
+            heap = self.spead_ig.get_heap()
+            for tx in [self.spead_tx] + self._spead_tx_boards:
+                tx.send_heap(heap)
+            self._spead_sent.update(self._spead_pending)
+            self._spead_pending = {}
+        return n_items
 
     def is_wideband(self):
         return self.config['mode'] == CORR_MODE_WB
@@ -0,0 +1,173 @@
+"""
+Background delay and fringe tracking for the F engines.
+Evaluates a polynomial delay model for each input and keeps the F engines' delay and fringe rotation cores loaded with linear segments of it, from a dedicated thread.
+"""
+"""
+Revisions:
+2026-10-18  Initial revision.
+"""
+import time
+import threading
+
+import numpy
+
+class DelayTracker(object):
+    """Keeps the delay and fringe rotation of a set of inputs following a polynomial model.
+
+    Time is divided into segments of segment_period seconds. Ahead of each segment boundary the tracker evaluates every model over
+    the coming segment, and uploads the resulting delay, delay rate, fringe phase and fringe rate for all inputs at once, armed to load
+    at the boundary (see Correlator.fr_delay_upload_all). Each load is checked after the fact, once the next segment has been uploaded.
+    """
+    def __init__(self, correlator, segment_period = 1.0, lead_time = 0.3, logger = None):
+        """
+        @param correlator: a connected Correlator
+        @param segment_period: seconds between loads
+        @param lead_time: how long before each load time to start uploading it. Must be less than segment_period.
+        @param logger: a logger, defaults to the correlator's system logger
+        """
+        if lead_time >= segment_period:
+            raise RuntimeError('Lead time (%.3fs) must be shorter than the segment period (%.3fs).' % (lead_time, segment_period))
+        self.c = correlator
+        self.segment_period = segment_period
+        self.lead_time = lead_time
+        self.logger = logger if logger != None else correlator.syslogger
+        self._models = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {'uploaded': 0, 'loaded': 0, 'missed': 0, 'skipped': 0,
+                       'jitter_last': 0.0, 'jitter_max': 0.0, 'slack_last': 0.0, 'slack_min': None, 'last_error': None}
+
+    def set_model(self, ant_str, delay_poly, fringe_poly = None, epoch = None):
+        """Sets the model for one input. Polynomials are in numpy.polyval order (highest power first), in powers of seconds since epoch.
+
+        @param ant_str: the input to track
+        @param delay_poly: delay polynomial, in seconds
+        @param fringe_poly: fringe phase polynomial, in degrees. Defaults to no fringe rotation.
+        @param epoch: unix time at which the polynomials are referenced. Defaults to now.
+        """
+        if self.c.config._get_ant_mapping_list().count(ant_str) == 0:
+            raise RuntimeError('Unknown input %s.' % ant_str)
+        if fringe_poly is None:
+            fringe_poly = [0.0]
+        model = {'delay': numpy.array(delay_poly, dtype = numpy.float64),
+                 'fringe': numpy.array(fringe_poly, dtype = numpy.float64),
+                 'epoch': epoch if epoch != None else time.time()}
+        self._lock.acquire()
+        self._models[ant_str] = model
+        self._lock.release()
+
+    def clear_model(self, ant_str = None):
+        """Stops tracking one input, or all of them if ant_str is None. Their delays stay as last loaded."""
+        self._lock.acquire()
+        if ant_str == None:
+            self._models = {}
+        elif self._models.has_key(ant_str):
+            self._models.pop(ant_str)
+        self._lock.release()
+
+    def segment(self, ld_time):
+        """Evaluates every model over the segment starting at ld_time.
+        Rates are taken along the chord over the segment rather than the tangent at its start, which halves the worst-case error for a quadratic model.
+
+        @return a coeffs dictionary as taken by Correlator.fr_delay_set_all
+        """
+        self._lock.acquire()
+        models = self._models.items()
+        self._lock.release()
+        coeffs = {}
+        for ant_str, model in models:
+            t0 = ld_time - model['epoch']
+            t1 = t0 + self.segment_period
+            d0, d1 = numpy.polyval(model['delay'], [t0, t1])
+            f0, f1 = numpy.polyval(model['fringe'], [t0, t1])
+            coeffs[ant_str] = {'delay': float(d0),
+                               'delay_rate': float(d1 - d0) / self.segment_period,
+                               'fringe_phase': float(f0),
+                               'fringe_rate': float(f1 - f0) / 360.0 / self.segment_period}
+        return coeffs
+
+    def start(self):
+        """Starts tracking on a background thread."""
+        if self.is_running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target = self._run, name = 'DelayTracker')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout = None):
+        """Stops tracking, waiting for the thread to finish its current upload."""
+        self._stop.set()
+        if self._thread != None:
+            self._thread.join(timeout)
+
+    def is_running(self):
+        return (self._thread != None) and self._thread.is_alive()
+
+    def stats(self):
+        """Returns a dictionary of counters for the tracker:
+        uploaded, loaded and missed segments, segments skipped because the thread fell behind,
+        the last and worst wake-up jitter in seconds, the last and smallest slack between the end of an upload and its load time,
+        and the last error message."""
+        self._lock.acquire()
+        rv = dict(self._stats)
+        self._lock.release()
+        return rv
+
+    def _count(self, **kwargs):
+        self._lock.acquire()
+        for key, value in kwargs.iteritems():
+            if key in ['jitter_last', 'slack_last', 'last_error']:
+                self._stats[key] = value
+                if key == 'jitter_last':
+                    self._stats['jitter_max'] = max(self._stats['jitter_max'], value)
+                elif key == 'slack_last':
+                    self._stats['slack_min'] = value if self._stats['slack_min'] == None else min(self._stats['slack_min'], value)
+            else:
+                self._stats[key] += value
+        self._lock.release()
+
+    def _check(self, load):
+        try:
+            self.c.fr_delay_check_all(load, wait = False)
+            self._count(loaded = 1)
+        except RuntimeError as exc:
+            self.logger.error('DelayTracker: load at %.3f failed: %s' % (load['ld_time'], exc))
+            self._count(missed = 1, last_error = str(exc))
+
+    def _run(self):
+        period = self.segment_period
+        next_ld = (numpy.floor((time.time() + self.lead_time) / period) + 1) * period
+        pending = None
+        while True:
+            wake_time = next_ld - self.lead_time
+            if self._stop.wait(max(wake_time - time.time(), 0)):
+                break
+            jitter = time.time() - wake_time
+            self._count(jitter_last = jitter)
+            coeffs = self.segment(next_ld)
+            if len(coeffs) > 0:
+                try:
+                    load = self.c.fr_delay_upload_all(coeffs, ld_time = next_ld)
+                    self._count(uploaded = 1, slack_last = next_ld - time.time())
+                except RuntimeError as exc:
+                    self.logger.error('DelayTracker: could not upload the segment loading at %.3f: %s' % (next_ld, exc))
+                    self._count(missed = 1, last_error = str(exc))
+                    load = None
+                # the previous segment's load time has passed by now
+                if pending != None:
+                    self._check(pending)
+                pending = load
+            next_ld += period
+            # if we've fallen more than a segment behind, skip ahead rather than uploading loads that are already late
+            behind = int(numpy.floor((time.time() + self.lead_time - next_ld) / period)) + 1
+            if behind > 0:
+                self.logger.warn('DelayTracker: fell behind by %i segment(s), skipping ahead.' % behind)
+                self._count(skipped = behind)
+                next_ld += behind * period
+        if pending != None:
+            sleep_time = pending['ld_time'] - time.time()
+            if sleep_time > 0:
+                time.sleep(sleep_time)
+            self._check(pending)
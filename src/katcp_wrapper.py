@@ -12,6 +12,7 @@
 """
 import struct
 import threading
+import contextlib
 import socket
 import logging
 import time
@@ -101,6 +102,22 @@ class FpgaClient(CallbackClient):
         self._nb_requests_lock = threading.Lock()
         self._nb_requests = {}
         self._nb_max_requests = 100
+        # requests sent by _nb_pipeline are never evicted from the table. They are limited,
+        # across all the pipelines running on this client, to half the table.
+        self._nb_pinned = set()
+        self._nb_pipeline_slots = threading.Semaphore(max(self._nb_max_requests / 2, 1))
+
+        # write verification: the client-wide default, and the policy set by write_verify for the calling thread, if any.
+        # the thread's policy holds the thread's deferred writes: (device_name, offset, data), in the order written. No two overlap.
+        self._verify_mode = 'always'
+        self._verify_sample_n = 1
+        self._verify_count = 0
+        self._verify_lock = threading.Lock()
+        self._verify_local = threading.local()
+
+        # snapshot polling: board clock in MHz, from est_brd_clk or set by the user, and the depth in bytes of each snap block seen
+        self.brd_clk_mhz = None
+        self._snap_depths = {}
 
     """**********************************************************************************"""
     """**********************************************************************************"""
@@ -112,33 +129,39 @@ class FpgaClient(CallbackClient):
             return None
 
     def _nb_pop_request_by_id(self, request_id):
+        self._nb_requests_lock.acquire()
         try:
-            self._nb_requests_lock.acquire()
-            r = self._nb_requests.pop(request_id)
-            self._nb_requests_lock.release()
-            return r
+            self._nb_pinned.discard(request_id)
+            return self._nb_requests.pop(request_id)
         except KeyError:
             return None
+        finally:
+            self._nb_requests_lock.release()
 
     def _nb_pop_oldest_request(self):
-        req = self._nb_requests[self._nb_requests.keys()[0]]
-        for k, v in self._nb_requests.iteritems():
-            if v.time_tx < req.time_tx:
-                req = v
+        req = None
         self._nb_requests_lock.acquire()
-        r = self._nb_pop_request_by_id(req.request_id)
-        self._nb_requests_lock.release()
-        return r
+        try:
+            for k, v in self._nb_requests.iteritems():
+                if (k not in self._nb_pinned) and ((req == None) or (v.time_tx < req.time_tx)):
+                    req = v
+        finally:
+            self._nb_requests_lock.release()
+        if req == None:
+            return None
+        return self._nb_pop_request_by_id(req.request_id)
 
     def _nb_get_request_result(self, request_id):
         req = self._nb_get_request_by_id(request_id)
         return req.reply, req.informs
 
-    def _nb_add_request(self, request_name, request_id, inform_cb, reply_cb):
+    def _nb_add_request(self, request_name, request_id, inform_cb, reply_cb, pinned = False):
         if self._nb_requests.has_key(request_id):
             raise RuntimeError('Trying to add request with id(%s) but it already exists.' % request_id)
         self._nb_requests_lock.acquire()
         self._nb_requests[request_id] = FpgaAsyncRequest(self.host, request_name, request_id, inform_cb, reply_cb)
+        if pinned:
+            self._nb_pinned.add(request_id)
         self._nb_requests_lock.release()
 
     def _nb_get_next_request_id(self):
@@ -172,12 +195,19 @@ class FpgaClient(CallbackClient):
            @param inform_cb An optional callback function, called upon receipt of the reply to the request.
            @param args      Arguments to the katcp.Message object.
            """
-        if len(self._nb_requests) == self._nb_max_requests:
+        return self._nb_send(request, inform_cb, reply_cb, args)
+
+    def _nb_send(self, request, inform_cb, reply_cb, args, pinned = False):
+        """Make a non-blocking request, as for _nb_request.
+           @param pinned  Boolean: never evict this request to make room in the request table.
+           """
+        if len(self._nb_requests) >= self._nb_max_requests:
             oldreq = self._nb_pop_oldest_request()
-            self._logger.info("Request list full, removing oldest one(%s,%s)." % (oldreq.request, oldreq.request_id))
-            print "Request list full, removing oldest one(%s,%s)." % (oldreq.request, oldreq.request_id)
+            if oldreq != None:
+                self._logger.info("Request list full, removing oldest one(%s,%s)." % (oldreq.request, oldreq.request_id))
+                print "Request list full, removing oldest one(%s,%s)." % (oldreq.request, oldreq.request_id)
         request_id = self._nb_get_next_request_id()
-        self._nb_add_request(request, request_id, inform_cb, reply_cb)
+        self._nb_add_request(request, request_id, inform_cb, reply_cb, pinned)
         self.callback_request(msg = Message.request(request, *args), reply_cb = self._nb_replycb, inform_cb = self._nb_informcb, user_data = request_id)
         return {'host': self.host, 'request': request, 'id': request_id}
 
@@ -234,18 +264,21 @@ class FpgaClient(CallbackClient):
            """
         raise NotImplementedError("LISTCMD not implemented by client.")
 
-    def progdev(self, boffile):
+    def progdev(self, boffile, timeout=None):
         """Program the FPGA with the specified boffile.
 
            @param self  This object.
            @param boffile  String: name of the BOF file.
+           @param timeout  Float: seconds to wait for the reply. Defaults to the client timeout.
            @return  String: device status.
            """
+        if timeout == None:
+            timeout = self._timeout
         if boffile=='' or boffile==None:
-            reply, informs = self._request("progdev", self._timeout)
+            reply, informs = self._request("progdev", timeout)
             self._logger.info("Deprogramming FPGA... %s."%(reply.arguments[0]))
         else:
-            reply, informs = self._request("progdev", self._timeout, boffile)
+            reply, informs = self._request("progdev", timeout, boffile)
             self._logger.info("Programming FPGA with %s... %s."%(boffile,reply.arguments[0]))
         return reply.arguments[0]
 
@@ -405,20 +438,24 @@ class FpgaClient(CallbackClient):
         if reply.arguments[0]=='ok': return
         else: raise RuntimeError("Failure stopping tap device %s." % (tap_dev))
 
-    def upload_program_bof(self, bof_file, port, timeout = 30):
+    def upload_program_bof(self, bof_file, port, timeout = 30, chunk_size = 65536, progress_cb = None):
         """Upload a BORPH file to the ROACH board for execution.
+           The file is streamed to the board in chunks, so memory use does not depend on the size of the file.
            @param self  This object.
            @param bof_file  The path and/or filename of the bof file to upload.
            @param port  The port to use for uploading.
            @param timeout  The timeout to use for uploading.
-           @return
+           @param chunk_size  Integer: number of bytes read from the file and sent at a time.
+           @param progress_cb  An optional callback function, called as progress_cb(host, bytes_sent, bytes_total) after every chunk.
+           @return  Dictionary: the number of bytes sent, the time taken and the throughput in bytes per second.
         """
         # does the bof file exist on the local filesystem?
         try:
-            os.path.getsize(bof_file)
+            bof_size = os.path.getsize(bof_file)
         except:
             raise IOError('BOF file not found.')
         import time, Queue
+        upload_stats = {'bytes': 0, 'seconds': 0.0, 'rate': 0.0}
         def makerequest(result_queue):
             try:
                 result = self._request('upload', timeout, port)
@@ -441,10 +478,26 @@ class FpgaClient(CallbackClient):
                     time.sleep(0.1)
             if not connected:
                 result_queue.put('Could not connect to upload port.')
+                return
             try:
-                upload_socket.send(open(filename).read())
+                upload_socket.settimeout(timeout)
+                stime = time.time()
+                bof = open(filename, 'rb')
+                try:
+                    chunk = bof.read(chunk_size)
+                    while chunk:
+                        upload_socket.sendall(chunk)
+                        upload_stats['bytes'] += len(chunk)
+                        if progress_cb != None:
+                            progress_cb(self.host, upload_stats['bytes'], bof_size)
+                        chunk = bof.read(chunk_size)
+                finally:
+                    bof.close()
+                    upload_socket.close()
+                upload_stats['seconds'] = time.time() - stime
             except:
                 result_queue.put('Could not send file to upload port.')
+                return
             result_queue.put('OK')
         # request thread
         request_queue = Queue.Queue()
@@ -463,7 +516,10 @@ class FpgaClient(CallbackClient):
         upload_result = upload_queue.get()
         if (request_result != 'OK') or (upload_result != 'OK'):
             raise Exception('Error: request(%s), upload(%s)' %(request_result, upload_result))
-        debugstr = "Bof file upload for '%s': request (%s), upload (%s)" % (bof_file, request_result, upload_result)
+        if upload_stats['seconds'] > 0:
+            upload_stats['rate'] = upload_stats['bytes'] / upload_stats['seconds']
+        debugstr = "Bof file upload for '%s': request (%s), upload (%s), %i bytes in %.2fs (%.1f kB/s)" % (bof_file, request_result, upload_result,
+            upload_stats['bytes'], upload_stats['seconds'], upload_stats['rate'] / 1024.)
         self._logger.info(debugstr)
         stime = time.time()
         done = False
@@ -476,6 +532,7 @@ class FpgaClient(CallbackClient):
                 time.sleep(0.1)
         if not done:
             raise RuntimeError('BOF file seemed to upload, but is not running?')
+        return upload_stats
 
     def status(self):
         """Return the status of the FPGA.
@@ -603,15 +660,36 @@ class FpgaClient(CallbackClient):
            the string argument to confirm that data was successfully written.
 
            Throw exception if not match. (alternative command 'blindwrite' does
-           not perform this confirmation).
+           not perform this confirmation). How often the read-back happens is
+           set for the calling thread by write_verify, or for the whole client by set_write_verify.
 
            @see blindwrite
+           @see write_verify
+           @see set_write_verify
            @param self  This object.
            @param device_name  String: name of device / register to write to.
            @param data  Byte string: data to write.
            @param offset  Integer: offset to write data to (in bytes)
            """
         self.blindwrite(device_name, data, offset)
+        policy = getattr(self._verify_local, 'policy', None)
+        mode = policy['mode'] if policy != None else self._verify_mode
+        if mode == 'never':
+            return
+        elif mode == 'deferred':
+            policy['deferred'] = self._verify_defer(policy['deferred'], device_name, offset, data)
+            return
+        elif mode == 'sampled':
+            if policy != None:
+                policy['count'] += 1
+                sample = (policy['count'] % policy['sample_n']) == 0
+            else:
+                self._verify_lock.acquire()
+                self._verify_count += 1
+                sample = (self._verify_count % self._verify_sample_n) == 0
+                self._verify_lock.release()
+            if not sample:
+                return
         new_data = self.read(device_name, len(data), offset)
         if new_data != data:
 
@@ -623,6 +701,29 @@ class FpgaClient(CallbackClient):
             raise RuntimeError("Verification of write to %s at offset %d failed. Wrote 0x%08x... but got back 0x%08x..."
                 % (device_name, offset, unpacked_wrdata, unpacked_rddata))
 
+    def _verify_defer(self, deferred, device_name, offset, data):
+        """Adds a write to a list of deferred writes, and returns the new list. Any earlier records it overlaps are merged with it,
+           the new data taking precedence, so that each byte is checked against the last value written to it.
+           """
+        start = offset
+        end = offset + len(data)
+        overlaps = []
+        kept = []
+        for rec in deferred:
+            if (rec[0] == device_name) and (rec[1] < offset + len(data)) and (rec[1] + len(rec[2]) > offset):
+                overlaps.append(rec)
+                start = min(start, rec[1])
+                end = max(end, rec[1] + len(rec[2]))
+            else:
+                kept.append(rec)
+        if len(overlaps) > 0:
+            merged = bytearray(end - start)
+            for rec_device, rec_offset, rec_data in overlaps + [(device_name, offset, data)]:
+                merged[rec_offset - start:rec_offset - start + len(rec_data)] = rec_data
+            data = str(merged)
+        kept.append((device_name, start, data))
+        return kept
+
     def blindwrite(self, device_name, data, offset=0):
         """Unchecked data write.
 
@@ -688,6 +789,201 @@ class FpgaClient(CallbackClient):
         data = self.read(device_name, 4, offset*4)
         return struct.unpack(">I", data)[0]
 
+    def _nb_pipeline(self, requests, timeout=None, max_in_flight=None):
+        """Send a list of requests without waiting for each reply, matching the replies to their requests by message id.
+
+           @param self  This object.
+           @param requests  List of (request_name, args) tuples.
+           @param timeout  Float: seconds to wait for all replies. Defaults to the client timeout.
+           @param max_in_flight  Integer: maximum number of outstanding requests. Defaults to half the async request table,
+                                 which is also the limit shared by all the pipelines running on this client at once.
+           @return  List: the FpgaAsyncRequest for each request, in the order given.
+           """
+        import Queue
+        if timeout == None:
+            timeout = self._timeout
+        if max_in_flight == None:
+            max_in_flight = max(self._nb_max_requests / 2, 1)
+        reply_queue = Queue.Queue()
+        def reply_cb(host, request_id):
+            reply_queue.put(request_id)
+        rv = [None] * len(requests)
+        pending = {}
+        next_req = 0
+        deadline = time.time() + timeout
+        try:
+            while (next_req < len(requests)) or (len(pending) > 0):
+                # only wait for a free slot if we have no replies of our own to wait for
+                while (next_req < len(requests)) and (len(pending) < max_in_flight) and self._nb_pipeline_slots.acquire(len(pending) == 0):
+                    request_name, args = requests[next_req]
+                    try:
+                        r = self._nb_send(request_name, None, reply_cb, args, pinned = True)
+                    except:
+                        self._nb_pipeline_slots.release()
+                        raise
+                    pending[r['id']] = next_req
+                    next_req += 1
+                try:
+                    request_id = reply_queue.get(block = True, timeout = max(deadline - time.time(), 0))
+                except Queue.Empty:
+                    self._logger.error("Pipeline of %i requests timed out after %.2fs with %i replies outstanding." % (len(requests), timeout, len(pending)))
+                    raise RuntimeError("Pipeline of %i requests timed out after %.2fs with %i replies outstanding." % (len(requests), timeout, len(pending)))
+                req_n = pending.pop(request_id)
+                self._nb_pipeline_slots.release()
+                req = self._nb_pop_request_by_id(request_id)
+                if req == None:
+                    self._logger.error("Reply to pipelined request %s(%s) arrived, but the request was no longer stored." % (requests[req_n][0], request_id))
+                    raise RuntimeError("Reply to pipelined request %s(%s) arrived, but the request was no longer stored." % (requests[req_n][0], request_id))
+                rv[req_n] = req
+        finally:
+            for request_id in pending.keys():
+                self._nb_pop_request_by_id(request_id)
+                self._nb_pipeline_slots.release()
+        return rv
+
+    def batch(self, ops, timeout=None, max_in_flight=None):
+        """Pipeline a list of 32-bit register reads and writes over this client's connection.
+           Requests are sent without waiting for the previous reply and replies are matched
+           to their requests by message id, so a batch costs roughly one round-trip rather than one per operation.
+           Writes are not verified; add a read of the same register to the batch if you need to check it.
+
+           @param self  This object.
+           @param ops  List of (device_name, offset, value) tuples. offset is in 32-bit words.
+                       A value of None reads the register as an unsigned int, otherwise value is written.
+           @param timeout  Float: seconds to wait for all replies. Defaults to the client timeout.
+           @param max_in_flight  Integer: maximum number of outstanding requests. Defaults to half the async request table.
+           @return  List: the unsigned int read for each read operation and None for each write, in the order given.
+           """
+        requests = []
+        for device_name, offset, value in ops:
+            if value == None:
+                requests.append(('read', (device_name, str(offset*4), '4')))
+            else:
+                data = struct.pack(">i", value) if value < 0 else struct.pack(">I", value)
+                requests.append(('write', (device_name, str(offset*4), data)))
+        replies = self._nb_pipeline(requests, timeout, max_in_flight)
+        rv = [None] * len(ops)
+        errors = []
+        for op_n, req in enumerate(replies):
+            if not req.complete_ok():
+                errors.append("%s %s at offset %i: %s" % (req.request, ops[op_n][0], ops[op_n][1], req.reply))
+            elif ops[op_n][2] == None:
+                rv[op_n] = struct.unpack(">I", req.reply.arguments[1])[0]
+        if len(errors) > 0:
+            self._logger.error("Batch requests failed: %s" % '; '.join(errors))
+            raise RuntimeError("Batch requests failed: %s" % '; '.join(errors))
+        return rv
+
+    def write_blocks(self, blocks, verify=True, timeout=None, max_in_flight=None):
+        """Pipeline writes of several byte strings, to one or more devices, over this client's connection.
+           If verify is set, all the blocks are then read back in a second pipelined pass and compared.
+
+           @param self  This object.
+           @param blocks  List of (device_name, offset, data) tuples. offset is in bytes.
+           @param verify  Boolean: read back and check the written data.
+           @param timeout  Float: seconds to wait for each pass. Defaults to the client timeout.
+           @param max_in_flight  Integer: maximum number of outstanding requests. Defaults to half the async request table.
+           """
+        if len(blocks) == 0:
+            return
+        errors = []
+        replies = self._nb_pipeline([('write', (device_name, str(offset), data)) for device_name, offset, data in blocks], timeout, max_in_flight)
+        for n, req in enumerate(replies):
+            if not req.complete_ok():
+                errors.append("Write to %s at offset %d failed: %s" % (blocks[n][0], blocks[n][1], req.reply))
+        if verify and len(errors) == 0:
+            replies = self._nb_pipeline([('read', (device_name, str(offset), str(len(data)))) for device_name, offset, data in blocks], timeout, max_in_flight)
+            for n, req in enumerate(replies):
+                if not req.complete_ok():
+                    errors.append("Could not read back %s at offset %d: %s" % (blocks[n][0], blocks[n][1], req.reply))
+                elif req.reply.arguments[1] != blocks[n][2]:
+                    errors.append("Verification of write to %s at offset %d failed." % (blocks[n][0], blocks[n][1]))
+        if len(errors) > 0:
+            self._logger.error('; '.join(errors))
+            raise RuntimeError('; '.join(errors))
+
+    def set_write_verify(self, mode='always', sample_n=1):
+        """Choose how write() checks the data it writes, for every thread using this client that hasn't chosen otherwise with write_verify.
+
+           @param self  This object.
+           @param mode  String: 'always' reads back every write, 'never' does not verify and
+                        'sampled' reads back one in every sample_n writes. See write_verify for 'deferred'.
+           @param sample_n  Integer: sampling interval for 'sampled' mode.
+           """
+        if mode not in ['always', 'never', 'sampled']:
+            raise RuntimeError("Client-wide write verification mode %s not understood. Expecting always, never or sampled; use write_verify for deferred." % mode)
+        if mode == 'sampled' and sample_n < 1:
+            raise RuntimeError("Write verification sample interval must be at least one, got %i." % sample_n)
+        self._verify_lock.acquire()
+        self._verify_mode = mode
+        self._verify_sample_n = sample_n
+        self._verify_count = 0
+        self._verify_lock.release()
+
+    def get_write_verify(self):
+        """Returns the write verification mode and sampling interval in force for the calling thread, as a tuple."""
+        policy = getattr(self._verify_local, 'policy', None)
+        if policy != None:
+            return policy['mode'], policy['sample_n']
+        return self._verify_mode, self._verify_sample_n
+
+    @contextlib.contextmanager
+    def write_verify(self, mode='always', sample_n=1, timeout=None):
+        """Context manager choosing how write() checks the data written by the calling thread inside the block.
+           Other threads writing through this client are unaffected. Blocks may be nested.
+           In 'deferred' mode the writes are recorded and read back in one pipelined batch when the block exits normally (see verify_writes).
+
+           @param self  This object.
+           @param mode  String: 'always', 'never', 'sampled' or 'deferred'. See set_write_verify.
+           @param sample_n  Integer: sampling interval for 'sampled' mode.
+           @param timeout  Float: seconds to wait for the deferred read-back. Defaults to the client timeout.
+           """
+        if mode not in ['always', 'never', 'sampled', 'deferred']:
+            raise RuntimeError("Write verification mode %s not understood. Expecting always, never, sampled or deferred." % mode)
+        if mode == 'sampled' and sample_n < 1:
+            raise RuntimeError("Write verification sample interval must be at least one, got %i." % sample_n)
+        saved = getattr(self._verify_local, 'policy', None)
+        policy = {'mode': mode, 'sample_n': sample_n, 'count': 0, 'deferred': []}
+        self._verify_local.policy = policy
+        try:
+            yield
+        finally:
+            self._verify_local.policy = saved
+        if mode == 'deferred':
+            self._verify_records(policy['deferred'], timeout)
+
+    def verify_writes(self, timeout=None):
+        """Read back all the writes the calling thread has recorded so far in a 'deferred' write_verify block in one pipelined batch and check them.
+           Overlapping writes are checked as one, against the last data written to each byte. The record is cleared whether or not the check passes.
+
+           @param self  This object.
+           @param timeout  Float: seconds to wait for the read-back. Defaults to the client timeout.
+           @return  Integer: the number of (merged) writes checked.
+           """
+        policy = getattr(self._verify_local, 'policy', None)
+        if (policy == None) or (policy['mode'] != 'deferred'):
+            return 0
+        deferred = policy['deferred']
+        policy['deferred'] = []
+        return self._verify_records(deferred, timeout)
+
+    def _verify_records(self, deferred, timeout=None):
+        """Reads back a list of (device_name, offset, data) writes in one pipelined batch and checks them. Returns the number checked."""
+        if len(deferred) == 0:
+            return 0
+        replies = self._nb_pipeline([('read', (device_name, str(offset), str(len(data)))) for device_name, offset, data in deferred], timeout)
+        errors = []
+        for n, req in enumerate(replies):
+            device_name, offset, data = deferred[n]
+            if not req.complete_ok():
+                errors.append("Could not read back %s at offset %d: %s" % (device_name, offset, req.reply))
+            elif req.reply.arguments[1] != data:
+                errors.append("Verification of write to %s at offset %d failed." % (device_name, offset))
+        if len(errors) > 0:
+            self._logger.error('; '.join(errors))
+            raise RuntimeError('; '.join(errors))
+        return len(deferred)
+
     def stop(self):
         """Stop the client.
 
@@ -869,7 +1165,8 @@ class FpgaClient(CallbackClient):
         time.sleep(2)
         secondpass=self.read_uint('sys_clkcounter')
         if firstpass>secondpass: secondpass=secondpass+(2**32)
-        return (secondpass-firstpass)/2000000.
+        self.brd_clk_mhz = (secondpass-firstpass)/2000000.
+        return self.brd_clk_mhz
 
     def qdr_status(self,qdr):
          """Checks QDR status (PHY ready and Calibration). NOT TESTED.
@@ -988,6 +1285,26 @@ class FpgaClient(CallbackClient):
             rv['app_rev']=app&((2**28)-1)
         return rv
 
+    def design_fingerprint(self):
+        """Returns an md5 hex digest identifying the running design, built from its device list and revision control block.
+           Returns None if the FPGA is not programmed or cannot be queried.
+
+           @param self  This object.
+           @return  String: hex digest, or None.
+           """
+        import hashlib
+        try:
+            devices = self.listdev()
+        except:
+            return None
+        if len(devices) == 0:
+            return None
+        try:
+            rcs = sorted(self.get_rcs().items())
+        except:
+            rcs = []
+        return hashlib.md5('\n'.join(sorted(devices)) + repr(rcs)).hexdigest()
+
     def snapshot_arm(self, dev_name, man_trig=False, man_valid=False, offset=-1, circular_capture=False):
         if offset >=0:
             self.write_int(dev_name+'_trig_offset', offset)
@@ -996,6 +1313,39 @@ class FpgaClient(CallbackClient):
         self.write_int(dev_name + '_ctrl', (0 + (man_trig<<1) + (man_valid<<2) + (circular_capture<<3)))
         self.write_int(dev_name + '_ctrl', (1 + (man_trig<<1) + (man_valid<<2) + (circular_capture<<3)))
 
+    def snapshot_wait(self, dev_name, wait_period=1, min_interval=None, max_interval=0.05, bytes_per_clk=16):
+        """Polls a snap block's status register until it reports that capture is complete or wait_period seconds have passed.
+           The polling interval starts at min_interval and doubles after every poll up to max_interval,
+           so short captures are noticed quickly while long ones do not flood the board with requests.
+           By default the first interval is the time the snap block takes to fill: its depth, learnt from the last
+           capture on this client, over bytes_per_clk at brd_clk_mhz (see est_brd_clk). It is 1ms until both are known.
+
+           @param self  This object.
+           @param dev_name  String: name of the snap block.
+           @param wait_period  Float: seconds to wait for the capture. Negative waits forever.
+           @param min_interval  Float: seconds between the first polls.
+           @param max_interval  Float: longest time between polls.
+           @param bytes_per_clk  Integer: bytes the snap block captures per clock. The default, the widest block, errs towards polling early.
+           @return  Integer: the last value read from the status register.
+           """
+        start_time = time.time()
+        interval = min_interval
+        if interval == None:
+            if self._snap_depths.has_key(dev_name) and (self.brd_clk_mhz != None) and (self.brd_clk_mhz > 0):
+                interval = min(self._snap_depths[dev_name] / float(bytes_per_clk) / (self.brd_clk_mhz * 1e6), max_interval)
+            else:
+                interval = 0.001
+        while True:
+            addr = self.read_uint(dev_name+'_status')
+            if not bool(addr & 0x80000000):
+                if (addr & 0x7fffffff) > 0:
+                    self._snap_depths[dev_name] = max(self._snap_depths.get(dev_name, 0), addr & 0x7fffffff)
+                return addr
+            if (wait_period >= 0) and ((time.time() - start_time) >= wait_period):
+                return addr
+            time.sleep(interval)
+            interval = min(interval * 2, max_interval)
+
     def snapshot_get(self, dev_name, man_trig=False, man_valid=False, wait_period=1, offset=-1, circular_capture=False, get_extra_val=False, arm=True):
         """Grabs all brams from a single snap block on this FPGA device.\n
             \tdev_name: string, name of the snap block.\n
@@ -1011,12 +1361,7 @@ class FpgaClient(CallbackClient):
         #TODO Test offset, get_extra_val and circular capture modes.
         if arm:
             self.snapshot_arm(dev_name=dev_name, man_trig=man_trig, man_valid=man_valid, offset=offset, circular_capture=circular_capture)
-        done=False
-        start_time=time.time()
-        while not done and ((time.time()-start_time)<wait_period or (wait_period < 0)):
-            addr = self.read_uint(dev_name+'_status')
-            done = not bool(addr & 0x80000000)
-            time.sleep(0.05)
+        addr = self.snapshot_wait(dev_name, wait_period=wait_period)
 
         bram_size= addr&0x7fffffff
         bram_dmp=dict()
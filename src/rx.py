@@ -1,5 +1,9 @@
 """Code for receiving data from correlators and storing in HDF5 file. Will also send a copy to realtime signal display.
 Revs:
+2026-10-18  Multi-process receiver for interleaved X engine output (inter_mp mode).
+            Per-dump completeness, loss and latency accounting (DumpAccounting), xeng_complete dataset.
+            Receive buffers sized from the config and checked against the kernel's limits. CPU affinity and busy polling options.
+            Decimated signal display stream (SdStream): channel averaging, baseline subset and rate limit.
 2017-12-13  PEP 8 compliance. Got rid of absolute imports, instead opting for
                 relative imports
 2011-12-12  JRM Metadata propagation to SD.
@@ -10,6 +14,14 @@ Revs:
 """
 
 import threading
+import Queue
+import collections
+import multiprocessing
+import multiprocessing.sharedctypes
+import ctypes
+import ctypes.util
+import socket
+import os
 import numpy as np
 import logging
 import sys
@@ -20,8 +32,504 @@ import spead64_48 as spead
 
 from . import log_handlers
 
+class H5Writer(object):
+    """Appends items received over SPEAD to datasets in an HDF5 file.
+
+    Datasets are grown along the time axis in blocks of time_chunk entries rather than one entry at a time, and are trimmed to the number of entries actually written when the writer is closed.
+    The chunk shape keeps each HDF5 chunk near chunk_bytes, spanning several dumps for small items and a slice of channels and baselines of a single dump for large ones like xeng_raw.
+    """
+    def __init__(self, h5file, time_chunk = 128, compression = None, compression_opts = None, chunk_bytes = 1024*1024, logger = None):
+        self.f = h5file
+        self.time_chunk = time_chunk
+        self.compression = compression
+        self.compression_opts = compression_opts
+        self.chunk_bytes = chunk_bytes
+        self.logger = logger if logger != None else logging.getLogger('rx')
+        self.datasets = {}
+        self.index = {}
+
+    def has_key(self, name):
+        return self.datasets.has_key(name)
+
+    def chunk_shape(self, shape, itemsize):
+        """Chooses a chunk shape of roughly chunk_bytes for a dataset whose entries have the given shape."""
+        chunk = [1] + list(shape)
+        while (np.multiply.reduce(chunk) * itemsize * 2 <= self.chunk_bytes) and (chunk[0] * 2 <= self.time_chunk):
+            chunk[0] *= 2
+        while (np.multiply.reduce(chunk) * itemsize > self.chunk_bytes) and (max(chunk[1:] + [1]) > 1):
+            largest = chunk.index(max(chunk[1:]), 1)
+            chunk[largest] = (chunk[largest] + 1) / 2
+        return tuple(chunk)
+
+    def create(self, name, shape, dtype):
+        """Creates a dataset for an item. shape is the shape of one entry."""
+        shape = [] if list(shape) == [1] else list(shape)
+        self.logger.info("Creating dataset for %s (%s,%s)."%(str(name),str(shape),str(dtype)))
+        kwargs = {}
+        if self.compression != None:
+            kwargs = {'compression': self.compression, 'compression_opts': self.compression_opts, 'shuffle': True}
+        self.datasets[name] = self.f.create_dataset(name, [self.time_chunk] + shape, maxshape = [None] + shape,
+            dtype = dtype, chunks = self.chunk_shape(shape, np.dtype(dtype).itemsize), **kwargs)
+        self.index[name] = 0
+        return self.datasets[name]
+
+    def append(self, name, value):
+        """Writes the next entry of a dataset, growing it by time_chunk entries if it is full."""
+        ds = self.datasets[name]
+        idx = self.index[name]
+        if idx >= ds.shape[0]:
+            self.logger.debug("Growing dataset %s to %i entries."%(name, ds.shape[0] + self.time_chunk))
+            ds.resize(ds.shape[0] + self.time_chunk, axis = 0)
+        ds[idx] = value
+        self.index[name] = idx + 1
+
+    def close(self):
+        """Trims every dataset to the number of entries written, then flushes and closes the file."""
+        for name, ds in self.datasets.iteritems():
+            ds.resize(self.index[name], axis = 0)
+        self.f.flush()
+        self.f.close()
+
+def rx_buffer_sizing(n_chans, n_bls, int_time, pkt_payload_len, n_ports = 1, buffer_time = 2.0, min_dumps = 2, sample_bytes = 4, pkt_overhead = 64):
+    """Works out the receive buffering for the X engine output from the correlator config, rather than using fixed sizes.
+    Each port is sized to hold its share of buffer_time seconds of data, and never less than min_dumps dumps, so that whole dumps survive a stall in the receiving thread.
+
+    @param n_chans, n_bls, int_time: from the correlator config
+    @param pkt_payload_len: output packet payload in bytes (rx_pkt_payload_len)
+    @param n_ports: number of ports the output is split over
+    @param pkt_overhead: bytes of SPEAD, UDP and IP headers per packet
+    @return (pkt_count, buffer_size): the number of packets for PySPEAD to buffer, and the socket receive buffer in bytes to ask for, per port
+    """
+    dump_bytes = n_chans * n_bls * 2 * sample_bytes / n_ports
+    pkts_per_dump = int(np.ceil(float(dump_bytes) / pkt_payload_len))
+    n_dumps = max(min_dumps, int(np.ceil(buffer_time / int_time)))
+    pkt_count = pkts_per_dump * n_dumps
+    return pkt_count, pkt_count * (pkt_payload_len + pkt_overhead)
+
+def udp_rx_buffer_check(buffer_size, logger = None):
+    """Asks the kernel for a UDP socket receive buffer of buffer_size bytes and returns what it actually grants, since Linux silently caps SO_RCVBUF at net.core.rmem_max.
+    Logs a warning if it falls short."""
+    logger = logger if logger != None else logging.getLogger('rx')
+    buffer_size = min(buffer_size, 2**31 - 1)
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, buffer_size)
+        granted = s.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+    finally:
+        s.close()
+    if sys.platform.startswith('linux'):
+        # Linux reports twice the usable size, to allow for its own bookkeeping
+        granted /= 2
+    if granted < buffer_size:
+        try:
+            rmem_max = int(open('/proc/sys/net/core/rmem_max').read())
+        except (IOError, ValueError):
+            rmem_max = None
+        logger.warning("Asked for a %i byte UDP receive buffer, but the kernel only granted %i (net.core.rmem_max is %s). Raise it with 'sysctl -w net.core.rmem_max=%i' to avoid losing packets." % (
+            buffer_size, granted, str(rmem_max), buffer_size))
+    return granted
+
+def set_cpu_affinity(cpus, logger = None):
+    """Binds the calling thread to the given list of CPU numbers, with Linux's sched_setaffinity. Threads it starts afterwards inherit the binding.
+    Returns True on success, otherwise logs a warning and returns False."""
+    logger = logger if logger != None else logging.getLogger('rx')
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno = True)
+        word_bits = 8 * ctypes.sizeof(ctypes.c_ulong)
+        mask = (ctypes.c_ulong * (max(cpus) / word_bits + 1))()
+        for cpu in cpus:
+            mask[cpu / word_bits] |= 1 << (cpu % word_bits)
+        if libc.sched_setaffinity(0, ctypes.sizeof(mask), mask) != 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+    except (OSError, AttributeError, TypeError) as exc:
+        logger.warning("Could not bind to CPU(s) %s: %s" % (','.join([str(cpu) for cpu in cpus]), exc))
+        return False
+    logger.info("Bound to CPU(s) %s." % ','.join([str(cpu) for cpu in cpus]))
+    return True
+
+def set_busy_poll(busy_poll_us, logger = None):
+    """Sets the kernel's net.core.busy_read and net.core.busy_poll, so that socket reads and polls spin on the NIC for up to busy_poll_us microseconds before sleeping.
+    This trades CPU for latency, applies to the whole system and needs root. Returns True on success, otherwise logs how to set it by hand and returns False."""
+    logger = logger if logger != None else logging.getLogger('rx')
+    try:
+        for name in ['busy_read', 'busy_poll']:
+            f = open('/proc/sys/net/core/%s' % name, 'w')
+            f.write('%i\n' % busy_poll_us)
+            f.close()
+    except IOError as exc:
+        logger.warning("Could not enable busy polling (%s). Set it with 'sysctl -w net.core.busy_read=%i net.core.busy_poll=%i'." % (exc, busy_poll_us, busy_poll_us))
+        return False
+    logger.info("Busy polling for up to %i us." % busy_poll_us)
+    return True
+
+def udp_rx_open(port, pkt_count = 1024, buffer_size = 51200000, cpus = None, logger = None):
+    """Opens a PySPEAD UDP receiver on port with pkt_count packets of buffering and a socket receive buffer of buffer_size bytes, having checked the kernel will grant it.
+    If cpus is given, the calling thread, and so PySPEAD's receive thread, is bound to those CPUs first."""
+    logger = logger if logger != None else logging.getLogger('rx')
+    if cpus != None:
+        set_cpu_affinity(cpus, logger)
+    udp_rx_buffer_check(buffer_size, logger)
+    logger.info("Data reception on port %i, buffering %i packets with a %i byte socket buffer." % (port, pkt_count, buffer_size))
+    return spead.TransportUDPrx(port, pkt_count=pkt_count, buffer_size=buffer_size)
+
+def _claim_frame(slot_ts, slot_lock, timestamp):
+    """Returns the shared frame slot assembling the dump with this timestamp, claiming a free one if there is none yet. Returns None if every slot is taken."""
+    slot_lock.acquire()
+    try:
+        free = None
+        for slot in range(len(slot_ts)):
+            if slot_ts[slot] == timestamp:
+                return slot
+            if (free == None) and (slot_ts[slot] == -1):
+                free = slot
+        if free != None:
+            slot_ts[free] = timestamp
+        return free
+    finally:
+        slot_lock.release()
+
+def _release_frame(slot_ts, slot_lock, slot, timestamp):
+    """Frees a shared frame slot, if it is still assembling the dump with this timestamp."""
+    slot_lock.acquire()
+    if slot_ts[slot] == timestamp:
+        slot_ts[slot] = -1
+    slot_lock.release()
+
+def _inter_mp_worker(worker_n, port, frames_raw, frame_shape, n_xengs, slot_ts, slot_lock, events, forward_meta, rx_opts, cpus = None, log_level = logging.INFO, spead_log_level = logging.WARN):
+    """Receive process for CorrRx's inter_mp mode. Receives the X engine streams sent to one port and copies each X engine's data straight into its place in a shared frame.
+    Tells the coordinator about each contribution, and about metadata if forward_meta is set, through the events queue."""
+    logger = logging.getLogger('rx.worker%i' % worker_n)
+    logger.setLevel(log_level)
+    spead.logging.getLogger().setLevel(spead_log_level)
+    frames = np.frombuffer(frames_raw, dtype = np.int32).reshape(frame_shape)
+    logger.info("Worker %i receiving on port %i." % (worker_n, port))
+    rx = udp_rx_open(port, rx_opts['pkt_count'], rx_opts['buffer_size'], cpus, logger)
+    ig = spead.ItemGroup()
+    for heap in spead.iterheaps(rx):
+        ig.update(heap)
+        for name in ig.keys():
+            item = ig.get_item(name)
+            if not item._changed: continue
+            item._changed = False
+            if name.startswith("xeng_raw"):
+                xeng_id = int(name[8:])
+                timestamp = ig['timestamp%i' % xeng_id]
+                slot = _claim_frame(slot_ts, slot_lock, timestamp)
+                if slot == None:
+                    events.put(('drop', worker_n, xeng_id, timestamp))
+                    continue
+                frames[slot, xeng_id::n_xengs] = ig[name]
+                events.put(('part', worker_n, slot, xeng_id, timestamp))
+            elif name.startswith("timestamp"):
+                continue
+            elif forward_meta:
+                events.put(('meta', worker_n, name, item.id, item.description, ig[name]))
+    rx.stop()
+    logger.info("Worker %i got a SPEAD end-of-stream marker." % worker_n)
+    events.put(('end', worker_n))
+
+class DumpAccounting(object):
+    """Per-dump completeness, loss and latency accounting for the receive paths.
+
+    For every dump it records the bytes expected from, and received from, each X engine. Dumps that never arrived at all are found from gaps in the timestamps:
+    the dump period is taken as the smallest step seen between consecutive timestamps. Latency is the time from the end of an integration to the dump's arrival.
+    Rolling statistics cover the last window dumps, and running totals cover the whole stream.
+    """
+    def __init__(self, n_xengs, window = 100, logger = None):
+        self.n_xengs = n_xengs
+        self.window = window
+        self.logger = logger if logger != None else logging.getLogger('rx')
+        self._lock = threading.Lock()
+        self._recent = collections.deque(maxlen = window)
+        self._last_timestamp = None
+        self._step = None
+        self._totals = {'dumps': 0, 'dumps_incomplete': 0, 'dumps_missing': 0, 'dumps_late': 0, 'bytes_expected': 0, 'bytes_received': 0}
+
+    def dump(self, timestamp, received_bytes, expected_bytes, arrival_time = None, end_time = None):
+        """Records one dump.
+
+        @param timestamp: the dump's timestamp, in the correlator's timestamp units
+        @param received_bytes: list of the bytes received from each X engine, or None if the receive path can't tell.
+                               The dump is then assumed complete, so only missing dumps count towards the loss.
+        @param expected_bytes: list of the bytes expected from each X engine
+        @param arrival_time: when the dump arrived. Defaults to now.
+        @param end_time: unix time at which the integration ended, if known, for the latency
+        @return a list of booleans, True for each X engine that delivered all its data, or None if received_bytes is None
+        """
+        arrival_time = arrival_time if arrival_time != None else time.time()
+        measured = (received_bytes != None)
+        if not measured:
+            received_bytes = expected_bytes
+        complete = [received_bytes[x] >= expected_bytes[x] for x in range(self.n_xengs)]
+        self._lock.acquire()
+        missing = 0
+        late = False
+        if self._last_timestamp != None:
+            step = timestamp - self._last_timestamp
+            if step <= 0:
+                late = True
+            else:
+                self._step = step if self._step == None else min(self._step, step)
+                missing = max(int(round(float(step) / self._step)) - 1, 0)
+        if not late:
+            self._last_timestamp = timestamp
+        self._totals['dumps'] += 1
+        self._totals['dumps_incomplete'] += (False in complete)
+        self._totals['dumps_missing'] += missing
+        self._totals['dumps_late'] += late
+        self._totals['bytes_expected'] += sum(expected_bytes)
+        self._totals['bytes_received'] += sum(received_bytes)
+        self._recent.append((list(received_bytes), list(expected_bytes), missing, (arrival_time - end_time) if end_time != None else None))
+        self._lock.release()
+        if missing > 0:
+            self.logger.warning("%i dump(s) missing before timestamp %i." % (missing, timestamp))
+        if False in complete:
+            self.logger.warning("Dump with timestamp %i is incomplete. Missing data from X engine(s) %s." % (timestamp, ','.join([str(x) for x in range(self.n_xengs) if not complete[x]])))
+        return complete if measured else None
+
+    def stats(self):
+        """Returns a dictionary of the running totals (dumps, dumps_incomplete, dumps_missing, dumps_late, bytes_expected, bytes_received), and over the last window dumps:
+        loss, the fraction of expected bytes not received, counting missing dumps as entirely lost; xeng_loss, the same per X engine; and latency_mean and latency_max in seconds."""
+        self._lock.acquire()
+        rv = dict(self._totals)
+        recent = list(self._recent)
+        self._lock.release()
+        xeng_expected = np.zeros(self.n_xengs)
+        xeng_received = np.zeros(self.n_xengs)
+        for received, expected, missing, latency in recent:
+            xeng_expected += np.array(expected) * (1 + missing)
+            xeng_received += received
+        rv['xeng_loss'] = [(1 - xeng_received[x] / xeng_expected[x]) if xeng_expected[x] > 0 else 0.0 for x in range(self.n_xengs)]
+        rv['loss'] = (1 - xeng_received.sum() / xeng_expected.sum()) if xeng_expected.sum() > 0 else 0.0
+        latencies = [latency for received, expected, missing, latency in recent if latency != None]
+        rv['latency_mean'] = np.mean(latencies) if len(latencies) > 0 else None
+        rv['latency_max'] = max(latencies) if len(latencies) > 0 else None
+        return rv
+
+    def summary(self):
+        """Returns the statistics as a line for the log."""
+        stats = self.stats()
+        return "Last %i dumps: %.3f%% lost (worst X engine %.3f%%), latency %s. Totals: %i dumps, %i incomplete, %i missing, %i late." % (
+            self.window, 100 * stats['loss'], 100 * max(stats['xeng_loss'] + [0]),
+            ("mean %.3fs max %.3fs" % (stats['latency_mean'], stats['latency_max'])) if stats['latency_mean'] != None else "unknown",
+            stats['dumps'], stats['dumps_incomplete'], stats['dumps_missing'], stats['dumps_late'])
+
+class SdStream(object):
+    """Sends decimated signal display frames, made straight from a dump buffer.
+
+    Channels are averaged in blocks of chan_avg, only the baselines listed in baselines (indices into bls_ordering, default all) are sent,
+    and no more than max_rate frames are sent a second (default no limit). Frames are computed into a reused float32 buffer, and only the
+    selected baselines are read, so the dump itself is never copied whole. The ItemGroup is kept between frames, and rebuilt every
+    descriptor_period seconds so that displays started late still get the descriptors.
+    """
+    def __init__(self, tx, chan_avg = 1, baselines = None, max_rate = None, descriptor_period = 10.0, logger = None):
+        self.tx = tx
+        self.chan_avg = chan_avg
+        self.baselines = baselines
+        self.max_rate = max_rate
+        self.descriptor_period = descriptor_period
+        self.logger = logger if logger != None else logging.getLogger('rx')
+        self._frame = None
+        self._ig = None
+        self._ig_shape = None
+        self._last_descriptors = 0
+        self._last_sent = 0
+
+    def due(self):
+        """Returns True if a frame sent now would not exceed max_rate."""
+        return (self.max_rate == None) or (time.time() - self._last_sent >= 1.0 / self.max_rate)
+
+    def meta(self, items):
+        """Sends a metadata heap of (name, id, description, value) tuples, with n_chans, n_bls and bls_ordering changed to describe the decimated frames."""
+        ig = spead.ItemGroup()
+        for name, id, description, value in items:
+            if name == 'n_chans':
+                value = value / self.chan_avg
+            elif (name == 'n_bls') and (self.baselines != None):
+                value = len(self.baselines)
+            elif (name == 'bls_ordering') and (self.baselines != None):
+                value = np.asarray(value)[self.baselines]
+            ig.add_item(name=name, id=id, description=description, init_val=value)
+        self.tx.send_heap(ig.get_heap())
+
+    def frame(self, data, scale_factor = 1.0):
+        """Decimates a dump of shape (n_chans, n_bls, 2) into the frame buffer, dividing it by scale_factor, and returns the buffer."""
+        if self.baselines != None:
+            data = data.take(self.baselines, axis = 1)
+        n_chans = data.shape[0] / self.chan_avg
+        shape = (n_chans, data.shape[1], data.shape[2])
+        if (self._frame is None) or (self._frame.shape != shape):
+            self._frame = np.empty(shape, dtype = np.float32)
+        if self.chan_avg == 1:
+            np.multiply(data, 1.0 / scale_factor, self._frame)
+        else:
+            np.sum(data[:n_chans * self.chan_avg].reshape(n_chans, self.chan_avg, shape[1], shape[2]), axis = 1, dtype = np.float32, out = self._frame)
+            self._frame *= 1.0 / (scale_factor * self.chan_avg)
+        return self._frame
+
+    def send(self, data, sd_timestamp, scale_factor = 1.0):
+        """Decimates and sends a dump, with its timestamp in seconds since the epoch. Returns the frame sent."""
+        frame = self.frame(data, scale_factor)
+        now = time.time()
+        if (self._ig == None) or (self._ig_shape != frame.shape) or (now - self._last_descriptors > self.descriptor_period):
+            self._ig = spead.ItemGroup()
+            self._ig_shape = frame.shape
+            self._ig.add_item(name=('sd_data'),
+                            id=(0x3501),
+                            description="Combined raw data from all x engines.",
+                            ndarray=(frame.dtype,frame.shape))
+            self._ig.add_item(name=('sd_timestamp'),
+                            id=0x3502,
+                            description='Timestamp of this sd frame in centiseconds since epoch (40 bit limitation).',
+                            init_val=sd_timestamp)
+            self.logger.debug("Added SD frame with shape %s, dtype %s"%(str(frame.shape),str(frame.dtype)))
+            self.tx.send_heap(self._ig.get_heap())
+            self._last_descriptors = now
+        self._ig['sd_data'] = frame
+        self._ig['sd_timestamp'] = sd_timestamp * 100
+        self.tx.send_heap(self._ig.get_heap())
+        self._last_sent = now
+        return frame
+
+class DumpRing(object):
+    """A fixed pool of dump slots, shared between one receive stage and several consumer stages that each run at their own pace.
+
+    The receive stage fills a free slot and publishes it. Every consumer then sees the slot at most once, in publication order.
+    A lossless consumer (the file writer) sees every published dump. A lossy consumer (the signal display) always takes the newest one and skips any it was too slow for.
+    A slot goes back to the pool once every consumer has released or skipped it. If no slot is free, the receiver drops the new dump rather than waiting for a consumer, and counts it.
+    A slot holds references to the arrays PySPEAD decoded each dump into, which are new for every heap, so nothing is copied.
+    """
+    def __init__(self, n_slots = 8, logger = None):
+        self.n_slots = n_slots
+        self.logger = logger if logger != None else logging.getLogger('rx')
+        self.slots = [{'seq': -1, 'arrays': {}, 'names': [], 'items': {}, 'create': {}} for s in range(n_slots)]
+        self._cond = threading.Condition()
+        self._free = range(n_slots)
+        self._published = []
+        self._pending = [set() for s in range(n_slots)]
+        self._held = [set() for s in range(n_slots)]
+        self._consumers = {}
+        self._closed = False
+        self._seq = 0
+        self._stats = {'published': 0, 'dropped': 0, 'occupancy_max': 0}
+
+    def add_consumer(self, name, lossy = False):
+        """Registers a consumer. It will see dumps published from now on."""
+        self._cond.acquire()
+        self._consumers[name] = {'lossy': lossy, 'consumed': 0, 'skipped': 0}
+        self._cond.release()
+
+    def remove_consumer(self, name):
+        """Unregisters a consumer and releases every slot it was still due to see."""
+        self._cond.acquire()
+        self._consumers.pop(name)
+        for idx in list(self._published):
+            self._held[idx].discard(name)
+            self._done(idx, name)
+        self._cond.release()
+
+    def _done(self, idx, name):
+        """Marks slot idx as finished with by consumer name, and frees it if no one else needs it. Call with the lock held."""
+        self._pending[idx].discard(name)
+        if (len(self._pending[idx]) == 0) and (len(self._held[idx]) == 0):
+            self._published.remove(idx)
+            self._free.append(idx)
+            self._cond.notify_all()
+
+    def acquire(self):
+        """Returns the index of a free slot for the receive stage to fill, or None if the dump has to be dropped.
+        Published slots only waiting on lossy consumers are reclaimed if necessary."""
+        self._cond.acquire()
+        try:
+            if len(self._free) == 0:
+                for idx in self._published:
+                    if (len(self._held[idx]) == 0) and (False not in [self._consumers[name]['lossy'] for name in self._pending[idx]]):
+                        for name in list(self._pending[idx]):
+                            self._consumers[name]['skipped'] += 1
+                            self._done(idx, name)
+                        break
+            if len(self._free) == 0:
+                self._stats['dropped'] += 1
+                return None
+            return self._free.pop(0)
+        finally:
+            self._cond.release()
+
+    def publish(self, idx):
+        """Hands a filled slot to the consumers."""
+        self._cond.acquire()
+        self.slots[idx]['seq'] = self._seq
+        self._seq += 1
+        self._pending[idx] = set(self._consumers.keys())
+        self._published.append(idx)
+        self._stats['published'] += 1
+        self._stats['occupancy_max'] = max(self._stats['occupancy_max'], len(self._published))
+        if len(self._pending[idx]) == 0:
+            self._done(idx, None)
+        self._cond.notify_all()
+        self._cond.release()
+
+    def get(self, name, timeout = None):
+        """Waits for the next slot consumer name should see and returns its index. A lossy consumer gets the newest published slot and skips the ones before it.
+        Returns None once the ring is closed and nothing is left for this consumer, or when timeout seconds pass without a slot."""
+        self._cond.acquire()
+        try:
+            deadline = None if timeout == None else time.time() + timeout
+            while True:
+                waiting = [idx for idx in self._published if (name in self._pending[idx]) and (name not in self._held[idx])]
+                if len(waiting) > 0:
+                    consumer = self._consumers[name]
+                    if consumer['lossy']:
+                        for idx in waiting[:-1]:
+                            consumer['skipped'] += 1
+                            self._done(idx, name)
+                    idx = waiting[-1] if consumer['lossy'] else waiting[0]
+                    self._held[idx].add(name)
+                    consumer['consumed'] += 1
+                    return idx
+                if self._closed:
+                    return None
+                if deadline != None and time.time() >= deadline:
+                    return None
+                self._cond.wait(1.0 if deadline == None else min(1.0, max(deadline - time.time(), 0)))
+        finally:
+            self._cond.release()
+
+    def release(self, name, idx):
+        """Tells the ring that consumer name has finished with slot idx."""
+        self._cond.acquire()
+        self._held[idx].discard(name)
+        self._done(idx, name)
+        self._cond.release()
+
+    def close(self):
+        """Marks the end of the stream. Consumers get the slots still due to them, then None."""
+        self._cond.acquire()
+        self._closed = True
+        self._cond.notify_all()
+        self._cond.release()
+
+    def stats(self):
+        """Returns a dictionary of counters: dumps published and dropped, the current and largest number of slots in use,
+        and the number of dumps each consumer has taken and skipped."""
+        self._cond.acquire()
+        rv = dict(self._stats)
+        rv['n_slots'] = self.n_slots
+        rv['occupancy'] = len(self._published)
+        for name, consumer in self._consumers.iteritems():
+            rv['%s_consumed' % name] = consumer['consumed']
+            rv['%s_skipped' % name] = consumer['skipped']
+        self._cond.release()
+        return rv
+
 class CorrRx(threading.Thread):
-    def __init__(self, mode = 'cont', port=7148, log_handler = None, log_level = logging.INFO, spead_log_level = logging.WARN, **kwargs):
+    def __init__(self, mode = 'cont', port=7148, log_handler = None, log_level = logging.INFO, spead_log_level = logging.WARN,
+                 rx_pkt_count = 1024, rx_buffer_size = 51200000, cpu_affinity = None, busy_poll_us = None, **kwargs):
+        """
+        rx_pkt_count and rx_buffer_size set the receive buffering per port (see rx_buffer_sizing to work them out from the correlator config).
+        cpu_affinity is an optional list of CPUs for reception: the receive thread is bound to all of them, or in inter_mp mode each worker to one, in turn.
+        busy_poll_us, if given, turns on the kernel's socket busy polling for that many microseconds (see set_busy_poll).
+        """
         if log_handler == None:
             log_handler = log_handlers.DebugLogHandler(100)
         self.log_handler = log_handler
@@ -34,163 +542,261 @@ class CorrRx(threading.Thread):
             self._target = self.rx_cont
         elif mode=='inter':
             self._target = self.rx_inter
+        elif mode=='inter_mp':
+            self._target = self.rx_inter_mp
         else:
-            raise RuntimeError('Mode not understood. Expecting inter or cont.')
+            raise RuntimeError('Mode not understood. Expecting inter, inter_mp or cont.')
         self._kwargs = kwargs
+        self.rx_opts = {'pkt_count': rx_pkt_count, 'buffer_size': rx_buffer_size, 'cpu_affinity': cpu_affinity}
+        self.busy_poll_us = busy_poll_us
+        self.ring = None
+        self.mp_stats = None
+        self.accounting = None
         #print kwargs
         threading.Thread.__init__(self)
 
     def run(self):
         #print 'starting target with kwargs ',self._kwargs
+        if self.busy_poll_us != None:
+            set_busy_poll(self.busy_poll_us, self.logger)
         self._target(**self._kwargs)
 
-    def rx_cont(self,data_port=7148, sd_ip='127.0.0.1', sd_port=7149,acc_scale=True, filename=None,**kwargs):
+    def stats(self):
+        """Returns the receive pipeline's counters: DumpRing.stats in cont mode, frames assembled, incomplete, late and dropped in inter_mp mode, or an empty dictionary if neither is running.
+        Once the X engine count is known, the DumpAccounting statistics are included too."""
+        rv = {}
+        if self.ring != None:
+            rv = self.ring.stats()
+        elif self.mp_stats != None:
+            rv = dict(self.mp_stats)
+        if self.accounting != None:
+            rv.update(self.accounting.stats())
+        return rv
+
+    def rx_cont(self,data_port=7148, sd_ip='127.0.0.1', sd_port=7149,acc_scale=True, filename=None, h5_time_chunk=128, h5_compression=None, h5_compression_opts=None, ring_slots=8, stats_period=10, stats_window=100, sd_chan_avg=1, sd_baselines=None, sd_max_rate=None, **kwargs):
+        """Receives dumps into a DumpRing of ring_slots dumps, from which separate threads write the HDF5 file and send the signal display frames.
+        The signal display gets every sd_chan_avg channels averaged, only the sd_baselines baselines (default all), at most sd_max_rate frames a second (see SdStream).
+        A slow disk write then only fills the ring, rather than holding up reception.
+        Each dump is accounted for (see DumpAccounting). A contiguous dump arrives as a single item, and PySPEAD doesn't say which X engines' packets made it into the heap,
+        so only whole missing dumps and latency are measured here, and no xeng_complete dataset is written.
+        Ring and loss statistics are logged every stats_period seconds, the loss statistics over the last stats_window dumps."""
         logger=self.logger
-        logger.info("Data reception on port %i."%data_port)
-        rx = spead.TransportUDPrx(data_port, pkt_count=1024, buffer_size=51200000)
         logger.info("Sending Signal Display data to %s:%i."%(sd_ip,sd_port))
         tx_sd = spead.Transmitter(spead.TransportUDPtx(sd_ip, sd_port))
         ig = spead.ItemGroup()
-        ig_sd = spead.ItemGroup()
         if filename == None:
             filename=str(int(time.time())) + ".synth.h5"
         logger.info("Starting file %s."%(filename))
         f = h5py.File(filename, mode="w")
-        data_ds = None
-        ts_ds = None
+        datasets = H5Writer(f, time_chunk=h5_time_chunk, compression=h5_compression, compression_opts=h5_compression_opts, logger=logger)
+        ring = DumpRing(ring_slots, logger = logger)
+        ring.add_consumer('writer')
+        ring.add_consumer('sd', lossy = True)
+        self.ring = ring
+        sd_meta = Queue.Queue()
+        meta = {}
+        writer = threading.Thread(target = self._write_stage, args = (ring, datasets), name = 'CorrRx writer')
+        sd_stream = SdStream(tx_sd, chan_avg = sd_chan_avg, baselines = sd_baselines, max_rate = sd_max_rate, logger = logger)
+        sd = threading.Thread(target = self._sd_stage, args = (ring, sd_stream, sd_meta, meta, acc_scale), name = 'CorrRx sd')
+        writer.daemon = True
+        sd.daemon = True
+        writer.start()
+        sd.start()
+        # opened after the writer and signal display threads start, so that they don't inherit the receive CPU affinity
+        rx = udp_rx_open(data_port, self.rx_opts['pkt_count'], self.rx_opts['buffer_size'], self.rx_opts['cpu_affinity'], logger)
+
         idx = 0
-        dump_size = 0
-        datasets = {}
-        datasets_index = {}
+        known = {}
+        create = {}
+        carry = {}
         meta_required = ['n_chans','bandwidth','n_bls','n_xengs','center_freq','bls_ordering']
          # we need these bits of meta data before being able to assemble and transmit signal display data
-        meta_desired = ['n_accs']
-        meta = {}
+        meta_desired = ['n_accs','int_time']
+        last_stats = time.time()
         for heap in spead.iterheaps(rx):
             ig.update(heap)
             logger.debug("PROCESSING HEAP idx(%i) cnt(%i) @ %.4f" % (idx, heap.heap_cnt, time.time()))
+            changed = {}
             for name in ig.keys():
                 item = ig.get_item(name)
-                if not item._changed and datasets.has_key(name): continue # the item is not marked as changed, and we have a record for it
+                if not item._changed and known.has_key(name): continue # the item is not marked as changed, and we have a record for it
                 if name in meta_desired:
                     meta[name] = ig[name]
                 if name in meta_required:
                     meta[name] = ig[name]
                     meta_required.pop(meta_required.index(name))
                     if len(meta_required) == 0:
-                        #sd_frame = np.zeros((meta['n_chans'],meta['n_bls'],2),dtype=np.float32)
                         logger.info("Got all required metadata. Expecting data frame shape of %i %i %i"%(meta['n_chans'],meta['n_bls'],2))
                         meta_required = ['n_chans','bandwidth','n_bls','n_xengs','center_freq','bls_ordering']
-                        ig_sd = spead.ItemGroup()
-                        for meta_item in meta_required:
-                          ig_sd.add_item(
-                            name=ig.get_item(meta_item).name,
-                            id=ig.get_item(meta_item).id,
-                            description=ig.get_item(meta_item).description,
-                            #shape=ig.get_item(meta_item).shape,
-                            #fmt=ig.get_item(meta_item).format,
-                            init_val=ig.get_item(meta_item).get_value())
-                        tx_sd.send_heap(ig_sd.get_heap())
+                        sd_meta.put([(ig.get_item(meta_item).name, ig.get_item(meta_item).id, ig.get_item(meta_item).description, ig.get_item(meta_item).get_value()) for meta_item in meta_required])
 
-                if not datasets.has_key(name):
+                if not known.has_key(name):
                  # check to see if we have encountered this type before
                     shape = ig[name].shape if item.shape == -1 else item.shape
                     dtype = np.dtype(type(ig[name])) if shape == [] else item.dtype
                     if dtype is None: dtype = ig[name].dtype
                      # if we can't get a dtype from the descriptor try and get one from the value
-                    logger.info("Creating dataset for %s (%s,%s)."%(str(name),str(shape),str(dtype)))
-                    f.create_dataset(name,[1] + ([] if list(shape) == [1] else list(shape)), maxshape=[None] + ([] if list(shape) == [1] else list(shape)), dtype=dtype)
-                    dump_size += np.multiply.reduce(shape) * dtype.itemsize
-                    datasets[name] = f[name]
-                    datasets_index[name] = 0
+                    known[name] = (shape, dtype)
+                    create[name] = (shape, dtype)
                     if not item._changed: continue
                      # if we built from and empty descriptor
-                else:
-                    logger.info("Adding %s to dataset. New size is %i."%(name,datasets_index[name]+1))
-                    f[name].resize(datasets_index[name]+1, axis=0)
-                if name.startswith("xeng_raw"):
-                    sd_timestamp = ig['sync_time'] + (ig['timestamp'] / float(ig['scale_factor_timestamp']))
-                    #logger.info("SD Timestamp: %f (%s)."%(sd_timestamp,time.ctime(sd_timestamp)))
-
-                    scale_factor=float(meta['n_accs'] if (meta.has_key('n_accs') and acc_scale) else 1)
-                    scaled_data = (ig[name]/scale_factor).astype(np.float32)
-
-                     # reinit the group to force meta data resend
-                    ig_sd = spead.ItemGroup()
-                    ig_sd.add_item(name=('sd_data'),
-                                    id=(0x3501),
-                                    description="Combined raw data from all x engines.",
-                                    ndarray=(scaled_data.dtype,scaled_data.shape))
-                    ig_sd.add_item(name=('sd_timestamp'),
-                                    id=0x3502,
-                                    description='Timestamp of this sd frame in centiseconds since epoch (40 bit limitation).',
-                                    init_val=sd_timestamp)
-                                    #shape=[],
-                                    #fmt=spead.mkfmt(('u',spead.ADDRSIZE)))
-                    t_it = ig_sd.get_item('sd_data')
-                    logger.debug("Added SD frame with shape %s, dtype %s"%(str(t_it.shape),str(t_it.dtype)))
-                    tx_sd.send_heap(ig_sd.get_heap())
-
-                    logger.info("Sending signal display frame with timestamp %i (%s). %s. Max: %i, Mean: %i"%(
-                        sd_timestamp,
-                        time.ctime(sd_timestamp),
-                        "Unscaled" if not acc_scale else "Scaled by %i" % (scale_factor),
-                        np.max(scaled_data),
-                        np.mean(scaled_data)))
-                    ig_sd['sd_data'] = scaled_data
-                    ig_sd['sd_timestamp'] = sd_timestamp * 100
-                    #ig_sd['sd_timestamp'] = sd_timestamp
-                    tx_sd.send_heap(ig_sd.get_heap())
-
-                f[name][datasets_index[name]] = ig[name]
-                datasets_index[name] += 1
+                changed[name] = ig[name]
                 item._changed = False
                   # we have dealt with this item so continue...
             idx+=1
+            if changed.has_key('xeng_raw') and meta.has_key('n_xengs'):
+                if self.accounting == None:
+                    self.accounting = DumpAccounting(meta['n_xengs'], window = stats_window, logger = logger)
+                shape, dtype = known['xeng_raw']
+                expected = [np.multiply.reduce(shape) * dtype.itemsize / meta['n_xengs']] * meta['n_xengs']
+                end_time = None
+                if meta.has_key('int_time'):
+                    end_time = ig['sync_time'] + (ig['timestamp'] / float(ig['scale_factor_timestamp'])) + meta['int_time']
+                self.accounting.dump(ig['timestamp'], None, expected, end_time = end_time)
+            if len(changed) == 0 and len(create) == 0: continue
+
+            slot_n = ring.acquire()
+            if slot_n == None:
+                logger.warn("No free dump slots: dropped heap idx(%i) with %s." % (idx - 1, ', '.join(changed.keys())))
+                # keep the small items for the next dump that makes it into the ring, only the data is lost
+                for name, value in changed.iteritems():
+                    if not name.startswith("xeng_raw"): carry[name] = value
+                continue
+            slot = ring.slots[slot_n]
+            carry.update(changed)
+            slot['create'] = create
+            slot['items'] = {}
+            slot['names'] = []
+            slot['arrays'] = {}
+            for name, value in carry.iteritems():
+                if name.startswith("xeng_raw"):
+                    slot['arrays'][name] = value
+                    slot['names'].append(name)
+                    slot['sd_timestamp'] = ig['sync_time'] + (ig['timestamp'] / float(ig['scale_factor_timestamp']))
+                else:
+                    slot['items'][name] = value
+            ring.publish(slot_n)
+            create = {}
+            carry = {}
+
+            if time.time() - last_stats > stats_period:
+                stats = ring.stats()
+                # the writer unregisters itself if it fails
+                writer_state = "Writer FAILED" if not stats.has_key('writer_consumed') else "Writer %i behind" % (stats['published'] - stats['writer_consumed'])
+                (logger.warn if (stats['dropped'] > 0) or (not stats.has_key('writer_consumed')) else logger.info)("Dump ring: %i of %i slots in use (max %i). %i dumps received, %i dropped. %s, signal display skipped %i." % (
+                    stats['occupancy'], stats['n_slots'], stats['occupancy_max'], stats['published'], stats['dropped'],
+                    writer_state, stats.get('sd_skipped', 0)))
+                if self.accounting != None:
+                    logger.info(self.accounting.summary())
+                last_stats = time.time()
 
-#        for (name,idx) in datasets_index.iteritems():
+#        for (name,idx) in datasets.index.iteritems():
 #            if idx == 1:
 #                self.logger.info("Repacking dataset %s as an attribute as it is singular."%name)
 #                f['/'].attrs[name] = f[name].value[0]
 #                f.__delitem__(name)
-        logger.info("Got a SPEAD end-of-stream marker. Closing File.")
-        f.flush()
-        f.close()
+        logger.info("Got a SPEAD end-of-stream marker. Waiting for the writer to catch up.")
         rx.stop()
-        ig_sd = None
-        sd_timestamp = None
+        ring.close()
+        writer.join()
+        sd.join()
+        logger.info("Closing File. %s" % str(ring.stats()))
+        if self.accounting != None:
+            logger.info(self.accounting.summary())
+        datasets.close()
         logger.info("Files and sockets closed.")
 
+    def _write_stage(self, ring, datasets):
+        """Writer thread: appends every dump in the ring to the HDF5 file."""
+        logger = self.logger
+        try:
+            while True:
+                slot_n = ring.get('writer')
+                if slot_n == None: break
+                slot = ring.slots[slot_n]
+                try:
+                    for name, (shape, dtype) in slot['create'].iteritems():
+                        datasets.create(name, shape, dtype)
+                    for name, value in slot['items'].items() + [(name, slot['arrays'][name]) for name in slot['names']]:
+                        logger.debug("Adding %s to dataset. New size is %i."%(name,datasets.index[name]+1))
+                        datasets.append(name, value)
+                finally:
+                    ring.release('writer', slot_n)
+        except Exception:
+            logger.exception("HDF5 writer failed. No further data will be stored.")
+            ring.remove_consumer('writer')
+
+    def _sd_stage(self, ring, sd, sd_meta, meta, acc_scale):
+        """Signal display thread: sends the newest dump in the ring, skipping any that arrived while it was busy or sooner than the SD's maximum rate allows."""
+        logger = self.logger
+        while True:
+            slot_n = ring.get('sd')
+            while not sd_meta.empty():
+                sd.meta(sd_meta.get())
+            if slot_n == None: break
+            slot = ring.slots[slot_n]
+            try:
+                for name in slot['names']:
+                    if not sd.due(): continue
+                    sd_timestamp = slot['sd_timestamp']
+                    #logger.info("SD Timestamp: %f (%s)."%(sd_timestamp,time.ctime(sd_timestamp)))
+                    scale_factor=float(meta['n_accs'] if (meta.has_key('n_accs') and acc_scale) else 1)
+                    frame = sd.send(slot['arrays'][name], sd_timestamp, scale_factor)
+                    logger.info("Sending signal display frame with timestamp %i (%s). %s. Max: %i, Mean: %i"%(
+                        sd_timestamp,
+                        time.ctime(sd_timestamp),
+                        "Unscaled" if not acc_scale else "Scaled by %i" % (scale_factor),
+                        np.max(frame),
+                        np.mean(frame)))
+            except Exception:
+                logger.exception("Could not send signal display frame.")
+            finally:
+                ring.release('sd', slot_n)
+
 
-    def rx_inter(self,data_port=7148, sd_ip='127.0.0.1', sd_port=7149, acc_scale=True, filename=None, **kwargs):
+    def rx_inter(self,data_port=7148, sd_ip='127.0.0.1', sd_port=7149, acc_scale=True, filename=None, h5_time_chunk=128, h5_compression=None, h5_compression_opts=None, stats_period=10, stats_window=100, sd_chan_avg=1, sd_baselines=None, sd_max_rate=None, **kwargs):
         '''
         Process SPEAD data from X engines and forward it to the SD.
+        Each dump is accounted for (see DumpAccounting) from the X engines' timestamp%i items: an X engine counts as having delivered a dump
+        if its xeng_raw%i arrived with its timestamp. A dump is accounted once every X engine has reported it, or once two newer dumps have started.
+        Loss statistics are logged every stats_period seconds, over the last stats_window dumps.
+        sd_chan_avg, sd_baselines and sd_max_rate decimate the signal display stream (see SdStream).
         '''
         print 'WARNING: This function is not yet tested. YMMV.'
         logger=self.logger
-        logger.info("Data reception on port %i."%data_port)
-        rx = spead.TransportUDPrx(data_port, pkt_count=1024, buffer_size=51200000)
+        rx = udp_rx_open(data_port, self.rx_opts['pkt_count'], self.rx_opts['buffer_size'], self.rx_opts['cpu_affinity'], logger)
         logger.info("Sending Signal Display data to %s:%i."%(sd_ip,sd_port))
-        tx_sd = spead.Transmitter(spead.TransportUDPtx(sd_ip, sd_port))
+        sd = SdStream(spead.Transmitter(spead.TransportUDPtx(sd_ip, sd_port)), chan_avg = sd_chan_avg, baselines = sd_baselines, max_rate = sd_max_rate, logger = logger)
         ig = spead.ItemGroup()
-        ig_sd = spead.ItemGroup()
         if filename == None:
           filename=str(int(time.time())) + ".synth.h5"
         logger.info("Starting file %s."%(filename))
         f = h5py.File(filename, mode="w")
-        data_ds = None
-        ts_ds = None
+        datasets = H5Writer(f, time_chunk=h5_time_chunk, compression=h5_compression, compression_opts=h5_compression_opts, logger=logger)
         idx = 0
         dump_size = 0
-        datasets = {}
-        datasets_index = {}
         # we need these bits of meta data before being able to assemble and transmit signal display data
         meta_required = ['n_chans','n_bls','n_xengs','center_freq','bls_ordering','bandwidth']
-        meta_desired = ['n_accs']
+        meta_desired = ['n_accs','int_time']
         meta = {}
         sd_frame = None
         sd_slots = None
         timestamp = None
+        # dumps being accounted, keyed on raw timestamp, and the size of each X engine's xeng_raw
+        dumps = {}
+        xeng_bytes = {}
+        last_stats = time.time()
+
+        def account(ts):
+            dump = dumps.pop(ts)
+            n_xengs = meta['n_xengs']
+            size = max(xeng_bytes.values()) if len(xeng_bytes) > 0 else 0
+            expected = [xeng_bytes.get(x, size) for x in range(n_xengs)]
+            received = [dump['xengs'].get(x, 0) for x in range(n_xengs)]
+            end_time = None
+            if meta.has_key('int_time'):
+                end_time = ig['sync_time'] + (ts / float(ig['scale_factor_timestamp'])) + meta['int_time']
+            self.accounting.dump(ts, received, expected, arrival_time = dump['arrival'], end_time = end_time)
 
         # log the latest timestamp for which we've stored data
         currentTimestamp = -1
@@ -199,6 +805,8 @@ class CorrRx(threading.Thread):
         for heap in spead.iterheaps(rx):
             ig.update(heap)
             logger.debug("PROCESSING HEAP idx(%i) cnt(%i) @ %.4f" % (idx, heap.heap_cnt, time.time()))
+            heap_data = {}
+            heap_ts = {}
             for name in ig.keys():
                 item = ig.get_item(name)
 
@@ -207,6 +815,12 @@ class CorrRx(threading.Thread):
                   continue
                 logger.debug("PROCESSING KEY %s @ %.4f" % (name, time.time()))
 
+                # note which X engines delivered what in this heap, for the accounting
+                if item._changed and name.startswith("xeng_raw"):
+                  heap_data[int(name[8:])] = ig[name].nbytes
+                if item._changed and name.startswith("timestamp"):
+                  heap_ts[int(name[9:])] = ig[name]
+
                 if name in meta_desired:
                     meta[name] = ig[name]
 
@@ -217,16 +831,7 @@ class CorrRx(threading.Thread):
                     sd_frame = np.zeros((meta['n_chans'],meta['n_bls'],2),dtype=np.float32)
                     logger.info("Got all required metadata. Initialised sd frame to shape %s"%(str(sd_frame.shape)))
                     meta_required = ['n_chans','bandwidth','n_bls','n_xengs','center_freq','bls_ordering']
-                    ig_sd = spead.ItemGroup()
-                    for meta_item in meta_required:
-                      ig_sd.add_item(
-                        name=ig.get_item(meta_item).name,
-                        id=ig.get_item(meta_item).id,
-                        description=ig.get_item(meta_item).description,
-                        #shape=ig.get_item(meta_item).shape,
-                        #fmt=ig.get_item(meta_item).format,
-                        init_val=ig.get_item(meta_item).get_value())
-                    tx_sd.send_heap(ig_sd.get_heap())
+                    sd.meta([(ig.get_item(meta_item).name, ig.get_item(meta_item).id, ig.get_item(meta_item).description, ig.get_item(meta_item).get_value()) for meta_item in meta_required])
                     sd_slots = np.zeros(meta['n_xengs'])
                 if not datasets.has_key(name):
                  # check to see if we have encountered this type before
@@ -234,17 +839,15 @@ class CorrRx(threading.Thread):
                   dtype = np.dtype(type(ig[name])) if shape == [] else item.dtype
                   if dtype is None: dtype = ig[name].dtype
                    # if we can't get a dtype from the descriptor, try and get one from the value
-                  logger.info("Creating dataset for %s (%s,%s)."%(str(name),str(shape),str(dtype)))
-                  f.create_dataset(name,[1] + ([] if list(shape) == [1] else list(shape)), maxshape=[None] + ([] if list(shape) == [1] else list(shape)), dtype=dtype)
+                  datasets.create(name, shape, dtype)
                   dump_size += np.multiply.reduce(shape) * dtype.itemsize
-                  datasets[name] = f[name]
-                  datasets_index[name] = 0
+                  if name.startswith("xeng_raw"):
+                    xeng_bytes[int(name[8:])] = np.multiply.reduce(shape) * dtype.itemsize
                   # if we built from an empty descriptor
                   if not item._changed:
                     continue
                 else:
-                  logger.info("Adding %s to dataset. New size is %i."%(name,datasets_index[name]+1))
-                  f[name].resize(datasets_index[name]+1, axis=0)
+                  logger.debug("Adding %s to dataset. New size is %i."%(name,datasets.index[name]+1))
 
                 # now we store this x engine's data for sending sd data.
                 if sd_frame is not None and name.startswith("xeng_raw"):
@@ -269,8 +872,8 @@ class CorrRx(threading.Thread):
                   if (timestamp > currentTimestamp) and sd_slots.any():
                     errorString = "New timestamp %.2f from Xeng%i before previous set %.2f sent" % (timestamp, xeng_id, currentTimestamp)
                     logger.warning(errorString)
-                    sd_slots = np.zeros(meta['n_xengs'])
-                    sd_frame = np.zeros((ig['n_chans'],ig['n_bls'],2),dtype=sd_frame.dtype)
+                    sd_slots[:] = 0
+                    sd_frame[:] = 0
                     currentTimestamp = -1
                     continue
 
@@ -284,33 +887,196 @@ class CorrRx(threading.Thread):
                   sd_slots[xeng_id] = timestamp
                   currentTimestamp = timestamp
 
-                # do we have integration data and timestamps for all the xengines? If so, send the SD frame.
+                # do we have integration data and timestamps for all the xengines? If so, send the SD frame, unless that would exceed the SD's maximum rate.
                 if timestamp is not None and sd_frame is not None and sd_slots is not None and sd_slots.all():
-                    ig_sd = spead.ItemGroup()
-                    # make sure we have the right dtype for the sd data
-                    ig_sd.add_item(name=('sd_data'), id=(0x3501), description="Combined raw data from all x engines.", ndarray=(sd_frame.dtype,sd_frame.shape))
-                    ig_sd.add_item(name=('sd_timestamp'), id=0x3502, description='Timestamp of this sd frame in centiseconds since epoch (40 bit limitation).', shape=[], fmt=spead.mkfmt(('u',spead.ADDRSIZE)))
-                    t_it = ig_sd.get_item('sd_data')
-                    logger.info("Added SD frame with shape %s, dtype %s" % (str(t_it.shape),str(t_it.dtype)))
-                    scale_factor=(meta['n_accs'] if meta.has_key('n_accs') else 1)
-                    logger.info("Sending signal display frame with timestamp %i (%s). %s. @ %.4f" % (timestamp, time.ctime(timestamp), "Unscaled" if not acc_scale else "Scaled by %i" % (scale_factor), time.time()))
-                    ig_sd['sd_data'] = sd_frame.astype(np.float32) if not acc_scale else (sd_frame / float(scale_factor)).astype(np.float32)
-                    ig_sd['sd_timestamp'] = int(timestamp * 100)
-                    tx_sd.send_heap(ig_sd.get_heap())
-                    # reset the arrays that hold integration data
-                    sd_slots = np.zeros(meta['n_xengs'])
-                    sd_frame = np.zeros((ig['n_chans'],ig['n_bls'],2),dtype=sd_frame.dtype)
+                    if sd.due():
+                        scale_factor=float(meta['n_accs'] if (meta.has_key('n_accs') and acc_scale) else 1)
+                        logger.info("Sending signal display frame with timestamp %i (%s). %s. @ %.4f" % (timestamp, time.ctime(timestamp), "Unscaled" if not acc_scale else "Scaled by %i" % (scale_factor), time.time()))
+                        sd.send(sd_frame, timestamp, scale_factor)
+                    # reset the buffers that hold integration data, for the next dump
+                    sd_slots[:] = 0
+                    sd_frame[:] = 0
                     timestamp = None
 
-                f[name][datasets_index[name]] = ig[name]
-                datasets_index[name] += 1
+                datasets.append(name, ig[name])
                 item._changed = False
             idx+=1
 
+            if meta.has_key('n_xengs') and len(heap_ts) > 0:
+                if self.accounting == None:
+                    self.accounting = DumpAccounting(meta['n_xengs'], window = stats_window, logger = logger)
+                for xeng_id, ts in heap_ts.iteritems():
+                    dump = dumps.setdefault(ts, {'arrival': time.time(), 'xengs': {}})
+                    dump['xengs'][xeng_id] = heap_data.get(xeng_id, 0)
+                # oldest first, so that DumpAccounting sees the timestamps in order
+                for ts in sorted(dumps.keys()):
+                    if (len(dumps[ts]['xengs']) < meta['n_xengs']) and (len(dumps) <= 2):
+                        break
+                    account(ts)
+            if (self.accounting != None) and (time.time() - last_stats > stats_period):
+                logger.info(self.accounting.summary())
+                last_stats = time.time()
+
+        for ts in sorted(dumps.keys()):
+            account(ts)
+        if self.accounting != None:
+            logger.info(self.accounting.summary())
         logger.info("Got a SPEAD end-of-stream marker. Closing File.")
-        f.flush()
-        f.close()
+        datasets.close()
         rx.stop()
         sd_frame = None
         sd_slots = None
-        ig_sd = None
+
+    def rx_inter_mp(self, data_port=7148, n_ports=1, n_chans=None, n_bls=None, n_xengs=None, n_frames=4, sd_ip='127.0.0.1', sd_port=7149, acc_scale=True, filename=None, h5_time_chunk=128, h5_compression=None, h5_compression_opts=None, stats_period=10, stats_window=100, sd_chan_avg=1, sd_baselines=None, sd_max_rate=None, frame_timeout=None, **kwargs):
+        """
+        Receives the interleaved X engine output in n_ports worker processes, listening on ports data_port to data_port+n_ports-1 (see Correlator.config_udp_output's per_board_ports), so that reception isn't limited to one core.
+        Workers copy each X engine's data into one of n_frames frames in shared memory. This thread assembles them, writes each frame to the HDF5 file as xeng_raw and timestamp, and forwards complete ones to the SD.
+        A frame that some X engines never contribute to is written anyway, with their channels zeroed, as soon as a later frame completes, a slice is dropped for want of a free frame,
+        or frame_timeout seconds pass after its first slice arrived (default one and a half integrations, or 2 seconds until int_time is known). A dead X engine thus costs only its own channels.
+        xeng_complete records which X engines each frame has data from.
+        Loss statistics (see DumpAccounting) are logged every stats_period seconds, over the last stats_window frames.
+        sd_chan_avg, sd_baselines and sd_max_rate decimate the signal display stream (see SdStream).
+        n_chans, n_bls and n_xengs must be given, from the correlator config, so that the shared frames can be allocated before the workers start.
+        """
+        if None in [n_chans, n_bls, n_xengs]:
+            raise RuntimeError('n_chans, n_bls and n_xengs are needed to allocate the shared frames.')
+        logger=self.logger
+        frame_shape = (n_frames, n_chans, n_bls, 2)
+        frames_raw = multiprocessing.sharedctypes.RawArray(ctypes.c_int32, n_frames*n_chans*n_bls*2)
+        frames = np.frombuffer(frames_raw, dtype = np.int32).reshape(frame_shape)
+        slot_ts = multiprocessing.sharedctypes.RawArray(ctypes.c_longlong, [-1] * n_frames)
+        slot_lock = multiprocessing.Lock()
+        events = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target = _inter_mp_worker, name = 'CorrRx worker %i' % w,
+            args = (w, data_port + w, frames_raw, frame_shape, n_xengs, slot_ts, slot_lock, events, w == 0, self.rx_opts,
+                [self.rx_opts['cpu_affinity'][w % len(self.rx_opts['cpu_affinity'])]] if self.rx_opts['cpu_affinity'] != None else None,
+                logger.level, spead.logging.getLogger().level)) for w in range(n_ports)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        logger.info("Data reception on ports %i to %i in %i processes."%(data_port, data_port + n_ports - 1, n_ports))
+        logger.info("Sending Signal Display data to %s:%i."%(sd_ip,sd_port))
+        sd = SdStream(spead.Transmitter(spead.TransportUDPtx(sd_ip, sd_port)), chan_avg = sd_chan_avg, baselines = sd_baselines, max_rate = sd_max_rate, logger = logger)
+        if filename == None:
+            filename=str(int(time.time())) + ".synth.h5"
+        logger.info("Starting file %s."%(filename))
+        f = h5py.File(filename, mode="w")
+        datasets = H5Writer(f, time_chunk=h5_time_chunk, compression=h5_compression, compression_opts=h5_compression_opts, logger=logger)
+        meta_required = ['n_chans','bandwidth','n_bls','n_xengs','center_freq','bls_ordering']
+        meta = {}
+        descriptors = {}
+        parts = {}
+        started = {}
+        # a one-element list, so that flush can update it
+        last_timestamp = [-1]
+        self.mp_stats = {'frames': 0, 'incomplete': 0, 'late': 0, 'dropped': 0}
+        self.accounting = DumpAccounting(n_xengs, window = stats_window, logger = logger)
+        xeng_bytes = n_chans / n_xengs * n_bls * 2 * frames.dtype.itemsize
+        datasets.create('xeng_raw', frame_shape[1:], frames.dtype)
+        datasets.create('timestamp', [], np.dtype(np.uint64))
+        datasets.create('xeng_complete', [n_xengs], np.dtype(np.bool_))
+
+        def store(slot, timestamp, xengs):
+            """Accounts for a frame and writes it to the file, zeroing the channels of any X engine that didn't contribute. Returns the frame."""
+            frame = frames[slot]
+            end_time = None
+            if False not in [meta.has_key(n) for n in ['sync_time', 'scale_factor_timestamp', 'int_time']]:
+                end_time = meta['sync_time'] + (timestamp / float(meta['scale_factor_timestamp'])) + meta['int_time']
+            complete = self.accounting.dump(timestamp, [xeng_bytes if x in xengs else 0 for x in range(n_xengs)], [xeng_bytes] * n_xengs, end_time = end_time)
+            for x in range(n_xengs):
+                if not complete[x]:
+                    frame[x::n_xengs] = 0
+            datasets.append('xeng_raw', frame)
+            datasets.append('timestamp', timestamp)
+            datasets.append('xeng_complete', np.array(complete, dtype = np.bool_))
+            return frame
+
+        def flush(slot):
+            """Stores the incomplete frame in slot and frees it. Any slices for it that turn up later are counted as late."""
+            timestamp = slot_ts[slot]
+            xengs = parts.pop(slot)
+            started.pop(slot)
+            self.mp_stats['incomplete'] += 1
+            logger.warning("Frame for timestamp %i only had data from %i of %i X engines." % (timestamp, len(xengs), n_xengs))
+            store(slot, timestamp, xengs)
+            last_timestamp[0] = max(last_timestamp[0], timestamp)
+            _release_frame(slot_ts, slot_lock, slot, timestamp)
+
+        def oldest():
+            return sorted(parts.keys(), key = lambda s: slot_ts[s])
+
+        last_stats = time.time()
+        n_ended = 0
+        while n_ended < n_ports:
+            if time.time() - last_stats > stats_period:
+                logger.info("Frames: %i assembled, %i incomplete, %i late, %i dropped. %s" % (
+                    self.mp_stats['frames'], self.mp_stats['incomplete'], self.mp_stats['late'], self.mp_stats['dropped'], self.accounting.summary()))
+                last_stats = time.time()
+            timeout = frame_timeout
+            if timeout == None:
+                timeout = 1.5 * meta['int_time'] if meta.has_key('int_time') else 2.0
+            for slot in oldest():
+                if time.time() - started[slot] > timeout:
+                    logger.warning("Timed out waiting for the rest of the frame for timestamp %i." % slot_ts[slot])
+                    flush(slot)
+            try:
+                event = events.get(timeout = min(stats_period, timeout / 4.0))
+            except Queue.Empty:
+                continue
+            if event[0] == 'end':
+                n_ended += 1
+            elif event[0] == 'drop':
+                worker_n, xeng_id, timestamp = event[1:]
+                self.mp_stats['dropped'] += 1
+                logger.warning("No free frame for Xeng%i timestamp %i on worker %i. Dropped." % (xeng_id, timestamp, worker_n))
+                # every frame is taken, most likely by frames some X engine will never finish, so make room
+                waiting = oldest()
+                if (len(waiting) > 0) and (slot_ts[waiting[0]] < timestamp):
+                    flush(waiting[0])
+            elif event[0] == 'meta':
+                worker_n, name, id, description, value = event[1:]
+                meta[name] = value
+                descriptors[name] = (id, description)
+                if not datasets.has_key(name):
+                    datasets.create(name, np.shape(value), np.asarray(value).dtype)
+                datasets.append(name, value)
+                if (name in meta_required) and (False not in [meta.has_key(n) for n in meta_required]):
+                    logger.info("Got all required metadata. Frame shape is %s."%(str(frame_shape[1:])))
+                    sd.meta([(meta_item, descriptors[meta_item][0], descriptors[meta_item][1], meta[meta_item]) for meta_item in meta_required])
+            elif event[0] == 'part':
+                worker_n, slot, xeng_id, timestamp = event[1:]
+                if timestamp <= last_timestamp[0]:
+                    self.mp_stats['late'] += 1
+                    logger.warning("Xeng%i timestamp %i arrived after timestamp %i was stored. Ignoring..." % (xeng_id, timestamp, last_timestamp[0]))
+                    _release_frame(slot_ts, slot_lock, slot, timestamp)
+                    continue
+                if not parts.has_key(slot):
+                    parts[slot] = set()
+                    started[slot] = time.time()
+                parts[slot].add(xeng_id)
+                if len(parts[slot]) < n_xengs:
+                    continue
+                # any older frame still being assembled will never complete, so store what we have of it, oldest first
+                for old_slot in oldest():
+                    if slot_ts[old_slot] < timestamp:
+                        flush(old_slot)
+                frame = store(slot, timestamp, parts[slot])
+                if sd.due() and (False not in [meta.has_key(n) for n in ['sync_time', 'scale_factor_timestamp']]):
+                    sd_timestamp = meta['sync_time'] + (timestamp / float(meta['scale_factor_timestamp']))
+                    scale_factor=float(meta['n_accs'] if (meta.has_key('n_accs') and acc_scale) else 1)
+                    logger.info("Sending signal display frame with timestamp %i (%s). %s. @ %.4f" % (sd_timestamp, time.ctime(sd_timestamp), "Unscaled" if not acc_scale else "Scaled by %i" % (scale_factor), time.time()))
+                    sd.send(frame, sd_timestamp, scale_factor)
+                self.mp_stats['frames'] += 1
+                last_timestamp[0] = timestamp
+                parts.pop(slot)
+                started.pop(slot)
+                _release_frame(slot_ts, slot_lock, slot, timestamp)
+
+        for old_slot in oldest():
+            flush(old_slot)
+        logger.info("All workers got a SPEAD end-of-stream marker. Closing File. %s" % str(self.mp_stats))
+        logger.info(self.accounting.summary())
+        for worker in workers:
+            worker.join()
+        datasets.close()
+        logger.info("Files and sockets closed.")
@@ -8,11 +8,12 @@ Revs:
 """
 import time
 import logging
+import threading
 
 import numpy
 import construct
 
-from . import corr_nb, corr_wb
+from . import corr_nb, corr_wb, threaded
 
 def snapshots_arm(fpgas, dev_names, man_trig, man_valid, offset, circular_capture):
     if offset >=0:
@@ -22,7 +23,25 @@ def snapshots_arm(fpgas, dev_names, man_trig, man_valid, offset, circular_captur
         fpga.write_int(dev_names[fn]+'_ctrl', (0 + (man_trig<<1) + (man_valid<<2) + (circular_capture<<3)))
         fpga.write_int(dev_names[fn]+'_ctrl', (1 + (man_trig<<1) + (man_valid<<2) + (circular_capture<<3)))
 
-def snapshots_get(fpgas, dev_names, man_trig=False, man_valid=False, wait_period=-1, offset=-1, circular_capture=False, arm=True):
+_executor = None
+_executor_threads = 0
+_executor_lock = threading.Lock()
+
+def _snapshot_executor(num_fpgas):
+    """Returns the module's persistent FpgaExecutor, replacing it with a larger one if it has fewer than num_fpgas workers."""
+    global _executor, _executor_threads
+    _executor_lock.acquire()
+    try:
+        if _executor == None or _executor_threads < num_fpgas:
+            if _executor != None:
+                _executor.stop()
+            _executor = threaded.FpgaExecutor(num_fpgas)
+            _executor_threads = num_fpgas
+        return _executor
+    finally:
+        _executor_lock.release()
+
+def snapshots_get(fpgas, dev_names, man_trig=False, man_valid=False, wait_period=-1, offset=-1, circular_capture=False, arm=True, executor=None):
     """Fetches data from multiple snapshot devices. fpgas and dev_names are lists of katcp_wrapper.FpgaClient,and 'snapshot_device_name', respectively.
         This function triggers and retrieves data from the snap block devices. The actual captured length and starting offset is returned with the dictionary of data for each FPGA (useful if you've done a circular capture and can't calculate this yourself).\n
         \tdev_names: list of strings, names of the snap block corresponding to FPGA list. Can optionally be 1-D, in which case name is used for all FPGAs.\n
@@ -30,6 +49,7 @@ def snapshots_get(fpgas, dev_names, man_trig=False, man_valid=False, wait_period
         \toffset: integer, wait this number of valids before beginning capture. Set to negative if your hardware doesn't support offset triggering or to leave the register alone. Note that you should explicitly set this to zero to start directly after a trigger because by default (negative), it will remember the last-set offset value.\n
         \tcircular_capture: boolean, Enable the circular capture function.\n
         \twait_period: integer, wait this number of seconds between triggering and trying to read-back the data. Make it negative to wait forever.\n
+        \texecutor: threaded.FpgaExecutor used to read the boards in parallel, normally the correlator's executor. If None, a persistent one kept by this module is used.\n
         \tRETURNS: dictionary with keywords: \n
         \t\tlengths: list of integers matching number of valids captured off each fpga.\n
         \t\toffset: optional (depending on snap block version) list of number of valids elapsed since last trigger on each fpga.
@@ -40,36 +60,28 @@ def snapshots_get(fpgas, dev_names, man_trig=False, man_valid=False, wait_period
         dev_names=[dev_names for f in fpgas]
     if arm:
         snapshots_arm(fpgas=fpgas, dev_names=dev_names, man_trig=man_trig, man_valid=man_valid, offset=offset, circular_capture=circular_capture)
-    # wait
-    done=False
-    start_time=time.time()
-    while not done and ((time.time()-start_time)<wait_period or (wait_period < 0)):
-        addr      = [fpga.read_uint(dev_names[fn]+'_status') for fn,fpga in enumerate(fpgas)]
-        done_list = [not bool(i & 0x80000000) for i in addr]
-        if (done_list == [True for i in fpgas]): done=True
-
-    bram_dmp=dict()
-    bram_dmp['data']=[]
-    bram_dmp['lengths']=[i&0x7fffffff for i in addr]
-    bram_dmp['offsets']=[0 for fn in fpgas]
-    for fn,fpga in enumerate(fpgas):
-        now_status=bool(fpga.read_uint(dev_names[fn]+'_status')&0x80000000)
-        now_addr=fpga.read_uint(dev_names[fn]+'_status')&0x7fffffff
-        if (bram_dmp['lengths'][fn] != now_addr) or (bram_dmp['lengths'][fn]==0) or (now_status==True):
+    # wait for each board and read its bram as soon as it has finished capturing
+    def collect(fpga, fn, dev_name):
+        addr = fpga.snapshot_wait(dev_name, wait_period=wait_period)
+        length = addr & 0x7fffffff
+        now_status = bool(fpga.read_uint(dev_name+'_status')&0x80000000)
+        now_addr = fpga.read_uint(dev_name+'_status')&0x7fffffff
+        if (length != now_addr) or (length==0) or (now_status==True):
             #if address is still changing, then the snap block didn't finish capturing. we return empty.
-            raise RuntimeError("A snap block logic error occurred on capture #%i. It reported capture complete but the address is either still changing, or it returned 0 bytes captured after the allotted %2.2f seconds. Addr at stop time: %i. Now: Still running :%s, addr: %i."%(fn,wait_period,bram_dmp['lengths'][fn],{True:'yes',False:'no'}[now_status],now_addr))
-            bram_dmp['lengths'][fn]=0
-            bram_dmp['offsets'][fn]=0
-
+            raise RuntimeError("A snap block logic error occurred on capture #%i. It reported capture complete but the address is either still changing, or it returned 0 bytes captured after the allotted %2.2f seconds. Addr at stop time: %i. Now: Still running :%s, addr: %i."%(fn,wait_period,length,{True:'yes',False:'no'}[now_status],now_addr))
         if circular_capture:
-            bram_dmp['offsets'][fn]=fpga.read_uint(dev_names[fn]+'_tr_en_cnt') - bram_dmp['lengths'][fn]
+            capture_offset = fpga.read_uint(dev_name+'_tr_en_cnt') - length
         else:
-            bram_dmp['offsets'][fn]=0
+            capture_offset = 0
+        return length, capture_offset, fpga.read(dev_name+'_bram',length)
+    if executor == None:
+        executor = _snapshot_executor(len(fpgas))
+    results = executor.starmap(fpgas, collect, [(fn, dev_names[fn]) for fn in range(len(fpgas))])
 
-        if bram_dmp['lengths'][fn] == 0:
-            bram_dmp['data'].append([])
-        else:
-            bram_dmp['data'].append(fpga.read(dev_names[fn]+'_bram',bram_dmp['lengths'][fn]))
+    bram_dmp=dict()
+    bram_dmp['lengths']=[r[0] for r in results]
+    bram_dmp['offsets']=[r[1] for r in results]
+    bram_dmp['data']=[r[2] for r in results]
 
     bram_dmp['offsets']=numpy.add(bram_dmp['offsets'],offset)
 
@@ -79,23 +91,162 @@ def snapshots_get(fpgas, dev_names, man_trig=False, man_valid=False, wait_period
 
     return bram_dmp
 
-#def unpack_snapshot(data, bitmap, word_width=32):
-#    """Unpacks data from a snap block. data is the raw binary (string). bitmap is a dictionary of form {yourvariablename: (bitfield_length,bitfield_start_pos,dtype)}. dtype should be a numpy type (eg numpy.int8, numpy.int16, numpy.uint32 etc). Bitfields with length of 1 are automatically unpacked as binary values (True/False). Word width should reflect your snap hardware block's databus width."""
-#    if word_width==8:
-#        req_dtype=numpy.uint8
-#    elif word_width==16:
-#        req_dtype=numpy.uint16
-#    elif word_width==32:
-#        req_dtype=numpy.uint32
-#    elif word_width==64:
-#        req_dtype=numpy.uint64
-#    elif word_width==128:
-#        req_dtype=numpy.uint128
-#
-#    unpacked_data = numpy.fromstring(data,dtype=numpy.int8)
-#    for key,value in bitmap.iteritems():
-#   INCOMPLETE. use construct instead.
+_bitstruct_cache = {}
+
+def _bitfield_width(subcon):
+    """Returns the width in bits of one field of a BitStruct."""
+    inner = subcon
+    while inner != None:
+        length = getattr(inner, 'length', None)
+        if isinstance(length, (int, long)):
+            return length
+        inner = getattr(inner, 'subcon', None)
+    return subcon.sizeof()
+
+def compile_bitstruct(bitstruct):
+    """Compiles a snap block BitStruct (as defined in corr_wb and corr_nb) into a list of bit positions for unpack_snapshot.
+    Returns (word_bits, fields) where fields is a list of (name, shift, width) tuples, shift being the position of the field's lsb in the word. Padding is left out."""
+    if _bitstruct_cache.has_key(id(bitstruct)):
+        return _bitstruct_cache[id(bitstruct)]
+    struct = bitstruct
+    while not hasattr(struct, 'subcons'):
+        struct = struct.subcon
+    layout = [(getattr(sc, 'name', None), _bitfield_width(sc)) for sc in struct.subcons]
+    word_bits = sum([width for name, width in layout])
+    if word_bits % 8 != 0:
+        raise RuntimeError('BitStruct is %i bits wide, which is not a whole number of bytes.' % word_bits)
+    fields = []
+    msb_offset = 0
+    for name, width in layout:
+        if name != None:
+            if width > 64:
+                raise RuntimeError('Field %s is %i bits wide. Only fields up to 64 bits can be unpacked.' % (name, width))
+            fields.append((name, word_bits - msb_offset - width, width))
+        msb_offset += width
+    _bitstruct_cache[id(bitstruct)] = (word_bits, fields)
+    return word_bits, fields
+
+def unpack_snapshot(data, bitstruct):
+    """Unpacks raw snap block data (a binary string) laid out as described by a BitStruct, using numpy rather than construct.
+    Returns a dictionary of numpy arrays, one per named field, with one entry per captured word. Single-bit fields are boolean, all others uint64. Any partial word at the end of the data is ignored."""
+    word_bits, fields = compile_bitstruct(bitstruct)
+    word_bytes = word_bits / 8
+    raw = numpy.fromstring(data, dtype = numpy.uint8)
+    n_words = len(raw) / word_bytes
+    raw = raw[0:n_words * word_bytes].reshape(n_words, word_bytes)
+    # pad each word on the left to a whole number of 64-bit columns
+    col_bytes = ((word_bytes + 7) / 8) * 8
+    if col_bytes != word_bytes:
+        padded = numpy.zeros((n_words, col_bytes), dtype = numpy.uint8)
+        padded[:, col_bytes - word_bytes:] = raw
+        raw = padded
+    cols = numpy.ascontiguousarray(raw).view('>u8').astype(numpy.uint64)
+    n_cols = col_bytes / 8
+    rv = {}
+    for name, shift, width in fields:
+        col = n_cols - 1 - (shift / 64)
+        bit = shift % 64
+        val = cols[:, col] >> numpy.uint64(bit)
+        if bit + width > 64:
+            val = val | (cols[:, col - 1] << numpy.uint64(64 - bit))
+        if width < 64:
+            val = val & numpy.uint64((1 << width) - 1)
+        rv[name] = (val != 0) if width == 1 else val
+    return rv
+
+def unpack_fixed(data, n_bits = 4, bin_pt = 3, signed = True):
+    """Unpacks a string (or numpy uint8 array) of packed fixed-point values, most significant first, into a numpy float array.
+    n_bits may be 1, 2 or 4 (several values per byte), or 8, 16 or 32 (big-endian)."""
+    raw = numpy.fromstring(data, dtype = numpy.uint8) if isinstance(data, str) else numpy.asarray(data, dtype = numpy.uint8)
+    if n_bits in [1, 2, 4]:
+        shifts = numpy.arange(8 - n_bits, -1, -n_bits, dtype = numpy.uint8)
+        vals = ((raw[:, numpy.newaxis] >> shifts) & ((1 << n_bits) - 1)).flatten().astype(numpy.int64)
+    elif n_bits in [8, 16, 32]:
+        word_bytes = n_bits / 8
+        raw = raw[0:(len(raw) / word_bytes) * word_bytes]
+        vals = numpy.ascontiguousarray(raw).view('>u%i' % word_bytes).astype(numpy.int64)
+    else:
+        raise RuntimeError('Cannot unpack %i-bit values.' % n_bits)
+    if signed:
+        return corr_nb.bin2fp_array(vals, n_bits, bin_pt)
+    return vals / float(2**bin_pt)
+
+def unpack_fixed_complex(data, n_bits = 4, bin_pt = 3, signed = True):
+    """As unpack_fixed, but for interleaved real and imaginary parts. Returns a numpy complex array."""
+    vals = unpack_fixed(data, n_bits, bin_pt, signed)
+    return vals[0::2] + (1j * vals[1::2])
+
+def snap_word_bytes(data, word_bytes = 16, start = 0, stop = None):
+    """Returns bytes start to stop of every word_bytes-byte word in a snapshot, as a 2D numpy uint8 array with one row per word. Useful for picking the valid bytes out of the padded 128-bit debug snap blocks."""
+    raw = numpy.fromstring(data, dtype = numpy.uint8)
+    n_words = len(raw) / word_bytes
+    return raw[0:n_words * word_bytes].reshape(n_words, word_bytes)[:, start:stop]
+
+class SnapshotRow(object):
+    """One word of a SnapshotRows sequence. Fields are read as attributes or items, as on the construct Container that construct.GreedyRepeater would return."""
+    __slots__ = ['_rows', '_index']
+    def __init__(self, rows, index):
+        self._rows = rows
+        self._index = index
+
+    def __getattr__(self, name):
+        try:
+            return self._rows.column(name)[self._index]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __getitem__(self, name):
+        return self._rows.column(name)[self._index]
+
+    def keys(self):
+        return self._rows.columns.keys()
+
+    def __repr__(self):
+        return 'SnapshotRow(%s)' % ', '.join(['%s = %s' % (name, self[name]) for name in self.keys()])
+
+class SnapshotRows(object):
+    """A read-only sequence view of the columns returned by unpack_snapshot, with one SnapshotRow per captured word.
+    Nothing is built up front: a column is converted to Python values the first time one of its fields is read, and a row object only exists while it is being used. The numpy arrays are still available as the columns attribute."""
+    def __init__(self, columns):
+        self.columns = columns
+        self._lists = {}
+        self._len = len(columns.values()[0]) if len(columns) > 0 else 0
+
+    def column(self, name):
+        """Returns a field's values as a list of Python ints and bools."""
+        if not self._lists.has_key(name):
+            self._lists[name] = self.columns[name].tolist()
+        return self._lists[name]
+
+    def __len__(self):
+        return self._len
 
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [SnapshotRow(self, i) for i in range(*index.indices(self._len))]
+        if index < 0:
+            index += self._len
+        if index < 0 or index >= self._len:
+            raise IndexError('Snapshot word %i out of range.' % index)
+        return SnapshotRow(self, index)
+
+    def __iter__(self):
+        for index in xrange(self._len):
+            yield SnapshotRow(self, index)
+
+def snapshot_rows(columns):
+    """Wraps the columns returned by unpack_snapshot in a SnapshotRows sequence, for callers that index the data word by word."""
+    return SnapshotRows(columns)
+
+def _unpack_snapshots(raw, bitstruct, columnar):
+    rv = []
+    for index, d in enumerate(raw['data']):
+        v = {}
+        v['fpga_index'] = index
+        columns = unpack_snapshot(d, bitstruct)
+        v['data'] = columns if columnar else snapshot_rows(columns)
+        rv.append(v)
+    return rv
 
 def get_adc_snapshots(correlator, ant_strs = [], trig_level = -1, sync_to_pps = True):
     """Fetches multiple ADC snapshots from hardware. Set trig_level to negative value to disable triggered captures. Timestamps only valid if system is correctly sync'd!"""
@@ -117,13 +268,13 @@ def get_adc_snapshots(correlator, ant_strs = [], trig_level = -1, sync_to_pps =
 
     if trig_level >= 0:
         [fpga.write_int('trig_level', trig_level) for fpga in fpgas]
-        raw = snapshots_get(fpgas, dev_names, wait_period = -1, circular_capture = True, man_trig = (not sync_to_pps))
+        raw = snapshots_get(fpgas, dev_names, wait_period = -1, circular_capture = True, man_trig = (not sync_to_pps), executor = correlator.executor)
         ready = ((int(time.time() * 10) % 10) == 5)
         while not ready:
             time.sleep(0.05)
             ready = ((int(time.time() * 10) % 10) == 5)
     else:
-        raw = snapshots_get(fpgas, dev_names, wait_period = 2, circular_capture = False, man_trig = (not sync_to_pps))
+        raw = snapshots_get(fpgas, dev_names, wait_period = 2, circular_capture = False, man_trig = (not sync_to_pps), executor = correlator.executor)
 
     rv = {}
     for ant_n, ant_str in enumerate(ant_strs):
@@ -151,13 +302,8 @@ def get_quant_snapshot(correlator, ant_str, n_spectra = 1, man_trig = False, man
     while ns < n_spectra:
         if correlator.is_wideband():
             bram_dmp = fpga.snapshot_get('quant_snap%i' % feng_input, man_trig = man_trig, man_valid = man_valid, wait_period = wait_period)
-            pckd_8bit = numpy.fromstring(bram_dmp['data'], dtype = numpy.uint8)
-            for val in pckd_8bit:
-                # get the right 4 bit values:
-                r_bits = (val & ((2**8) - (2**4))) >> 4
-                i_bits = (val & ((2**4) - (2**0)))
-                # cast up to signed numbers:
-                unpacked_vals.append(float(((numpy.int8(r_bits << 4) >> 4))) + (1j * float(((numpy.int8(i_bits << 4) >> 4)))))
+            # each byte is a signed 4 bit real value followed by a signed 4 bit imaginary value
+            unpacked_vals.extend(unpack_fixed_complex(bram_dmp['data'], n_bits = 4, bin_pt = 0))
         elif correlator.is_narrowband():
             # the narrowband snap block may be shorter than one spectrum, so make sure we get enough data
             tempdata = []
@@ -194,87 +340,65 @@ def Swapped(subcon):
         resizer = lambda length: length
     )
 
-def get_rx_snapshot(correlator, xfpgas = [], snapname = 'snap_rx0'):
-    "Grabs a snapshot of the decoded incomming packet stream. xeng_ids is a list of integers (xeng core numbers)."
+def get_rx_snapshot(correlator, xfpgas = [], snapname = 'snap_rx0', columnar = False):
+    "Grabs a snapshot of the decoded incomming packet stream. xeng_ids is a list of integers (xeng core numbers). If columnar is True, each board's data is a dictionary of numpy arrays, one per field, rather than a sequence of words (see SnapshotRows)."
     if xfpgas == []:
        xfpgas = correlator.xfpgas
-    raw = snapshots_get(xfpgas, snapname, wait_period = 3, circular_capture = False, man_trig = False)
+    raw = snapshots_get(xfpgas, snapname, wait_period = 3, circular_capture = False, man_trig = False, executor = correlator.executor)
     if correlator.is_wideband():
         rx_bf = corr_wb.snap_xengine_rx
     elif correlator.is_narrowband():
         rx_bf = corr_nb.snap_xengine_rx
     else: raise RuntimeError('Unknown mode. Cannot get rx snapshot.')
-    unp_rpt = construct.GreedyRepeater(rx_bf)
-    rv = []
-    for index, d in enumerate(raw['data']):
-        v= {}
-        v['fpga_index'] = index
-        v['data'] = unp_rpt.parse(d)
-        rv.append(v)
-    return rv
+    return _unpack_snapshots(raw, rx_bf, columnar)
 
-def get_gbe_rx_snapshot(correlator, xfpgas = [], snapname = 'snap_gbe_rx0'):
+def get_gbe_rx_snapshot(correlator, xfpgas = [], snapname = 'snap_gbe_rx0', columnar = False):
     """
     Takes a list of X-ENGINE fpgas and returns the contents of the snap_gbe_rx0 block for each of them in a list.
-    The list contents is a dictionary of the decoded data.
+    The list contents is a dictionary of the decoded data. If columnar is True, the data is a dictionary of numpy arrays, one per field.
     """
     if xfpgas == []:
        xfpgas = correlator.xfpgas
-    raw = snapshots_get(xfpgas, snapname, wait_period = 3, circular_capture = False, man_trig = False)
+    raw = snapshots_get(xfpgas, snapname, wait_period = 3, circular_capture = False, man_trig = False, executor = correlator.executor)
     if correlator.is_wideband():
         rx_bf = corr_wb.snap_xengine_gbe_rx
     elif correlator.is_narrowband():
         rx_bf = corr_nb.snap_xengine_gbe_rx
     else:
         raise RuntimeError('Unknown mode. Cannot get gbe rx snapshot.')
-    unp_rpt = construct.GreedyRepeater(rx_bf)
-    rv = []
-    for index, d in enumerate(raw['data']):
-        v = {}
-        v['fpga_index'] = index
-        v['data'] = unp_rpt.parse(d)
-        rv.append(v)
-    return rv
+    return _unpack_snapshots(raw, rx_bf, columnar)
 
 
-def get_gbe_tx_snapshot_xeng(correlator, snapnames = 'snap_gbe_tx0', offset = -1, man_trigger = False, man_valid = False):
-    raw = snapshots_get(correlator.xfpgas, dev_names = snapnames, wait_period = 3, circular_capture = False, man_trig = man_trigger, offset = offset, man_valid = man_valid)
-    unp_rpt = construct.GreedyRepeater(corr_wb.snap_xengine_gbe_tx)
-    rv = []
-    for index, d in enumerate(raw['data']):
-        v = {}
-        v['fpga_index'] = index
-        v['data'] = unp_rpt.parse(d)
-        rv.append(v)
-    return rv
+def get_gbe_tx_snapshot_xeng(correlator, snapnames = 'snap_gbe_tx0', offset = -1, man_trigger = False, man_valid = False, columnar = False):
+    raw = snapshots_get(correlator.xfpgas, dev_names = snapnames, wait_period = 3, circular_capture = False, man_trig = man_trigger, offset = offset, man_valid = man_valid, executor = correlator.executor)
+    return _unpack_snapshots(raw, corr_wb.snap_xengine_gbe_tx, columnar)
 
-def get_gbe_tx_snapshot_feng(correlator, snap_name = 'snap_gbe_tx0', offset = -1, man_trigger = False, man_valid = False):
-    raw = snapshots_get(correlator.ffpgas, dev_names = snap_name, wait_period = 3, circular_capture = False, man_trig = man_trigger, offset = offset)
-    unp_rpt = construct.GreedyRepeater(corr_wb.snap_fengine_gbe_tx)
+def get_gbe_tx_snapshot_feng(correlator, snap_name = 'snap_gbe_tx0', offset = -1, man_trigger = False, man_valid = False, columnar = False):
+    raw = snapshots_get(correlator.ffpgas, dev_names = snap_name, wait_period = 3, circular_capture = False, man_trig = man_trigger, offset = offset, executor = correlator.executor)
     rv = []
     #step though each FPGA for which we got snap data:
     for index, d in enumerate(raw['data']):
         v = {}
         v['fpga_index'] = index
-        v['data'] = unp_rpt.parse(d)
+        columns = unpack_snapshot(d, corr_wb.snap_fengine_gbe_tx)
         #add some fake values to make it look like a XAUI snap block so we can use the same functions on this data interchangeably:
-        for dp in v['data']:
-            dp['link_down'] = not dp['link_up']
-            dp['hdr_valid'] = False
-            dp['mrst'] = False
-            dp['sync'] = False
+        columns['link_down'] = numpy.logical_not(columns['link_up'])
+        columns['hdr_valid'] = numpy.zeros(len(columns['link_up']), dtype = bool)
+        columns['mrst'] = numpy.zeros(len(columns['link_up']), dtype = bool)
+        columns['sync'] = numpy.zeros(len(columns['link_up']), dtype = bool)
+        v['data'] = columns if columnar else snapshot_rows(columns)
         rv.append(v)
     return rv
 
-def get_xaui_snapshot(correlator, snap_name = None, offset = -1, man_trigger = False, man_valid = False, wait_period = 3):
-    """Grabs data from fengines' TX xaui blocks"""
+def get_xaui_snapshot(correlator, snap_name = None, offset = -1, man_trigger = False, man_valid = False, wait_period = 3, columnar = False):
+    """Grabs data from fengines' TX xaui blocks. If columnar is True, each board's data is a dictionary of numpy arrays, one per field."""
     if correlator.is_wideband():
         snap_bitfield = corr_wb.snap_fengine_xaui
         if snap_name == None:
             dev_name = 'snap_xaui0'
         else:
             dev_name = snap_name
-        raw = snapshots_get(correlator.ffpgas, dev_names = dev_name, wait_period = wait_period, circular_capture = False, man_trig = man_trigger, offset = offset, man_valid = man_valid)
+        raw = snapshots_get(correlator.ffpgas, dev_names = dev_name, wait_period = wait_period, circular_capture = False, man_trig = man_trigger, offset = offset, man_valid = man_valid, executor = correlator.executor)
     elif correlator.is_narrowband():
         snap_bitfield = corr_nb.snap_fengine_xaui
         if snap_name == None:
@@ -284,18 +408,17 @@ def get_xaui_snapshot(correlator, snap_name = None, offset = -1, man_trigger = F
         raw = corr_nb.get_snap_xaui(correlator, correlator.ffpgas, offset = offset, man_trigger = man_trigger, man_valid = man_valid, wait_period = wait_period)
     else:
         raise RuntimeError('Unsupported correlator type.')
-    unpack_repeater = construct.GreedyRepeater(snap_bitfield)
     rv = []
     for index, d in enumerate(raw['data']):
         v = {}
         v['fpga_index'] = index
-        v['data'] = unpack_repeater.parse(d)
-        for dp in v['data']:
-            dp['ip_addr'] = 0
-            dp['link_up'] = not dp['link_down']
-            dp['tx_over'] = False
-            dp['tx_full'] = False
-            dp['led_tx'] = False
-            dp['link_up'] = False
+        columns = unpack_snapshot(d, snap_bitfield)
+        n_words = len(columns['link_down'])
+        columns['ip_addr'] = numpy.zeros(n_words, dtype = numpy.uint64)
+        columns['tx_over'] = numpy.zeros(n_words, dtype = bool)
+        columns['tx_full'] = numpy.zeros(n_words, dtype = bool)
+        columns['led_tx'] = numpy.zeros(n_words, dtype = bool)
+        columns['link_up'] = numpy.zeros(n_words, dtype = bool)
+        v['data'] = columns if columnar else snapshot_rows(columns)
         rv.append(v)
     return rv
@@ -1,3 +1,5 @@
+import time
+import sys
 from . import katcp_wrapper
 
 def fpga_operation(fpga_list, num_threads = -1, job_function = None, *job_args):
@@ -45,8 +47,8 @@ def fpga_operation(fpga_list, num_threads = -1, job_function = None, *job_args):
                     try:
                         result = self.job(request_host, *self.job_args)
                     except Exception as exc:
-                        errstr = "Job %s internal error: %s, %s" % (self.job.func_name, type(exc), exc)
-                        result = RuntimeError(errstr)
+                        # return the original exception, so the caller can still tell what went wrong
+                        result = _add_host(exc, request_host.host)
                     # put the result on the result queue
                     self.result_queue.put((request_host.host, result))
                     # and notify done
@@ -78,3 +80,298 @@ def fpga_operation(fpga_list, num_threads = -1, job_function = None, *job_args):
         res = result_queue.get()
         rv[res[0]] = res[1]
     return rv
+
+def fpga_starmap(fpga_list, job_function, job_args_list):
+    """Run job_function once per entry of fpga_list, each in its own thread, with the matching argument tuple from job_args_list.
+    Unlike fpga_operation, the same FpgaClient may appear more than once in fpga_list.
+
+    @return a list of results in the same order as fpga_list. If the job failed on any FPGA, its exception is re-raised as by FpgaExecutor.starmap.
+    """
+    executor = FpgaExecutor(len(fpga_list))
+    try:
+        return executor.starmap(fpga_list, job_function, job_args_list)
+    finally:
+        executor.stop()
+
+def run_stage_graph(stages, logger = None):
+    """Run a set of stages, each as soon as all the stages it depends on have finished. Stages that don't depend on each other run at the same time, each in its own thread.
+
+    @param stages: list of (name, dependencies, function) tuples. dependencies is a list of stage names and function takes no arguments.
+    @param logger: if given, the start and end of each stage is logged to it
+
+    @return a dictionary of how long each stage took, in seconds. If a stage raises an exception, no more stages are started and the exception is re-raised once the running stages have finished.
+    """
+    import threading, sys
+    names = [name for name, deps, function in stages]
+    deps = dict([(name, set(stage_deps)) for name, stage_deps, function in stages])
+    functions = dict([(name, function) for name, stage_deps, function in stages])
+    for name in names:
+        for dep in deps[name]:
+            if dep not in deps:
+                raise RuntimeError("Stage %s depends on unknown stage %s." % (name, dep))
+    done = set()
+    running = set()
+    timings = {}
+    errors = []
+    cond = threading.Condition()
+    def run(name):
+        start = time.time()
+        if logger != None:
+            logger.debug("Stage %s started." % name)
+        exc_info = None
+        try:
+            functions[name]()
+        except:
+            exc_info = sys.exc_info()
+        cond.acquire()
+        timings[name] = time.time() - start
+        running.discard(name)
+        done.add(name)
+        if exc_info != None:
+            errors.append((name, exc_info))
+        cond.notifyAll()
+        cond.release()
+        if logger != None:
+            logger.debug("Stage %s %s after %.2fs." % (name, 'failed' if exc_info != None else 'finished', timings[name]))
+    cond.acquire()
+    try:
+        while True:
+            if len(errors) == 0:
+                for name in names:
+                    if (name not in done) and (name not in running) and deps[name].issubset(done):
+                        running.add(name)
+                        thread = threading.Thread(target = run, args = (name,), name = 'stage-%s' % name)
+                        thread.daemon = True
+                        thread.start()
+            if len(running) == 0:
+                break
+            cond.wait()
+    finally:
+        cond.release()
+    if len(errors) > 0:
+        name, (exc_type, exc_value, exc_tb) = errors[0]
+        if logger != None:
+            logger.error("Stage %s failed: %s" % (name, exc_value))
+        raise exc_type, exc_value, exc_tb
+    if len(done) != len(names):
+        raise RuntimeError("Stages %s could not be run, their dependencies are circular." % ', '.join([name for name in names if name not in done]))
+    return timings
+
+def _add_host(exc, host):
+    """Adds the FPGA's hostname to an exception's message, leaving its type alone. Also sets exc.host."""
+    exc.host = host
+    if len(exc.args) == 1 and isinstance(exc.args[0], basestring):
+        exc.args = ('%s: %s' % (host, exc.args[0]),)
+    elif len(exc.args) == 0:
+        exc.args = (host,)
+    return exc
+
+class FpgaExecutor(object):
+    """A persistent pool of worker threads used to fan the same operation out to a list of FpgaClient objects.
+
+    Unlike fpga_operation, the workers are started once and reused, so repeated calls do not pay the thread start-up cost.
+    """
+    def __init__(self, num_threads):
+        """
+        @param num_threads: how many worker threads to start. One per FPGA gives a single round-trip per call.
+        """
+        import threading, Queue
+        self._request_queue = Queue.Queue()
+        self._workers = []
+        self._running = True
+        for i in range(0, max(num_threads, 1)):
+            w = threading.Thread(target = self._work, name = 'FpgaExecutor-%i' % i)
+            w.daemon = True
+            w.start()
+            self._workers.append(w)
+
+    def _work(self):
+        while True:
+            job = self._request_queue.get()
+            if job == None:
+                self._request_queue.task_done()
+                return
+            index, fpga, job_function, job_args, result_queue = job
+            try:
+                result = (True, job_function(fpga, *job_args))
+            except Exception:
+                result = (False, (fpga.host, sys.exc_info()))
+            result_queue.put((index, result))
+            self._request_queue.task_done()
+
+    def map(self, fpga_list, job_function, *job_args):
+        """Run job_function on every FpgaClient in fpga_list concurrently.
+
+        @param fpga_list: list of FpgaClient objects
+        @param job_function: the function to be run - MUST take the FpgaClient object as its first argument
+        @param *job_args: further arguments for the job_function
+
+        @return a list of results in the same order as fpga_list. If the job failed on any FPGA, its exception is re-raised as by starmap.
+        """
+        return self.starmap(fpga_list, job_function, [job_args] * len(fpga_list))
+
+    def starmap(self, fpga_list, job_function, job_args_list):
+        """As map, but with different arguments for each FpgaClient.
+
+        @param fpga_list: list of FpgaClient objects
+        @param job_function: the function to be run - MUST take the FpgaClient object as its first argument
+        @param job_args_list: list of argument tuples for the job_function, one per FpgaClient
+
+        @return a list of results in the same order as fpga_list. If the job failed on any FPGA, the exception from the first of those FPGAs in the list is re-raised with its original type and traceback, and the FPGA's hostname added to its message.
+        """
+        import Queue
+        if not self._running:
+            raise RuntimeError("FpgaExecutor has been stopped.")
+        if len(job_args_list) != len(fpga_list):
+            raise RuntimeError("Got %i argument tuples for %i FPGAs." % (len(job_args_list), len(fpga_list)))
+        result_queue = Queue.Queue()
+        for n, fpga in enumerate(fpga_list):
+            self._request_queue.put((n, fpga, job_function, tuple(job_args_list[n]), result_queue))
+        rv = [None] * len(fpga_list)
+        errors = {}
+        for i in range(len(fpga_list)):
+            n, (ok, res) = result_queue.get()
+            if ok:
+                rv[n] = res
+            else:
+                errors[n] = res
+        if len(errors) > 0:
+            host, (exc_type, exc_value, exc_tb) = errors[min(errors.keys())]
+            others = [errors[n][0] for n in sorted(errors.keys())[1:]]
+            _add_host(exc_value, host)
+            if len(others) > 0 and len(exc_value.args) == 1 and isinstance(exc_value.args[0], basestring):
+                exc_value.args = ('%s (also failed on %s)' % (exc_value.args[0], ', '.join(others)),)
+            raise exc_type, exc_value, exc_tb
+        return rv
+
+    def stop(self):
+        """Stop the worker threads once any queued jobs have completed."""
+        if not self._running:
+            return
+        self._running = False
+        for w in self._workers:
+            self._request_queue.put(None)
+
+class FpgaPool(object):
+    """Owns the FpgaClient connections to a list of boards.
+
+    All boards are connected at once and the pool waits on each client's connected event rather than a fixed delay.
+    A monitor thread reconnects clients whose connection has dropped, backing off exponentially between attempts, and keeps per-board liveness.
+    Clients are reconnected in place, so self.fpgas always holds the same objects and their verify mode, deferred writes and outstanding requests survive.
+    """
+    def __init__(self, hosts, port = 7147, timeout = 10, loggers = None, monitor_period = 1.0, min_backoff = 1.0, max_backoff = 60.0, connect_timeout = 10.0):
+        """
+        @param hosts: list of hostnames to connect to
+        @param port: the KATCP port on every host
+        @param timeout: request timeout for each FpgaClient
+        @param loggers: list of loggers, one per host
+        @param monitor_period: seconds between liveness checks
+        @param min_backoff: seconds to wait before the first reconnection attempt
+        @param max_backoff: the longest wait between reconnection attempts
+        @param connect_timeout: seconds to leave the initial connections alone before reconnecting any
+        """
+        import threading
+        self.hosts = list(hosts)
+        self.port = port
+        self.timeout = timeout
+        self.loggers = loggers if loggers != None else [katcp_wrapper.log for h in self.hosts]
+        self.monitor_period = monitor_period
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self.fpgas = [self._new_client(n) for n in range(len(self.hosts))]
+        now = time.time()
+        self._status = [{'connected': False, 'last_connected': -1, 'failures': 0, 'next_attempt': now + max(connect_timeout, min_backoff)} for h in self.hosts]
+        self._stop = threading.Event()
+        self._monitor = threading.Thread(target = self._run_monitor, name = 'FpgaPool-monitor')
+        self._monitor.daemon = True
+        self._monitor.start()
+
+    def _new_client(self, n):
+        return katcp_wrapper.FpgaClient(self.hosts[n], self.port, timeout = self.timeout, logger = self.loggers[n])
+
+    def wait_connected(self, timeout = 10.0):
+        """Wait until every board is connected or the timeout expires, whichever comes first.
+
+        @return True if all boards connected in time.
+        """
+        deadline = time.time() + timeout
+        # don't let the monitor reconnect a client we're still waiting on
+        self._lock.acquire()
+        for status in self._status:
+            status['next_attempt'] = max(status['next_attempt'], deadline)
+        self._lock.release()
+        rv = True
+        for n, fpga in enumerate(self.fpgas):
+            if not fpga.wait_connected(max(deadline - time.time(), 0)):
+                self.loggers[n].error('KATCP connection to %s:%i not established after %.1fs.' % (self.hosts[n], self.port, timeout))
+                rv = False
+        self._update_status()
+        return rv
+
+    def _update_status(self):
+        now = time.time()
+        self._lock.acquire()
+        for n, fpga in enumerate(self.fpgas):
+            if fpga.is_connected():
+                if not self._status[n]['connected'] and self._status[n]['failures'] > 0:
+                    self.loggers[n].info('KATCP connection restored after %i attempts.' % self._status[n]['failures'])
+                self._status[n].update({'connected': True, 'last_connected': now, 'failures': 0})
+            else:
+                if self._status[n]['connected']:
+                    self.loggers[n].error('KATCP connection lost.')
+                    self._status[n]['next_attempt'] = now + self.min_backoff
+                self._status[n]['connected'] = False
+        self._lock.release()
+
+    def _run_monitor(self):
+        while not self._stop.wait(self.monitor_period):
+            self._update_status()
+            now = time.time()
+            for n in range(len(self.hosts)):
+                if self._status[n]['connected'] or (now < self._status[n]['next_attempt']):
+                    continue
+                self._lock.acquire()
+                self._status[n]['failures'] += 1
+                backoff = min(self.min_backoff * (2 ** self._status[n]['failures']), self.max_backoff)
+                self._status[n]['next_attempt'] = now + backoff
+                self._lock.release()
+                self.loggers[n].warn('Reconnecting to %s:%i, attempt %i. Next attempt in %.1fs.' % (self.hosts[n], self.port, self._status[n]['failures'], backoff))
+                try:
+                    self._reconnect(n)
+                except Exception as exc:
+                    self.loggers[n].error('Could not reconnect KATCP client: %s' % exc)
+
+    def _reconnect(self, n):
+        """Reconnects board n's existing client.
+        The KATCP client thread reconnects by itself once its socket is closed, so drop the socket, or restart the thread if it has stopped."""
+        fpga = self.fpgas[n]
+        if fpga.running():
+            fpga._disconnect()
+        else:
+            fpga.start(daemon = True)
+
+    def is_alive(self, n):
+        """Returns True if board number n is currently connected."""
+        return self._status[n]['connected']
+
+    def liveness(self):
+        """Returns a dictionary, keyed on host, of each board's connection state, the time it was last seen connected and the number of failed reconnection attempts."""
+        self._update_status()
+        self._lock.acquire()
+        rv = {}
+        for n, host in enumerate(self.hosts):
+            rv[host] = {'connected': self._status[n]['connected'],
+                        'last_connected': self._status[n]['last_connected'],
+                        'failures': self._status[n]['failures']}
+        self._lock.release()
+        return rv
+
+    def stop(self):
+        """Stop the monitor thread and all the KATCP clients."""
+        self._stop.set()
+        for fpga in self.fpgas:
+            try:
+                fpga.stop()
+            except:
+                pass